@@ -0,0 +1,106 @@
+"""
+Decode Microbenchmark - Per-request image allocation before and after Frame
+
+Compares the old /process_data decode path (base64 -> imdecode -> PIL, then
+np.array(image) in every branch and an extra cvtColor in find_object) with
+the shared Frame pipeline, for base64 JSON and raw binary uploads.
+
+Run from the repository root:
+    python -m benchmarks.bench_decode [--width 1920 --height 1080 --repeat 20]
+
+Allocations are measured with tracemalloc, which sees NumPy/OpenCV arrays
+but not Pillow's internal image buffers.
+"""
+import argparse
+import base64
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from PIL import Image
+
+from modules.frame import Frame
+
+def make_jpeg(width: int, height: int, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    # Smooth noise compresses like a real photo rather than pure noise
+    small = rng.integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return encoded.tobytes()
+
+# --- Old path, as main.py and ObjectDetector used to do it ---
+
+def legacy_decode(image_data: str) -> Image.Image:
+    image_bytes = base64.b64decode(image_data)
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    cv_image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    return Image.fromarray(cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB))
+
+def legacy_read_text(image_data: str):
+    return np.array(legacy_decode(image_data))
+
+def legacy_find_object(image_data: str):
+    frame = np.array(legacy_decode(image_data))
+    return frame, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+def legacy_describe_scene(image_data: str):
+    return legacy_decode(image_data)
+
+# --- Shared Frame path ---
+
+def frame_read_text(frame_source):
+    return frame_source().rgb
+
+def frame_find_object(frame_source):
+    frame = frame_source()
+    return frame.bgr, frame.rgb
+
+def frame_describe_scene(frame_source):
+    return frame_source().pil
+
+def measure(fn, arg, repeat: int):
+    """Median peak and retained MiB (what the request still holds) and ms."""
+    fn(arg)  # warm up
+    peaks, retained, times = [], [], []
+    for _ in range(repeat):
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = fn(arg)
+        times.append((time.perf_counter() - started) * 1000)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak)
+        retained.append(current)
+        del result
+    return float(np.median(peaks)) / 2**20, float(np.median(retained)) / 2**20, float(np.median(times))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    jpeg = make_jpeg(args.width, args.height)
+    b64 = base64.b64encode(jpeg).decode("ascii")
+    print(f"{args.width}x{args.height} JPEG: {len(jpeg) / 1024:.0f} KiB raw, {len(b64) / 1024:.0f} KiB base64\n")
+
+    cases = [
+        ("read_text", legacy_read_text, frame_read_text),
+        ("find_object", legacy_find_object, frame_find_object),
+        ("describe_scene", legacy_describe_scene, frame_describe_scene),
+    ]
+    print(f"{'task':<16}{'path':<14}{'peak MiB':>10}{'held MiB':>10}{'ms':>9}")
+    for task, legacy_fn, frame_fn in cases:
+        rows = [
+            ("legacy b64", legacy_fn, b64),
+            ("Frame b64", frame_fn, lambda: Frame.from_base64(b64)),
+            ("Frame binary", frame_fn, lambda: Frame.from_bytes(jpeg)),
+        ]
+        for label, fn, arg in rows:
+            peak, held, ms = measure(fn, arg, args.repeat)
+            print(f"{task:<16}{label:<14}{peak:>10.2f}{held:>10.2f}{ms:>9.2f}")
+
+if __name__ == "__main__":
+    main()
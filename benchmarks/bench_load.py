@@ -0,0 +1,299 @@
+"""
+Load Benchmark - Latency, throughput and memory of each task under load
+
+Drives /process_upload with a configurable number of concurrent clients over
+a corpus of synthetic JPEGs and reports, per task, p50/p95/p99 latency,
+throughput, peak RSS and where the time went, from the per-stage breakdown
+the server returns with timings=true (decode, queue wait, each model stage,
+and the client-side overhead on top of the server's own total).
+
+By default the app runs in-process with stub services (benchmarks/stubs.py)
+that sleep instead of running models, so it works on a CPU-only machine
+without downloads and measures the request path itself. --real loads the
+real models instead; --url measures a running server from the client side
+only. The result cache is disabled unless --cache is given.
+
+Run from the repository root (needs httpx):
+    python -m benchmarks.bench_load --tasks find_object,read_text --concurrency 8 --requests 200 --output after.json
+    python -m benchmarks.bench_load --real --tasks find_object --output real.json
+    python -m benchmarks.bench_load --url http://localhost:8000 --tasks find_object
+    python -m benchmarks.bench_load --compare before.json after.json
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+import httpx
+import numpy as np
+
+from benchmarks.bench_decode import make_jpeg
+
+# The service each benchmarkable task runs on
+TASK_SERVICES = {
+    "describe_scene": "vision",
+    "answer_question": "vision",
+    "read_text": "ocr",
+    "find_object": "object",
+    "recognize_face": "face",
+}
+DEFAULT_TASKS = ["find_object", "read_text", "recognize_face", "describe_scene"]
+DEFAULT_QUESTION = "Is the door open?"
+
+class RSSMonitor:
+    """Samples the resident set size in a background thread and keeps the peak."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def rss() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            # Not Linux: fall back to the lifetime peak (KiB on Linux, bytes on macOS)
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return maxrss if platform.system() == "Darwin" else maxrss * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.rss())
+
+    def __enter__(self):
+        self.peak = self.rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rss-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.rss())
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean/max of samples in seconds, as milliseconds."""
+    if not samples:
+        return {}
+    ms = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2),
+            "mean": round(float(ms.mean()), 2), "max": round(float(ms.max()), 2)}
+
+def setup_app(tasks: List[str], real: bool, cache: bool):
+    """
+    Import the app, point its registry at the stub (or real) services needed
+    for tasks and load them.
+    """
+    import main
+    from modules.registry import ServiceRegistry, SERVICE_CLASSES
+    from benchmarks.stubs import STUB_SERVICE_CLASSES
+
+    needed = sorted({TASK_SERVICES[task] for task in tasks})
+    main.services = ServiceRegistry(needed, service_classes=SERVICE_CLASSES if real else STUB_SERVICE_CLASSES)
+    for thread in main.services.load_all():
+        thread.join()
+    failed = [name for name in needed if not main.services.ready(name)]
+    if failed:
+        raise SystemExit(f"Could not load services {failed}: {main.services.status()}")
+    if not cache:
+        main.result_cache = None
+    return main
+
+async def run_load(client: httpx.AsyncClient, task: str, corpus: List[bytes], concurrency: int,
+                   total: int, query_text: Optional[str], mode: Optional[str]) -> Dict[str, Any]:
+    """Send total requests from concurrency clients and collect their timings."""
+    params = {"task": task, "timings": "true"}
+    if query_text:
+        params["query_text"] = query_text
+    if mode:
+        params["mode"] = mode
+    latencies, statuses, stage_samples = [], Counter(), defaultdict(list)
+    counter = itertools.count()
+
+    async def client_loop():
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            started = time.perf_counter()
+            response = await client.post("/process_upload", params=params, content=corpus[i % len(corpus)],
+                                         headers={"content-type": "application/octet-stream"})
+            elapsed = time.perf_counter() - started
+            statuses[response.status_code] += 1
+            if response.status_code != 200:
+                continue
+            latencies.append(elapsed)
+            timings = (response.json().get("structured_data") or {}).get("timings_ms", {})
+            for stage, ms in timings.items():
+                if stage == "total":
+                    stage_samples["client_overhead"].append(elapsed - ms / 1000)
+                else:
+                    stage_samples[stage].append(ms / 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "ok": len(latencies),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        "latency_ms": percentiles(latencies),
+        "stages_ms": {stage: percentiles(samples) for stage, samples in sorted(stage_samples.items())},
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def benchmark(args) -> Dict[str, Any]:
+    tasks = args.tasks.split(",")
+    unknown = [task for task in tasks if task not in TASK_SERVICES]
+    if unknown:
+        raise SystemExit(f"Unknown tasks {unknown}, expected some of {list(TASK_SERVICES)}")
+    corpus = [make_jpeg(args.width, args.height, seed) for seed in range(args.corpus)]
+
+    meta = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "services": args.url or ("real" if args.real else "stub"),
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "image": f"{args.width}x{args.height}",
+        "corpus": args.corpus,
+        "cache": args.cache,
+        "mode": args.mode,
+    }
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        main = None
+    else:
+        if not args.real:
+            from benchmarks.stubs import STUB_LATENCY_MS
+            for override in args.stub_latency:
+                key, value = override.split("=")
+                STUB_LATENCY_MS[key] = float(value)
+            meta["stub_latency_ms"] = dict(STUB_LATENCY_MS)
+        main = setup_app(tasks, args.real, args.cache)
+        meta["load_seconds"] = {name: entry["load_seconds"] for name, entry in main.services.status().items()
+                                if entry["state"] == "ready"}
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench",
+                                   timeout=args.timeout)
+
+    results = {}
+    async with client:
+        for task in tasks:
+            query_text = args.question if task == "answer_question" else None
+            # main.py prints every request; keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                if args.warmup:
+                    await run_load(client, task, corpus, args.concurrency, args.warmup, query_text, args.mode)
+                with RSSMonitor() as rss:
+                    result = await run_load(client, task, corpus, args.concurrency, args.requests, query_text, args.mode)
+            result["peak_rss_mib"] = round(rss.peak / 2**20, 1) if main is not None else None
+            results[task] = result
+            print_result(task, result)
+
+    if main is not None:
+        meta["pools"] = main.scheduler.stats()
+        object_service = main.services.peek("object")
+        meta["object_batching"] = object_service.batch_stats() if object_service is not None else {}
+        main.scheduler.shutdown()
+    return {"meta": meta, "tasks": results}
+
+def print_result(task: str, result: Dict[str, Any]):
+    latency = result["latency_ms"]
+    rss = f"{result['peak_rss_mib']:.0f} MiB" if result["peak_rss_mib"] is not None else "n/a"
+    print(f"\n{task}: {result['ok']}/{result['requests']} ok {result['status_codes']}, "
+          f"{result['throughput_rps']:.1f} req/s, peak RSS {rss}")
+    if not latency:
+        return
+    print(f"  {'stage':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    print(f"  {'total':<28}{latency['p50']:>10.2f}{latency['p95']:>10.2f}{latency['p99']:>10.2f}")
+    for stage, stats in result["stages_ms"].items():
+        print(f"  {stage:<28}{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['p99']:>10.2f}")
+
+def compare(before_path: str, after_path: str):
+    """Print the change in latency, throughput and memory between two result files."""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"before: {before['meta'].get('commit')} {before['meta']['timestamp']} ({before['meta']['services']})")
+    print(f"after:  {after['meta'].get('commit')} {after['meta']['timestamp']} ({after['meta']['services']})")
+
+    rows = [
+        ("p50 ms", lambda r: r["latency_ms"].get("p50")),
+        ("p95 ms", lambda r: r["latency_ms"].get("p95")),
+        ("p99 ms", lambda r: r["latency_ms"].get("p99")),
+        ("req/s", lambda r: r["throughput_rps"]),
+        ("peak RSS MiB", lambda r: r["peak_rss_mib"]),
+    ]
+    for task in before["tasks"]:
+        if task not in after["tasks"]:
+            continue
+        print(f"\n{task}")
+        print(f"  {'':<16}{'before':>10}{'after':>10}{'change':>10}")
+        for label, get in rows:
+            old, new = get(before["tasks"][task]), get(after["tasks"][task])
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"  {label:<16}{old:>10.2f}{new:>10.2f}{change:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", default=",".join(DEFAULT_TASKS),
+                        help=f"comma-separated, any of {', '.join(TASK_SERVICES)}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per task")
+    parser.add_argument("--warmup", type=int, default=10, help="unrecorded requests per task")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--corpus", type=int, default=32, help="number of distinct synthetic images")
+    parser.add_argument("--question", default=DEFAULT_QUESTION, help="query_text for answer_question")
+    parser.add_argument("--mode", choices=["fast", "accurate"])
+    parser.add_argument("--cache", action="store_true", help="keep the result cache enabled")
+    parser.add_argument("--real", action="store_true", help="load the real models instead of stubs")
+    parser.add_argument("--stub-latency", action="append", default=[], metavar="KEY=MS",
+                        help="override a stub latency, e.g. yolo=15 (see benchmarks/stubs.py)")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = asyncio.run(benchmark(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Backend Parity Check - ONNX Runtime outputs against eager PyTorch
+
+Runs YOLO and MiDaS both ways on the same images and fails (exit code 1)
+when the exported models drift: MiDaS by the mean relative error of the depth
+maps, YOLO by the share of eager detections found again with the same class
+and an IoU of at least 0.9. Needs the real models and onnxruntime.
+
+Run from the repository root:
+    python -m benchmarks.check_backend_parity [--int8] [--images a.jpg b.jpg]
+
+Synthetic images are used when no --images are given; they rarely contain
+objects, so pass real photos to check YOLO meaningfully.
+"""
+import argparse
+import sys
+import time
+from typing import List
+import cv2
+import numpy as np
+import torch
+
+from benchmarks.bench_decode import make_jpeg
+from modules.backends import load_yolo, compile_midas
+from config import YOLO_MODEL_PATH, MIDAS_MODEL_TYPE
+
+DPT_MODEL_TYPES = ("DPT_Large", "DPT_Hybrid")
+
+def load_images(paths: List[str]) -> List[np.ndarray]:
+    if paths:
+        return [cv2.imread(path, cv2.IMREAD_COLOR) for path in paths]
+    return [cv2.imdecode(np.frombuffer(make_jpeg(640, 480, seed), np.uint8), cv2.IMREAD_COLOR) for seed in range(4)]
+
+def iou(a, b) -> float:
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+def check_midas(images: List[np.ndarray], model_type: str, int8: bool) -> float:
+    eager = torch.hub.load("intel-isl/MiDaS", model_type, trust_repo=True).eval()
+    transforms = torch.hub.load("intel-isl/MiDaS", "transforms", trust_repo=True)
+    transform = transforms.dpt_transform if model_type in DPT_MODEL_TYPES else transforms.small_transform
+    inputs = [transform(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)) for image in images]
+    # The export moves the module to the CPU, so the eager copy is loaded separately
+    exported = compile_midas(torch.hub.load("intel-isl/MiDaS", model_type, trust_repo=True).eval(),
+                             model_type, inputs[0], backend="onnx", quantize=int8)
+
+    errors, eager_ms, onnx_ms = [], 0.0, 0.0
+    with torch.no_grad():
+        for input_batch in inputs:
+            expected, ms = timed(eager, input_batch)
+            eager_ms += ms
+            actual, ms = timed(exported, input_batch)
+            onnx_ms += ms
+            expected, actual = expected.numpy(), actual.numpy()
+            errors.append(float(np.abs(expected - actual).mean() / (np.abs(expected).mean() + 1e-6)))
+    error = max(errors)
+    print(f"midas {model_type}: max mean relative error {error:.4f}, "
+          f"eager {eager_ms / len(inputs):.1f} ms, onnx {onnx_ms / len(inputs):.1f} ms per image")
+    return error
+
+def check_yolo(images: List[np.ndarray], int8: bool) -> float:
+    eager = load_yolo(YOLO_MODEL_PATH, backend="torch")
+    exported = load_yolo(YOLO_MODEL_PATH, backend="onnx", quantize=int8)
+
+    matched, total, eager_ms, onnx_ms = 0, 0, 0.0, 0.0
+    for image in images:
+        expected, ms = timed(lambda: eager(image, imgsz=640, verbose=False)[0])
+        eager_ms += ms
+        actual, ms = timed(lambda: exported(image, imgsz=640, verbose=False)[0])
+        onnx_ms += ms
+        found = list(zip(actual.boxes.xyxy.tolist(), actual.boxes.cls.tolist()))
+        for box, cls in zip(expected.boxes.xyxy.tolist(), expected.boxes.cls.tolist()):
+            total += 1
+            matched += any(c == cls and iou(box, b) >= 0.9 for b, c in found)
+    recall = matched / total if total else 1.0
+    print(f"yolo: {matched}/{total} detections matched, "
+          f"eager {eager_ms / len(images):.1f} ms, onnx {onnx_ms / len(images):.1f} ms per image")
+    return recall
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ONNX Runtime outputs with eager PyTorch")
+    parser.add_argument("--images", nargs="*", default=[], help="Image files (default: synthetic)")
+    parser.add_argument("--midas", default=MIDAS_MODEL_TYPE, help="MiDaS model type")
+    parser.add_argument("--int8", action="store_true", help="Check the INT8-quantized exports")
+    parser.add_argument("--max-depth-error", type=float, default=None,
+                        help="Allowed mean relative depth error (default: 0.01, or 0.05 with --int8)")
+    parser.add_argument("--min-yolo-recall", type=float, default=None,
+                        help="Required share of matched detections (default: 0.95, or 0.8 with --int8)")
+    args = parser.parse_args()
+    max_error = args.max_depth_error if args.max_depth_error is not None else (0.05 if args.int8 else 0.01)
+    min_recall = args.min_yolo_recall if args.min_yolo_recall is not None else (0.8 if args.int8 else 0.95)
+
+    images = load_images(args.images)
+    failures = []
+    if check_midas(images, args.midas, args.int8) > max_error:
+        failures.append("midas")
+    if check_yolo(images, args.int8) < min_recall:
+        failures.append("yolo")
+    if failures:
+        print(f"FAILED: {', '.join(failures)}")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Stub Services - CPU-only stand-ins for the AI services, for benchmarking
+
+Each stub has the same interface as the real service and returns results of
+the same shape, but sleeps for a fixed time instead of running a model, so
+the request path (decoding, pools, batching, caching, serialization) can be
+measured on any machine without downloading models. Sleeping releases the
+GIL the way native inference does.
+
+Latencies are in milliseconds and can be changed through STUB_LATENCY_MS
+before the services are loaded.
+"""
+import time
+import threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+from PIL import Image
+
+from modules.batching import MicroBatcher
+from modules.metrics import stage
+from config import OBJECT_BATCH_MAX_SIZE, OBJECT_BATCH_MAX_WAIT_MS, YOLO_FAST_MODEL_PATH
+
+STUB_LATENCY_MS = {
+    "load": 50,
+    "describe_scene": 120,
+    "answer_question": 150,
+    "read_text": 80,
+    "yolo": 40,
+    # Extra cost of every further frame in a YOLO batch, as a fraction of "yolo"
+    "yolo_batch_item": 0.3,
+    "depth": 30,
+    "recognize_face": 25,
+}
+
+# Service name -> "module:ClassName", in the format of modules.registry.SERVICE_CLASSES
+STUB_SERVICE_CLASSES = {
+    "vision": "benchmarks.stubs:StubVisionModule",
+    "object": "benchmarks.stubs:StubObjectDetector",
+    "face": "benchmarks.stubs:StubFaceRecognizer",
+    "ocr": "benchmarks.stubs:StubOCRReader",
+}
+
+# Latency key -> the stage name the real service reports it under
+STUB_STAGES = {
+    "describe_scene": "caption",
+    "answer_question": "vqa",
+    "read_text": "rapidocr",
+    "yolo": "yolo",
+    "depth": "midas",
+    "recognize_face": "face_detect",
+}
+
+def _sleep(key: str, scale: float = 1.0):
+    with stage(STUB_STAGES.get(key, key)):
+        time.sleep(STUB_LATENCY_MS[key] * scale / 1000)
+
+class StubService:
+    def __init__(self):
+        self.is_initialized = False
+
+    def load_model(self):
+        time.sleep(STUB_LATENCY_MS["load"] / 1000)
+        self.is_initialized = True
+
+class StubVisionModule(StubService):
+    def describe_scene(self, image: Image.Image, on_text=None) -> str:
+        caption = f"a {image.width}x{image.height} picture of a room with a table"
+        words = caption.split()
+        for i, word in enumerate(words):
+            _sleep("describe_scene", 1 / len(words))
+            if on_text is not None:
+                on_text(word if i == 0 else " " + word)
+        return caption
+
+    def answer_question(self, image: Image.Image, question: str, image_key=None, on_text=None) -> str:
+        _sleep("answer_question")
+        if on_text is not None:
+            on_text("yes")
+        return "yes"
+
+    def answer_questions(self, image: Image.Image, questions: List[str], image_key=None, on_text=None) -> List[str]:
+        _sleep("answer_question")
+        return ["yes"] * len(questions)
+
+class StubOCRReader(StubService):
+    def read(self, image: np.ndarray, mode: Optional[str] = None, roi=None) -> List[Dict]:
+        _sleep("read_text", 0.5 if mode == "fast" else 1.0)
+        h, w = image.shape[:2]
+        return [{"text": "EXIT", "confidence": 0.95,
+                 "box": [[0, 0], [w // 4, 0], [w // 4, h // 8], [0, h // 8]]}]
+
+class StubObjectDetector(StubService):
+    """Goes through the real MicroBatcher, so batching shows up in the numbers."""
+
+    def __init__(self):
+        super().__init__()
+        self.batcher = None
+
+    def load_model(self):
+        super().load_model()
+        if OBJECT_BATCH_MAX_SIZE > 1:
+            self.batcher = MicroBatcher(self._detect_items, OBJECT_BATCH_MAX_SIZE,
+                                        OBJECT_BATCH_MAX_WAIT_MS, name="stub-object-batcher")
+
+    def unload_model(self):
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+        self.is_initialized = False
+
+    def detect(self, frame: np.ndarray, rgb: Optional[np.ndarray] = None, depth_model: Optional[str] = None,
+               yolo_weights: Optional[str] = None, targets: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if self.batcher is not None:
+            objects = self.batcher.submit((frame, yolo_weights))
+        else:
+            objects = self.detect_batch([frame], yolo_weights=[yolo_weights])[0]
+        return [obj for obj in objects if targets is None or obj["name"] in targets]
+
+    def _detect_items(self, items):
+        frames, yolo_weights = zip(*items)
+        return self.detect_batch(list(frames), yolo_weights=list(yolo_weights))
+
+    def detect_batch(self, frames: List[np.ndarray], rgbs=None, depth_models=None,
+                     yolo_weights=None) -> List[List[Dict[str, Any]]]:
+        # The fast tier's lighter models take a fraction of the time
+        scale = 0.4 if yolo_weights and all(weights == YOLO_FAST_MODEL_PATH for weights in yolo_weights) else 1.0
+        _sleep("yolo", scale * (1 + STUB_LATENCY_MS["yolo_batch_item"] * (len(frames) - 1)))
+        _sleep("depth", scale)
+        detections = []
+        for frame in frames:
+            h, w = frame.shape[:2]
+            detections.append([
+                {"name": "chair", "confidence": 0.91, "box": [w * 0.1, h * 0.5, w * 0.3, h * 0.9], "depth": 0.62,
+                 "closeness": 2.4, "distance": "very close"},
+                {"name": "person", "confidence": 0.84, "box": [w * 0.6, h * 0.2, w * 0.8, h * 0.9], "depth": 0.28,
+                 "closeness": 1.1, "distance": "farther away"},
+            ])
+        return detections
+
+    def depth_grid(self, rgb: np.ndarray, model_type: Optional[str] = None, rows: int = 3, cols: int = 3) -> np.ndarray:
+        _sleep("depth")
+        grid = np.ones((rows, cols), dtype=np.float32)
+        grid[-1, cols // 2] = 3.0
+        return grid
+
+    def batch_stats(self) -> Dict[str, Any]:
+        return self.batcher.stats.snapshot() if self.batcher is not None else {}
+
+class StubFaceRecognizer(StubService):
+    def __init__(self):
+        super().__init__()
+        self.names = set()
+        self._lock = threading.Lock()
+
+    def recognize(self, frame: np.ndarray, boxes=None, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        # Looking only around known boxes is much cheaper than a full frame
+        _sleep("recognize_face", 0.3 if boxes is not None else 0.5 if mode == "fast" else 1.0)
+        h, w = frame.shape[:2]
+        with self._lock:
+            name = min(self.names) if self.names else "Unknown"
+        return [{"name": name, "confidence": 0.72 if self.names else 0.0,
+                 "box": [w // 3, h // 4, w // 2, h // 2],
+                 "candidates": [{"name": name, "score": 0.72}] if self.names else [],
+                 "margin": 0.72 if self.names else 0.0}]
+
+    def gallery_version(self) -> str:
+        with self._lock:
+            return ",".join(sorted(self.names))
+
+    def save_face(self, name: str, frame: np.ndarray) -> bool:
+        _sleep("recognize_face")
+        with self._lock:
+            self.names.add(name.strip().title())
+        return True
+
+    def enroll_faces(self, identities, replace: bool = False) -> Dict[str, Dict[str, int]]:
+        report = {}
+        for name, images in identities.items():
+            _sleep("recognize_face", len(images))
+            with self._lock:
+                self.names.add(name.strip().title())
+            report[name.strip().title()] = {"images": len(images), "faces": len(images), "outliers": 0,
+                                            "stored": 1 + min(len(images) - 1, 4)}
+        return report
+
+    def export_gallery(self) -> bytes:
+        with self._lock:
+            return "\n".join(sorted(self.names)).encode("utf-8")
+
+    def import_gallery(self, data: bytes, replace: bool = False) -> int:
+        names = [name for name in data.decode("utf-8").split("\n") if name]
+        with self._lock:
+            if replace:
+                self.names.clear()
+            self.names.update(names)
+        return len(names)
+
+    def delete_face(self, name: str) -> int:
+        with self._lock:
+            removed = int(name.strip().title() in self.names)
+            self.names.discard(name.strip().title())
+        return removed
+
+    def rename_face(self, name: str, new_name: str) -> int:
+        with self._lock:
+            if name.strip().title() not in self.names:
+                return 0
+            self.names.discard(name.strip().title())
+            self.names.add(new_name.strip().title())
+        return 1
@@ -6,11 +6,201 @@ This file centralizes the model names and other settings.
 # Object Detection (YOLO)
 # Path to the YOLO model file. Using the one from your friend's project.
 YOLO_MODEL_PATH = "yolov9c.pt"
+# Lighter YOLO for the "fast" tier, loaded at startup when QOS_ENABLED and
+# on first use otherwise
+YOLO_FAST_MODEL_PATH = "yolov9t.pt"
 
 # Depth Estimation (MiDaS)
 # Options: "DPT_Large", "DPT_Hybrid", "MiDaS_small"
 MIDAS_MODEL_TYPE = "DPT_Large"
+# Lighter variant used for requests with mode "fast" (and by nearest_obstacle),
+# loaded at startup when QOS_ENABLED
+MIDAS_FAST_MODEL_TYPE = "MiDaS_small"
+# Run MiDaS at the same time as YOLO instead of after it. Concurrent is
+# faster on a GPU but also estimates depth for frames where nothing was
+# detected; sequential skips depth entirely for those. None picks
+# concurrent on a GPU and sequential on CPU.
+OBJECT_DEPTH_CONCURRENT = None
+# Percentile of the depth values inside a box reported as the object's depth
+# (50 = median, robust to background pixels inside the box)
+OBJECT_DEPTH_PERCENTILE = 50
+# MiDaS depth is relative, so objects are described by how much closer they
+# are than the median of the frame: "very close" at OBJECT_VERY_CLOSE_RATIO
+# times the median inverse depth or more, "nearby" at OBJECT_NEAR_RATIO or
+# more, else "farther away"
+OBJECT_VERY_CLOSE_RATIO = 2.0
+OBJECT_NEAR_RATIO = 1.2
+# nearest_obstacle splits the depth map into an OBSTACLE_GRID_ROWS x
+# OBSTACLE_GRID_COLS grid and reports each cell's OBSTACLE_PERCENTILE (a high
+# percentile, so a thin pole in a cell still counts as close). A cell is
+# "close" when that value is at least OBSTACLE_CLOSE_RATIO times the median
+# cell's.
+OBSTACLE_GRID_ROWS = 3
+OBSTACLE_GRID_COLS = 3
+OBSTACLE_PERCENTILE = 90
+OBSTACLE_CLOSE_RATIO = 2.0
 
 # Face Recognition (InsightFace)
 # Options: "buffalo_l", "buffalo_s"
 INSIGHTFACE_MODEL = "buffalo_l"
+
+# Cosine similarity above which a face is accepted as a known person
+FACE_MATCH_THRESHOLD = 0.6
+# Number of candidate identities returned per face
+FACE_TOP_K = 3
+# Gallery size above which matching switches to the approximate IVF index
+# (None keeps exact search at every size) and how many clusters it probes
+FACE_ANN_THRESHOLD = 5000
+FACE_ANN_NPROBE = 8
+# Directory of the append-only face embedding store. An old
+# modules/known_faces.pkl database is migrated into it on first start.
+FACE_DB_DIR = "modules/face_db"
+# Detector input size for whole frames. Faces whose boxes are already known
+# (sent by the client or tracked in a stream) are re-detected only in a crop
+# around each box, extended by FACE_CROP_MARGIN of its size on every side, at
+# a detector size that follows the crop size but is at least
+# FACE_CROP_MIN_DET_SIZE, so small faces are upscaled rather than lost.
+FACE_DET_SIZE = 640
+FACE_CROP_MARGIN = 0.5
+FACE_CROP_MIN_DET_SIZE = 160
+# Whole-frame detector input size on the "fast" tier. The recognition model
+# stays the same: buffalo_s embeddings cannot be matched against faces saved
+# with buffalo_l.
+FACE_FAST_DET_SIZE = 320
+# Bulk enrollment stores each person as the mean of their photos' embeddings
+# plus up to FACE_ENROLL_EXEMPLARS of the most distinct single photos. Photos
+# whose face is less similar than FACE_ENROLL_MIN_SIMILARITY to the person's
+# mean are taken to show someone else and skipped.
+FACE_ENROLL_EXEMPLARS = 4
+FACE_ENROLL_MIN_SIMILARITY = 0.3
+# Aligned faces per recognition-model call, and photos per enrollment request
+FACE_ENROLL_BATCH_SIZE = 32
+FACE_ENROLL_MAX_IMAGES = 1000
+
+# Vision (captioning and VQA)
+# Image encodings kept for follow-up questions about the same frame
+VISION_EMBED_CACHE_SIZE = 8
+
+# OCR (RapidOCR)
+# Text lines recognized per batch
+OCR_REC_BATCH_NUM = 16
+# read_text with mode "fast": the frame is downscaled so its longest side is
+# at most OCR_FAST_MAX_SIDE pixels (boxes are mapped back to the original
+# frame) and the text angle classifier is skipped unless OCR_FAST_USE_CLS.
+OCR_FAST_MAX_SIDE = 960
+OCR_FAST_USE_CLS = False
+# Before the fast pass, a detection-only pass on a copy this small decides
+# whether the frame has any text at all (None disables the check)
+OCR_FAST_GATE_SIDE = 320
+
+# Inference Backend
+# "torch" runs YOLO and MiDaS in eager PyTorch. "onnx" exports them once to
+# ONNX (cached in MODEL_CACHE_DIR) and runs them on ONNX Runtime, usually
+# much faster on CPU-only machines.
+MODEL_BACKEND = "torch"
+# INT8 dynamic quantization: the exported ONNX models with the "onnx"
+# backend, and the MiDaS and captioning/VQA Linear layers on CPU otherwise.
+MODEL_QUANTIZE = False
+MODEL_CACHE_DIR = "models/compiled"
+# Sessions per ONNX model (how many runs can execute at once) and the ONNX
+# Runtime thread counts per session (0 = ONNX Runtime's default)
+ONNX_SESSION_POOL_SIZE = 1
+ONNX_INTRA_OP_THREADS = 0
+ONNX_INTER_OP_THREADS = 0
+
+# Model Loading
+# Services this server runs ("vision", "object", "face", "ocr"). Disabled
+# services are never imported or loaded and their tasks answer 503.
+ENABLED_SERVICES = ["vision", "object", "face", "ocr"]
+# "eager": load every enabled service in parallel background threads at
+# startup; requests are accepted meanwhile and GET /ready reports progress.
+# "lazy": load each service on its first request.
+MODEL_LOADING = "eager"
+# Memory budget for the loaded services in MB (None = no limit). Over
+# budget, the least recently used idle services are unloaded and reload on
+# their next request, which then waits for the load. Services in
+# MODEL_PINNED_SERVICES are never unloaded. With a budget, eager loading
+# loads the services one at a time, pinned first, and leaves the rest to
+# load on first use once the budget is full.
+MODEL_MEMORY_BUDGET_MB = None
+MODEL_PINNED_SERVICES = ["object"]
+
+# Inference Scheduler
+# Every model service runs on its own worker pool so a slow frame on one
+# model never blocks the others. "workers" is how many inferences run at once,
+# "queue_depth" how many more may wait before new requests are rejected.
+INFERENCE_POOLS = {
+    "vision": {"workers": 1, "queue_depth": 4},
+    "object": {"workers": 4, "queue_depth": 8},
+    "face": {"workers": 1, "queue_depth": 8},
+    "ocr": {"workers": 1, "queue_depth": 4},
+}
+
+# Object Detection Micro-Batching
+# Concurrent find_object frames are grouped into one YOLO + MiDaS batch of up
+# to OBJECT_BATCH_MAX_SIZE frames, waiting at most OBJECT_BATCH_MAX_WAIT_MS for
+# the batch to fill. Set the size to 1 to disable batching. The "object" pool
+# needs at least as many workers as the batch size for batches to form.
+OBJECT_BATCH_MAX_SIZE = 4
+OBJECT_BATCH_MAX_WAIT_MS = 10
+
+# Result Cache
+# Repeated frames (e.g. "read this" asked twice while holding the phone still)
+# are answered from cache, keyed by task, query_text and an image hash.
+# RESULT_CACHE_HASH: "exact" matches identical uploads only, "dhash" is a
+# perceptual hash that also matches re-encoded, near-identical frames.
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_HASH = "exact"
+RESULT_CACHE_MAX_ENTRIES = 256
+RESULT_CACHE_TTL_SECONDS = 30
+RESULT_CACHE_MAX_MB = 32
+
+# Navigation Stream (/stream WebSocket)
+# Full object detection is skipped while the camera view stays the same as
+# the last detected frame (perceptual hash differs by at most
+# STREAM_REUSE_MAX_DISTANCE of 64 bits), for at most STREAM_DETECT_INTERVAL
+# frames in a row. Faces are recognized on every STREAM_FACE_INTERVAL-th frame.
+STREAM_DETECT_INTERVAL = 5
+STREAM_REUSE_MAX_DISTANCE = 4
+STREAM_FACE_INTERVAL = 3
+# Between full-frame face detections, every STREAM_FACE_REDETECT_INTERVAL-th
+# face pass, only the faces found last time are looked for (in crops around
+# their boxes). New faces show up at the next full detection.
+STREAM_FACE_REDETECT_INTERVAL = 4
+
+# Quality of Service
+# Requests without a "mode" run on the "accurate" tier until a task's p95
+# latency over the last QOS_WINDOW_SECONDS (once QOS_MIN_SAMPLES requests ran)
+# exceeds its target below, or its service's wait queue is QOS_QUEUE_HIGH
+# full. They then run on the "fast" tier (YOLO_FAST_MODEL_PATH with
+# MIDAS_FAST_MODEL_TYPE, FACE_FAST_DET_SIZE, fast OCR) until p95 is below
+# QOS_RECOVER_RATIO of the target (or too few requests to tell) with nothing
+# queued. The tier changes at most every QOS_MIN_DWELL_SECONDS. An explicit
+# "mode" is always honored. With QoS on, the fast tier's models load at
+# startup with the others, so the first overloaded request does not wait for them.
+QOS_ENABLED = True
+QOS_TARGET_P95_MS = {"find_object": 500, "recognize_face": 300, "read_text": 1000}
+QOS_WINDOW_SECONDS = 30
+QOS_MIN_SAMPLES = 20
+QOS_QUEUE_HIGH = 0.5
+QOS_RECOVER_RATIO = 0.6
+QOS_MIN_DWELL_SECONDS = 10
+
+# Wire Format
+# Responses of at least WIRE_COMPRESS_MIN_BYTES are brotli- (when the brotli
+# package is installed) or gzip-compressed for clients that accept it.
+WIRE_COMPRESS_MIN_BYTES = 512
+# Longest image side worth uploading per task: the models shrink anything
+# larger, so bigger uploads only cost the client bandwidth. Sent with every
+# /process_* response as X-Upload-Max-Side and listed by GET /upload_hints.
+# UPLOAD_MAX_SIDE_FAST overrides it for requests run on the "fast" tier.
+UPLOAD_MAX_SIDE = {
+    "find_object": 640, "nearest_obstacle": 384, "recognize_face": 960, "save_face": 960,
+    "read_text": 1600, "describe_scene": 384, "answer_question": 480,
+}
+UPLOAD_MAX_SIDE_FAST = {"recognize_face": 640, "read_text": OCR_FAST_MAX_SIDE}
+UPLOAD_MAX_SIDE_DEFAULT = 1280
+UPLOAD_JPEG_QUALITY = 80
+
+# Seconds a client should wait before retrying when a queue is full (503)
+RETRY_AFTER_SECONDS = 1
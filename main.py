@@ -1,40 +1,96 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional, Literal
-import base64
-from PIL import Image
-import io
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError
+from typing import Awaitable, Callable, Dict, List, Optional, Literal
 import uvicorn
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+import asyncio
 import datetime
-import numpy as np
-import cv2
-
-# Import the new modular services
-from modules.vision import VisionModule
-from modules.object_detection import ObjectDetector
-from modules.face_recognition import FaceRecognizer
-from modules.ocr import OCRReader
-
-# --- Global instances of our services ---
-vision_service = VisionModule()
-object_service = ObjectDetector()
-face_service = FaceRecognizer()
-ocr_service = OCRReader()
-# The old face_manager is replaced by face_service
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+import zipfile
+
+# The modular services are built and loaded by the registry
+from modules.registry import ServiceRegistry, ServiceUnavailableError
+from modules.frame import Frame
+from modules.result_cache import ResultCache
+from modules.stream import LatestFrameSlot, StreamSession, STREAM_TASKS
+from modules.scheduler import InferenceScheduler, QueueFullError
+from modules.qos import QoSController
+from modules.object_query import query_targets, direction, nearest_cell
+from modules import metrics, wire
+from config import (
+    INFERENCE_POOLS, RETRY_AFTER_SECONDS,
+    RESULT_CACHE_ENABLED, RESULT_CACHE_HASH, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_MAX_MB,
+    STREAM_DETECT_INTERVAL, STREAM_REUSE_MAX_DISTANCE, STREAM_FACE_INTERVAL, STREAM_FACE_REDETECT_INTERVAL,
+    MIDAS_MODEL_TYPE, MIDAS_FAST_MODEL_TYPE, YOLO_MODEL_PATH, YOLO_FAST_MODEL_PATH,
+    QOS_ENABLED, QOS_TARGET_P95_MS, QOS_WINDOW_SECONDS, QOS_MIN_SAMPLES, QOS_QUEUE_HIGH, QOS_RECOVER_RATIO,
+    QOS_MIN_DWELL_SECONDS,
+    OBSTACLE_GRID_ROWS, OBSTACLE_GRID_COLS, OBSTACLE_CLOSE_RATIO,
+    ENABLED_SERVICES, MODEL_LOADING, MODEL_MEMORY_BUDGET_MB, MODEL_PINNED_SERVICES,
+    FACE_ENROLL_MAX_IMAGES,
+    WIRE_COMPRESS_MIN_BYTES, UPLOAD_MAX_SIDE, UPLOAD_MAX_SIDE_FAST, UPLOAD_MAX_SIDE_DEFAULT, UPLOAD_JPEG_QUALITY,
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Our services: vision, object, face and ocr ---
+# Only services listed in ENABLED_SERVICES are ever imported or loaded; idle
+# ones are unloaded when the loaded services outgrow MODEL_MEMORY_BUDGET_MB
+services = ServiceRegistry(ENABLED_SERVICES, lazy=(MODEL_LOADING == "lazy"),
+                           memory_budget_mb=MODEL_MEMORY_BUDGET_MB, pinned=MODEL_PINNED_SERVICES)
+
+# Blocking model calls run on per-service worker pools, off the event loop
+scheduler = InferenceScheduler(INFERENCE_POOLS, retry_after=RETRY_AFTER_SECONDS)
+
+# Tasks with a lighter "fast" tier and the service each one runs on
+TIERED_TASKS = {'find_object': 'object', 'recognize_face': 'face', 'read_text': 'ocr'}
+
+# Requests without a mode move to the fast tier when their task falls behind
+qos = QoSController(
+    {task: target for task, target in QOS_TARGET_P95_MS.items() if task in TIERED_TASKS},
+    pressure=lambda task: scheduler.pools[TIERED_TASKS[task]].pressure(),
+    window_seconds=QOS_WINDOW_SECONDS,
+    min_samples=QOS_MIN_SAMPLES,
+    queue_high=QOS_QUEUE_HIGH,
+    recover_ratio=QOS_RECOVER_RATIO,
+    min_dwell_seconds=QOS_MIN_DWELL_SECONDS,
+    enabled=QOS_ENABLED,
+)
+
+# Repeated frames are answered from cache; only read-only tasks are cached
+CACHEABLE_TASKS = {'describe_scene', 'read_text', 'find_object', 'answer_question', 'recognize_face', 'nearest_obstacle'}
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+    max_bytes=RESULT_CACHE_MAX_MB * 2**20,
+    hash_mode=RESULT_CACHE_HASH,
+) if RESULT_CACHE_ENABLED else None
+
+async def run_service(name: str, method: str, *args):
+    """Call a service method on that service's worker pool, loading the service first if needed."""
+    def call():
+        with services.use(name) as service:
+            return getattr(service, method)(*args)
+    return await scheduler.run(name, call)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Load all AI models on startup
-    print("Loading all AI models...")
-    vision_service.load_model()
-    object_service.load_model()
-    face_service.load_model()
-    ocr_service.load_model()
-    print("All models loaded.")
+    if MODEL_LOADING == "eager":
+        # Models load in parallel in the background; the server accepts
+        # requests right away and /ready reports when each model is up
+        print(f"Loading AI models in the background: {', '.join(ENABLED_SERVICES)}")
+        services.load_all()
+    else:
+        print(f"AI models load on first use: {', '.join(ENABLED_SERVICES)}")
     yield
-    # No cleanup needed for now
+    scheduler.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -56,82 +112,394 @@ class ProcessRequest(BaseModel):
         'describe_scene', 
         'read_text', 
         'find_object', # This will now use the new object detector
+        'nearest_obstacle', # Depth only: where the closest thing in view is
         'answer_question', 
         'time', 
         'recognize_face', # Renamed from face_detect for clarity
-        'save_face'       # New task
+        'save_face',      # New task
+        'delete_face',    # Forget a saved person (name in query_text)
+        'rename_face'     # Rename a saved person (query_text -> new_name)
     ]
     image_data: Optional[str] = None
     query_text: Optional[str] = None # Used for VQA, find_object, and save_face
+    new_name: Optional[str] = None # Used for rename_face
+    mode: Optional[Literal['fast', 'accurate']] = None # "fast" uses lighter models where available; unset lets the server choose by load
+    timings: bool = False # Add a per-stage timing breakdown (ms) to structured_data
+    roi: Optional[List[float]] = Field(None, min_length=4, max_length=4) # [x1, y1, x2, y2] pixels; read_text only reads this region
+    questions: Optional[List[str]] = None # Several questions for answer_question, answered in one batch
+    face_boxes: Optional[List[List[float]]] = None # [[x1, y1, x2, y2], ...] known face boxes; recognize_face skips full-frame detection
     conversation_history: Optional[List[ConversationTurn]] = None
 
 class ProcessResponse(BaseModel):
     result_text: str
     structured_data: Optional[dict] = None
 
+# Read-only image tasks that /process_multi can run side by side on one frame
+MultiTask = Literal['find_object', 'nearest_obstacle', 'recognize_face', 'read_text', 'describe_scene', 'answer_question']
+VISION_TASKS = {'describe_scene', 'answer_question'}
+
+class ProcessMultiRequest(BaseModel):
+    tasks: List[MultiTask] = Field(min_length=1)
+    image_data: Optional[str] = None
+    query_text: Optional[str] = None # Used for answer_question
+    object_query: Optional[str] = None # Used for find_object, e.g. "where is my phone"
+    mode: Optional[Literal['fast', 'accurate']] = None
+    timings: bool = False
+    roi: Optional[List[float]] = Field(None, min_length=4, max_length=4) # Used for read_text
+
+def invalidate_face_results():
+    """Cached recognize_face results are stale once the gallery changes."""
+    if result_cache is not None:
+        result_cache.invalidate('recognize_face')
+
+async def decode_frame(decoder, data) -> Frame:
+    """Decode an uploaded image off the event loop."""
+    try:
+        return await run_in_threadpool(decoder, data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image data: {e}")
+
+def parse_roi(roi: Optional[str]) -> Optional[List[float]]:
+    """"x1,y1,x2,y2" from a query string."""
+    if roi is None:
+        return None
+    try:
+        return [float(value) for value in roi.split(",")]
+    except ValueError:
+        raise HTTPException(status_code=422, detail='roi must be four comma separated numbers: "x1,y1,x2,y2"')
+
+def parse_face_boxes(face_boxes: Optional[str]) -> Optional[List[List[float]]]:
+    """"x1,y1,x2,y2;x1,y1,x2,y2" from a query string."""
+    if face_boxes is None:
+        return None
+    try:
+        return [[float(value) for value in box.split(",")] for box in face_boxes.split(";") if box.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail='face_boxes must be boxes of four comma separated numbers, separated by ";"')
+
+async def read_upload(http_request: Request) -> bytes:
+    """Raw image bytes from a multipart "file" field or from the request body."""
+    content_type = http_request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await http_request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail='Multipart uploads must carry the image in a "file" field')
+        return await upload.read()
+    return await http_request.body()
+
+def upload_max_side(task: str, mode: Optional[str]) -> int:
+    """The largest image side worth uploading for a task on a tier."""
+    if mode == 'fast' and task in UPLOAD_MAX_SIDE_FAST:
+        return UPLOAD_MAX_SIDE_FAST[task]
+    return UPLOAD_MAX_SIDE.get(task, UPLOAD_MAX_SIDE_DEFAULT)
+
+def response_format(http_request: Request) -> str:
+    """The response format a client asked for (?format= or Accept), checked before any work is done."""
+    try:
+        fmt = wire.negotiate_format(http_request.query_params.get("format"), http_request.headers.get("accept", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if fmt == "msgpack" and wire.msgpack is None:
+        raise HTTPException(status_code=406, detail="The msgpack format needs the msgpack package on the server")
+    return fmt
+
+def encode_response(http_request: Request, fmt: str, response: ProcessResponse, tasks: List[str],
+                    mode: Optional[str]) -> Response:
+    """
+    The response in format fmt, compressed when the client accepts gzip or
+    brotli, with the upload size hint for its tasks in X-Upload-Max-Side.
+    """
+    body, media_type = wire.encode(response.model_dump(), fmt)
+    body, encoding = wire.compress(body, http_request.headers.get("accept-encoding", ""), WIRE_COMPRESS_MIN_BYTES)
+    tier = (response.structured_data or {}).get("tier", mode)
+    headers = {
+        "X-Upload-Max-Side": str(max(upload_max_side(task, tier) for task in tasks)),
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=media_type, headers=headers)
+
 @app.post("/process_data", response_model=ProcessResponse)
-async def process_data(request: ProcessRequest):
+async def process_data(request: ProcessRequest, http_request: Request):
     """
     Processes a request containing an image and a task using the new modular services.
     """
     print(f"Received task: {request.task}")
+    fmt = response_format(http_request)
+
+    async def load_frame():
+        if request.image_data:
+            return await decode_frame(Frame.from_base64, request.image_data)
+        return None
+    response = await handle_request(request, load_frame)
+    return encode_response(http_request, fmt, response, [request.task], request.mode)
+
+@app.post("/process_upload", response_model=ProcessResponse)
+async def process_upload(http_request: Request, task: str, query_text: Optional[str] = None,
+                         new_name: Optional[str] = None, mode: Optional[str] = None, timings: bool = False,
+                         roi: Optional[str] = None, face_boxes: Optional[str] = None):
+    """
+    Same tasks as /process_data, but the image is sent as raw bytes (an
+    application/octet-stream or image/* body, or a multipart "file" field)
+    instead of base64 JSON, which saves a third of the upload size. roi is
+    given as "x1,y1,x2,y2" and face_boxes as "x1,y1,x2,y2;x1,y1,x2,y2".
+    """
+    print(f"Received task: {task}")
+    fmt = response_format(http_request)
+    try:
+        request = ProcessRequest(task=task, query_text=query_text, new_name=new_name, mode=mode, timings=timings,
+                                 roi=parse_roi(roi), face_boxes=parse_face_boxes(face_boxes))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+    async def load_frame():
+        data = await read_upload(http_request)
+        return await decode_frame(Frame.from_bytes, data) if data else None
+    response = await handle_request(request, load_frame)
+    return encode_response(http_request, fmt, response, [request.task], request.mode)
+
+async def handle_request(request: ProcessRequest, load_frame: Callable[[], Awaitable[Optional[Frame]]]) -> ProcessResponse:
+    """Decodes the image and runs the task, recording latency, stage timings and errors."""
+    with metrics.track_request(request.task) as timings:
+        try:
+            response = await run_task(request, await load_frame())
+        except HTTPException as e:
+            metrics.REQUEST_ERRORS.inc(task=request.task, code=str(e.status_code))
+            raise
+    if not request.timings:
+        return response
+    # Cached responses are shared, so the breakdown goes on a copy
+    structured_data = dict(response.structured_data or {}, timings_ms=metrics.timings_ms(timings))
+    return ProcessResponse(result_text=response.result_text, structured_data=structured_data)
+
+@app.post("/process_multi", response_model=ProcessResponse)
+async def process_multi(request: ProcessMultiRequest, http_request: Request):
+    """
+    Runs several tasks on one image in a single request, e.g. objects, faces
+    and text for "what's around me". The image is decoded once and the tasks
+    run concurrently on their own services, so the request takes about as
+    long as the slowest task rather than the sum.
+    """
+    print(f"Received tasks: {', '.join(request.tasks)}")
+    fmt = response_format(http_request)
+
+    async def load_frame():
+        if request.image_data:
+            return await decode_frame(Frame.from_base64, request.image_data)
+        return None
+    response = await handle_multi_request(request, load_frame)
+    return encode_response(http_request, fmt, response, list(request.tasks), request.mode)
+
+@app.post("/process_multi_upload", response_model=ProcessResponse)
+async def process_multi_upload(http_request: Request, tasks: str, query_text: Optional[str] = None,
+                               object_query: Optional[str] = None, mode: Optional[str] = None,
+                               timings: bool = False, roi: Optional[str] = None):
+    """Same as /process_multi with the image sent as raw bytes and tasks comma separated."""
+    print(f"Received tasks: {tasks}")
+    fmt = response_format(http_request)
+    try:
+        request = ProcessMultiRequest(tasks=[task.strip() for task in tasks.split(",") if task.strip()],
+                                      query_text=query_text, object_query=object_query, mode=mode,
+                                      timings=timings, roi=parse_roi(roi))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
 
-    image = None
-    if request.image_data:
+    async def load_frame():
+        data = await read_upload(http_request)
+        return await decode_frame(Frame.from_bytes, data) if data else None
+    response = await handle_multi_request(request, load_frame)
+    return encode_response(http_request, fmt, response, list(request.tasks), request.mode)
+
+async def handle_multi_request(request: ProcessMultiRequest,
+                               load_frame: Callable[[], Awaitable[Optional[Frame]]]) -> ProcessResponse:
+    """
+    Decodes the image once and runs every task on it concurrently. A task that
+    fails is reported in its own entry; the request only fails when all do.
+    """
+    tasks = list(dict.fromkeys(request.tasks))
+    with metrics.track_request("multi") as timings:
         try:
-            image_bytes = base64.b64decode(request.image_data)
-            # Convert to numpy array for OpenCV compatibility
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            cv_image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            # Convert to PIL Image for vision models
-            image = Image.fromarray(cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB))
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid image data: {e}")
+            frame = await load_frame()
+            if frame is None:
+                raise HTTPException(status_code=400, detail="Image data is required for process_multi")
+            # Build the views the services share up front, so tasks running
+            # side by side don't each convert the frame
+            await run_in_threadpool(lambda: frame.pil if VISION_TASKS & set(tasks) else frame.rgb)
+        except HTTPException as e:
+            metrics.REQUEST_ERRORS.inc(task="multi", code=str(e.status_code))
+            raise
+        outcomes = await asyncio.gather(*(run_subtask(request, task, frame) for task in tasks))
+
+    errors = [error for _, error in outcomes if error is not None]
+    if len(errors) == len(tasks):
+        raise errors[0]
+
+    results, texts = {}, []
+    for task, (result, error) in zip(tasks, outcomes):
+        if error is not None:
+            results[task] = {"error": error.detail, "status_code": error.status_code}
+            continue
+        results[task] = result
+        texts.append(result["result_text"].rstrip(". ") + ".")
+    structured_data = {"tasks": results}
+    if request.timings:
+        structured_data["timings_ms"] = metrics.timings_ms(timings)
+    return ProcessResponse(result_text=" ".join(texts), structured_data=structured_data)
+
+async def run_subtask(request: ProcessMultiRequest, task: str, frame: Frame):
+    """One task of a multi-task request, as (result dict, None) or (None, HTTPException)."""
+    # Each task gets only its own query: a question like "is the person
+    # holding a cup?" must not become find_object's class filter
+    query_text = {'answer_question': request.query_text, 'find_object': request.object_query}.get(task)
+    sub_request = ProcessRequest(task=task, query_text=query_text, mode=request.mode, roi=request.roi)
+    with metrics.track_request(task) as timings:
+        try:
+            response = await run_task(sub_request, frame)
+        except HTTPException as e:
+            metrics.REQUEST_ERRORS.inc(task=task, code=str(e.status_code))
+            return None, e
+    result = response.model_dump()
+    if request.timings:
+        result["timings_ms"] = metrics.timings_ms(timings)
+    return result, None
+
+def cache_variant(request: ProcessRequest) -> Optional[str]:
+    """Keeps apart cached results computed with different models, regions or face galleries."""
+    if request.task == 'answer_question' and request.questions:
+        return f"{request.mode}:questions=" + "\n".join(q.strip().lower() for q in request.questions)
+    if request.task == 'read_text' and request.roi is not None:
+        return f"{request.mode}:roi={','.join(f'{v:g}' for v in request.roi)}"
+    if request.task == 'recognize_face':
+        variant = request.mode
+        face_service = services.peek("face")
+        if face_service is not None:
+            # With several worker processes another one may have changed the
+            # saved faces, which invalidate_face_results() here cannot see
+            variant = f"{variant}:{face_service.gallery_version()}"
+        if request.face_boxes is not None:
+            # Box-guided and full-frame results for one image differ, whether
+            # or not the face service is loaded yet
+            boxes = ";".join(",".join(f"{v:g}" for v in box) for box in request.face_boxes)
+            variant = f"{variant}:boxes={hashlib.sha1(boxes.encode()).hexdigest()[:16]}"
+        return variant
+    return request.mode
+
+def position_text(box: List[float], width: int) -> str:
+    where = direction((box[0] + box[2]) / 2, width)
+    return "ahead" if where == "ahead" else f"on your {where}"
 
+def object_models(mode: Optional[str]) -> tuple:
+    """(MiDaS model type, YOLO weights) for a tier."""
+    if mode == 'fast':
+        return MIDAS_FAST_MODEL_TYPE, YOLO_FAST_MODEL_PATH
+    return MIDAS_MODEL_TYPE, YOLO_MODEL_PATH
+
+async def run_task(request: ProcessRequest, frame: Optional[Frame]) -> ProcessResponse:
+    """Runs one task on an already decoded frame, answering repeats from the result cache."""
+    if request.task in TIERED_TASKS:
+        request = request.model_copy(update={"mode": qos.resolve(request.task, request.mode)})
+    if result_cache is None or frame is None or request.task not in CACHEABLE_TASKS:
+        return await execute_timed(request, frame)
+
+    cache_key = result_cache.key(request.task, request.query_text, frame, cache_variant(request))
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return ProcessResponse(**cached)
+    generation = result_cache.generation(request.task)
+    response = await execute_timed(request, frame)
+    result_cache.put(cache_key, response.model_dump(), generation)
+    return response
+
+async def execute_timed(request: ProcessRequest, frame: Optional[Frame]) -> ProcessResponse:
+    """execute_task, reporting the latency of tiered tasks to the QoS controller."""
+    started = time.perf_counter()
+    response = await execute_task(request, frame)
+    if request.task in TIERED_TASKS:
+        qos.observe(request.task, request.mode, time.perf_counter() - started)
+    return response
+
+async def execute_task(request: ProcessRequest, frame: Optional[Frame]) -> ProcessResponse:
     result_text = ""
     structured_data = None
 
     try:
         if request.task == 'describe_scene':
-            if not image:
+            if frame is None:
                 raise HTTPException(status_code=400, detail="Image data is required for describe_scene")
-            result_text = vision_service.describe_scene(image)
+            result_text = await run_service("vision", "describe_scene", frame.pil)
 
         elif request.task == 'read_text':
-            if not image:
+            if frame is None:
                 raise HTTPException(status_code=400, detail="Image data is required for read_text")
-            ocr_results = ocr_service.read(np.array(image))
+            ocr_results = await run_service("ocr", "read", frame.rgb, request.mode, request.roi)
             result_text = " ".join([res['text'] for res in ocr_results]) if ocr_results else "No text found."
             structured_data = {"ocr_results": ocr_results}
 
         elif request.task == 'find_object':
-            if not image:
+            if frame is None:
                 raise HTTPException(status_code=400, detail="Image data is required for find_object")
-            # The new object detector doesn't need a query text, it finds all objects
-            detected_objects = object_service.detect(np.array(image))
-            if detected_objects:
+            # A query naming objects ("where is the chair") restricts
+            # detection to those classes; any other query finds everything
+            targets = query_targets(request.query_text)
+            detected_objects = await run_service("object", "detect", frame.bgr, frame.rgb,
+                                                 *object_models(request.mode), targets)
+            width = frame.rgb.shape[1]
+            # MiDaS depth is relative, so distances are said relative to the
+            # rest of the frame ("very close", "nearby", "farther away")
+            if targets and detected_objects:
+                # Objects come ranked: confident and nearest first
+                summary = [f"{obj['name']} {obj['distance']} {position_text(obj['box'], width)}"
+                           for obj in detected_objects[:3]]
+                result_text = "Found " + ", ".join(summary)
+            elif targets:
+                result_text = f"I could not find a {' or '.join(targets)}."
+            elif detected_objects:
                 # Create a summary string
                 summary = []
                 for obj in detected_objects[:5]: # Report top 5
-                    summary.append(f"{obj['name']} at {obj['depth_m']:.1f} meters")
+                    summary.append(f"{obj['name']} {obj['distance']}")
                 result_text = "I see: " + ", ".join(summary)
             else:
                 result_text = "I could not detect any objects."
-            structured_data = {"objects": detected_objects}
+            structured_data = {"objects": detected_objects, "targets": targets}
+
+        elif request.task == 'nearest_obstacle':
+            if frame is None:
+                raise HTTPException(status_code=400, detail="Image data is required for nearest_obstacle")
+            # Depth only, on the light MiDaS model unless accurate is asked for
+            depth_model = MIDAS_MODEL_TYPE if request.mode == 'accurate' else MIDAS_FAST_MODEL_TYPE
+            grid = await run_service("object", "depth_grid", frame.rgb, depth_model,
+                                     OBSTACLE_GRID_ROWS, OBSTACLE_GRID_COLS)
+            nearest = nearest_cell(grid, OBSTACLE_CLOSE_RATIO)
+            where = "ahead" if nearest["direction"] == "ahead" else f"on your {nearest['direction']}"
+            if nearest["close"]:
+                result_text = f"Something is close {where}, {nearest['height']}."
+            else:
+                result_text = f"Nothing close. The nearest thing is {where}."
+            structured_data = {"nearest": nearest, "grid": [[round(float(v), 3) for v in row] for row in grid]}
 
         elif request.task == 'answer_question':
-            if not image or not request.query_text:
-                raise HTTPException(status_code=400, detail="Image data and query_text are required")
-            result_text = vision_service.answer_question(image, request.query_text)
+            if frame is None or not (request.query_text or request.questions):
+                raise HTTPException(status_code=400, detail="Image data and query_text (or questions) are required")
+            if request.questions:
+                answers = await run_service("vision", "answer_questions", frame.pil, request.questions, frame.digest)
+                result_text = " ".join(f"{question.rstrip('?')}? {answer}." for question, answer in zip(request.questions, answers))
+                structured_data = {"answers": [{"question": q, "answer": a} for q, a in zip(request.questions, answers)]}
+            else:
+                result_text = await run_service("vision", "answer_question", frame.pil, request.query_text, frame.digest)
 
         elif request.task == 'time':
             now = datetime.datetime.now()
             result_text = f"The current time is {now.strftime('%H:%M')}"
 
         elif request.task == 'recognize_face':
-            if not image:
+            if frame is None:
                 raise HTTPException(status_code=400, detail="Image data is required for recognize_face")
-            recognized_persons = face_service.recognize(np.array(image))
+            if request.face_boxes is not None and any(len(box) != 4 for box in request.face_boxes):
+                raise HTTPException(status_code=400, detail="Each face box must be [x1, y1, x2, y2]")
+            recognized_persons = await run_service("face", "recognize", frame.bgr, request.face_boxes, request.mode)
             if recognized_persons:
                 known_persons = [p['name'] for p in recognized_persons if p['name'] != 'Unknown']
                 if known_persons:
@@ -143,25 +511,344 @@ async def process_data(request: ProcessRequest):
             structured_data = {"faces": recognized_persons}
 
         elif request.task == 'save_face':
-            if not image or not request.query_text:
+            if frame is None or not request.query_text:
                 raise HTTPException(status_code=400, detail="Image and a name (in query_text) are required to save a face.")
-            success = face_service.save_face(request.query_text, np.array(image))
+            success = await run_service("face", "save_face", request.query_text, frame.bgr)
+            invalidate_face_results()
             if success:
                 result_text = f"Successfully saved face for {request.query_text}."
             else:
                 result_text = f"Could not save face for {request.query_text}. Make sure a face is clearly visible."
 
+        elif request.task == 'delete_face':
+            if not request.query_text:
+                raise HTTPException(status_code=400, detail="A name (in query_text) is required to delete a face.")
+            removed = await run_service("face", "delete_face", request.query_text)
+            invalidate_face_results()
+            if removed:
+                result_text = f"Forgot {request.query_text}."
+            else:
+                result_text = f"No saved face found for {request.query_text}."
+            structured_data = {"removed": removed}
+
+        elif request.task == 'rename_face':
+            if not request.query_text or not request.new_name:
+                raise HTTPException(status_code=400, detail="query_text (current name) and new_name are required to rename a face.")
+            renamed = await run_service("face", "rename_face", request.query_text, request.new_name)
+            invalidate_face_results()
+            if renamed:
+                result_text = f"Renamed {request.query_text} to {request.new_name}."
+            else:
+                result_text = f"No saved face found for {request.query_text}."
+            structured_data = {"renamed": renamed}
+
         else:
             raise HTTPException(status_code=400, detail="Invalid task")
             
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        # Reject fast instead of letting latency pile up behind a busy model
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ServiceUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
     if not result_text:
         result_text = "I'm sorry, I couldn't process the request."
+    if request.task in TIERED_TASKS:
+        structured_data = dict(structured_data or {}, tier=request.mode)
 
     return ProcessResponse(result_text=result_text, structured_data=structured_data)
 
+# --- Face gallery administration ---
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+async def run_face_admin(method: str, *args):
+    """A face service call, with the same error statuses as /process_data."""
+    try:
+        return await run_service("face", method, *args)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ServiceUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def read_archive(data: bytes, name: Optional[str]) -> Dict[str, List[bytes]]:
+    """Photos in a zip file, grouped by their folder (photos at the top level belong to name)."""
+    photos = {}
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for info in archive.infolist():
+                parts = info.filename.split("/")
+                if info.is_dir() or parts[0] == "__MACOSX" or parts[-1].startswith("."):
+                    continue
+                if os.path.splitext(parts[-1])[1].lower() not in IMAGE_EXTENSIONS:
+                    continue
+                person = parts[-2] if len(parts) > 1 else name
+                if person:
+                    photos.setdefault(person, []).append(archive.read(info))
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {e}")
+    return photos
+
+def decode_photos(photos: Dict[str, List[bytes]]) -> Dict[str, list]:
+    """BGR arrays of the photos that decode; the others are left out."""
+    decoded = {}
+    for person, images in photos.items():
+        decoded[person] = []
+        for data in images:
+            try:
+                decoded[person].append(Frame.from_bytes(data).bgr)
+            except Exception:
+                logger.warning(f"Skipping an enrollment photo of {person} that could not be decoded")
+    return decoded
+
+@app.post("/faces/enroll", response_model=ProcessResponse)
+async def enroll_faces(http_request: Request, name: Optional[str] = None, replace: bool = False):
+    """
+    Bulk enrollment. A multipart form with any number of "file" fields (photos
+    of the person in ?name=) and "archive" fields (zip files with one folder of
+    photos per person). Everyone is committed in one write, as a mean template
+    plus exemplars; replace=true forgets their earlier faces first.
+    """
+    form = await http_request.form()
+    photos: Dict[str, List[bytes]] = {}
+    for field, value in form.multi_items():
+        if isinstance(value, str):
+            continue
+        data = await value.read()
+        if field == "archive":
+            for person, images in (await run_in_threadpool(read_archive, data, name)).items():
+                photos.setdefault(person, []).extend(images)
+        elif field == "file":
+            if not name:
+                raise HTTPException(status_code=400, detail='Photos in "file" fields need a ?name=')
+            photos.setdefault(name, []).append(data)
+    count = sum(len(images) for images in photos.values())
+    if not count:
+        raise HTTPException(status_code=400, detail='No photos found in "file" or "archive" fields')
+    if count > FACE_ENROLL_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {FACE_ENROLL_MAX_IMAGES} photos per request")
+
+    with metrics.track_request("enroll_faces"):
+        identities = await run_in_threadpool(decode_photos, photos)
+        report = await run_face_admin("enroll_faces", identities, replace)
+    invalidate_face_results()
+    enrolled = [person for person, entry in report.items() if entry["stored"]]
+    missing = [person for person, entry in report.items() if not entry["stored"]]
+    result_text = f"Enrolled {len(enrolled)} people from {count} photos."
+    if missing:
+        result_text += f" No usable face found for {', '.join(missing)}."
+    return ProcessResponse(result_text=result_text, structured_data={"people": report})
+
+@app.get("/faces/export")
+async def export_faces():
+    """The saved faces as an .npz file that /faces/import accepts on another server."""
+    data = await run_face_admin("export_gallery")
+    return Response(data, media_type="application/octet-stream",
+                    headers={"Content-Disposition": 'attachment; filename="face_gallery.npz"'})
+
+@app.post("/faces/import", response_model=ProcessResponse)
+async def import_faces(http_request: Request, replace: bool = False):
+    """
+    Load a /faces/export file (raw body or multipart "file" field) without
+    recomputing embeddings. replace=true forgets all saved faces first.
+    """
+    data = await read_upload(http_request)
+    if not data:
+        raise HTTPException(status_code=400, detail="An exported face gallery is required")
+    imported = await run_face_admin("import_gallery", data, replace)
+    invalidate_face_results()
+    return ProcessResponse(result_text=f"Imported {imported} saved faces.", structured_data={"imported": imported})
+
+@app.post("/process_stream")
+async def process_stream(request: ProcessRequest):
+    """
+    describe_scene or answer_question as server-sent events, so speech can
+    start before generation finishes. Each piece of text arrives as
+    'data: {"text": ...}'; a final 'event: done' carries the full
+    result_text, or 'event: error' the error detail and status code.
+    """
+    print(f"Received streaming task: {request.task}")
+    if request.task not in VISION_TASKS:
+        raise HTTPException(status_code=400, detail="Only describe_scene and answer_question can be streamed")
+    if not request.image_data or (request.task == 'answer_question' and not request.query_text):
+        raise HTTPException(status_code=400, detail="Image data (and query_text for answer_question) is required")
+    frame = await decode_frame(Frame.from_base64, request.image_data)
+
+    loop = asyncio.get_running_loop()
+    pieces = asyncio.Queue()
+
+    def on_text(text: str):
+        # Called on the vision worker thread for each newly generated piece
+        loop.call_soon_threadsafe(pieces.put_nowait, text)
+
+    async def generate() -> str:
+        try:
+            if request.task == 'describe_scene':
+                return await run_service("vision", "describe_scene", frame.pil, on_text)
+            return await run_service("vision", "answer_question", frame.pil, request.query_text, frame.digest, on_text)
+        finally:
+            loop.call_soon_threadsafe(pieces.put_nowait, None)
+
+    async def events():
+        with metrics.track_request(f"{request.task}_stream"):
+            generation = asyncio.create_task(generate())
+            while (text := await pieces.get()) is not None:
+                yield f"data: {json.dumps({'text': text})}\n\n"
+            try:
+                result_text = await generation
+            except (QueueFullError, ServiceUnavailableError) as e:
+                yield f"event: error\ndata: {json.dumps({'detail': str(e), 'status_code': 503})}\n\n"
+                return
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'detail': str(e), 'status_code': 500})}\n\n"
+                return
+            yield f"event: done\ndata: {json.dumps({'result_text': result_text})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.websocket("/stream")
+async def stream(websocket: WebSocket, tasks: str = "find_object", mode: Optional[str] = None):
+    """
+    Continuous navigation stream. The client sends encoded frames as binary
+    messages; the server runs the requested tasks (find_object and/or
+    recognize_face, comma separated) on the newest frame and pushes only what
+    changed: new, moved, closer or gone objects and faces that appeared or left.
+    Frames that arrive while inference is busy replace the waiting one.
+    mode ("fast" or "accurate") picks the object models for the whole
+    session; without it the QoS tier at connection time is used.
+    """
+    requested = [task.strip() for task in tasks.split(",") if task.strip()]
+    await websocket.accept()
+    if not requested or any(task not in STREAM_TASKS for task in requested):
+        await websocket.close(code=1008, reason=f"tasks must be a comma separated subset of {', '.join(STREAM_TASKS)}")
+        return
+    if mode not in (None, 'fast', 'accurate'):
+        await websocket.close(code=1008, reason="mode must be fast or accurate")
+        return
+
+    # The tier is fixed per session: the large and small MiDaS models have
+    # different relative depth scales, so switching mid-stream would make the
+    # tracker report objects as closer or moved when nothing changed
+    depth_model, yolo_weights = object_models(qos.resolve("find_object", mode))
+    session = StreamSession(
+        detect_objects=lambda frame: run_service("object", "detect", frame.bgr, frame.rgb, depth_model, yolo_weights),
+        recognize_faces=lambda frame, boxes=None: run_service("face", "recognize", frame.bgr, boxes),
+        tasks=requested,
+        detect_interval=STREAM_DETECT_INTERVAL,
+        reuse_distance=STREAM_REUSE_MAX_DISTANCE,
+        face_interval=STREAM_FACE_INTERVAL,
+        face_redetect_interval=STREAM_FACE_REDETECT_INTERVAL,
+    )
+    slot = LatestFrameSlot()
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                slot.put(message["bytes"])
+
+    async def process_frames():
+        while True:
+            data = await slot.take()
+            try:
+                with metrics.track_request("stream"):
+                    frame = await run_in_threadpool(Frame.from_bytes, data)
+                    update = await session.process(frame)
+            except QueueFullError:
+                # The model is saturated; the next frame will be fresher anyway
+                slot.dropped += 1
+                continue
+            except ServiceUnavailableError as e:
+                await websocket.close(code=1011, reason=str(e))
+                return
+            except ValueError as e:
+                await websocket.send_json({"error": f"Invalid image data: {e}"})
+                continue
+            if update is not None:
+                update["dropped"] = slot.dropped
+                await websocket.send_json(update)
+
+    receiver = asyncio.create_task(receive_frames())
+    processor = asyncio.create_task(process_frames())
+    try:
+        done, _ = await asyncio.wait({receiver, processor}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None and not isinstance(task.exception(), WebSocketDisconnect):
+                logger.error(f"Stream session failed: {task.exception()}")
+    finally:
+        receiver.cancel()
+        processor.cancel()
+    logger.info(f"Stream closed: {session.stats()}, dropped {slot.dropped} frames")
+
+@app.get("/ready")
+async def ready(service: Optional[str] = None):
+    """
+    Readiness probe. 200 once every enabled service (or the one named in
+    ?service=) can take requests, 503 before that. The body reports each
+    model's load state and load time either way.
+    """
+    if service is not None and service not in services.entries:
+        raise HTTPException(status_code=404, detail=f"Unknown service {service}")
+    is_ready = services.ready(service)
+    content = {"ready": is_ready, "loading": MODEL_LOADING, "services": services.status()}
+    return JSONResponse(content, status_code=200 if is_ready else 503)
+
+@app.get("/upload_hints")
+async def upload_hints():
+    """
+    How clients should send images: the largest useful side per task (per
+    tier), the JPEG quality to encode at, and the response formats and
+    compressions this server offers.
+    """
+    return {
+        "max_side": {task: upload_max_side(task, None) for task in UPLOAD_MAX_SIDE},
+        "fast_max_side": {task: upload_max_side(task, 'fast') for task in UPLOAD_MAX_SIDE},
+        "default_max_side": UPLOAD_MAX_SIDE_DEFAULT,
+        "jpeg_quality": UPLOAD_JPEG_QUALITY,
+        "formats": [fmt for fmt in wire.FORMATS if fmt != "msgpack" or wire.msgpack is not None],
+        "encodings": (["br"] if wire.brotli is not None else []) + ["gzip"],
+    }
+
+@app.get("/stats")
+async def stats():
+    """Worker pool, micro-batching, result cache, QoS, model memory and stale saved face statistics."""
+    object_service = services.peek("object")
+    face_service = services.peek("face")
+    return {
+        "pools": scheduler.stats(),
+        "object_batching": object_service.batch_stats() if object_service is not None else {},
+        "result_cache": result_cache.stats() if result_cache is not None else None,
+        "qos": qos.stats(),
+        "model_memory": services.memory_stats(),
+        "stale_faces": face_service.stale_faces() if face_service is not None else None,
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus metrics: request and per-stage latency histograms, queue wait
+    times, in-flight requests, worker pool state, model memory and error counts.
+    """
+    for name, pool in scheduler.stats().items():
+        metrics.POOL_RUNNING.set(pool["running"], pool=name)
+        metrics.POOL_WAITING.set(pool["waiting"], pool=name)
+        metrics.POOL_REJECTED.set(pool["rejected"], pool=name)
+    for name in services.entries:
+        service = services.peek(name)
+        if service is None:
+            metrics.update_model_memory(name, None)
+        elif hasattr(service, "memory_footprint"):
+            metrics.update_model_memory(name, service.memory_footprint())
+    metrics.update_process_memory()
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
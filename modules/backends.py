@@ -0,0 +1,149 @@
+"""
+Inference Backends - ONNX export, INT8 quantization and shared ONNX Runtime sessions
+
+MODEL_BACKEND in config.py selects how YOLO and MiDaS run:
+    "torch"  eager PyTorch, as loaded.
+    "onnx"   exported once to ONNX (cached in MODEL_CACHE_DIR), optionally
+             INT8 dynamic-quantized, and run on ONNX Runtime. YOLO keeps
+             using ultralytics for pre/post-processing on top of its own ORT
+             session; MiDaS runs through a shared SessionPool.
+MODEL_QUANTIZE additionally quantizes the captioning/VQA transformers' Linear
+layers to INT8 on CPU. Delete MODEL_CACHE_DIR to force a new export.
+"""
+import os
+import queue
+import logging
+import threading
+import weakref
+from typing import Dict, List, Optional
+import numpy as np
+import torch
+from config import (
+    MODEL_BACKEND, MODEL_QUANTIZE, MODEL_CACHE_DIR,
+    ONNX_SESSION_POOL_SIZE, ONNX_INTRA_OP_THREADS, ONNX_INTER_OP_THREADS,
+)
+
+logger = logging.getLogger(__name__)
+
+def _providers() -> List[str]:
+    return ['CUDAExecutionProvider', 'CPUExecutionProvider'] if torch.cuda.is_available() else ['CPUExecutionProvider']
+
+class SessionPool:
+    """
+    size ONNX Runtime sessions for one model file. Each run borrows a whole
+    session, so at most size runs execute at once and each uses a fixed
+    number of intra-op threads instead of all of them fighting over cores.
+    """
+
+    def __init__(self, path: str, size: int = 1, intra_op_threads: int = 0, inter_op_threads: int = 0,
+                 providers: Optional[List[str]] = None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        self.path = path
+        self._sessions = queue.Queue()
+        for _ in range(max(1, size)):
+            self._sessions.put(ort.InferenceSession(path, options, providers=providers or _providers()))
+        session = self._sessions.queue[0]
+        self.input_names = [i.name for i in session.get_inputs()]
+        self.output_names = [o.name for o in session.get_outputs()]
+
+    def run(self, feeds: Dict[str, np.ndarray]) -> List[np.ndarray]:
+        session = self._sessions.get()
+        try:
+            return session.run(self.output_names, feeds)
+        finally:
+            self._sessions.put(session)
+
+# Pools are dropped with the last model using them, so an unloaded service
+# frees its sessions
+_pools: "weakref.WeakValueDictionary[str, SessionPool]" = weakref.WeakValueDictionary()
+_pools_lock = threading.Lock()
+
+def session_pool(path: str) -> SessionPool:
+    """The shared session pool for a model file, created on first use."""
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = SessionPool(path, ONNX_SESSION_POOL_SIZE, ONNX_INTRA_OP_THREADS, ONNX_INTER_OP_THREADS)
+            _pools[path] = pool
+        return pool
+
+class OnnxModule:
+    """Calls an ONNX model like the torch module it was exported from (one tensor in, one out)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pool = session_pool(path)
+
+    def __call__(self, inputs: torch.Tensor) -> torch.Tensor:
+        outputs = self.pool.run({self.pool.input_names[0]: inputs.detach().cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+    @property
+    def nbytes(self) -> int:
+        return os.path.getsize(self.path)
+
+def cache_path(name: str, suffix: str = ".onnx") -> str:
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    return os.path.join(MODEL_CACHE_DIR, name + suffix)
+
+def quantize_onnx(path: str) -> str:
+    """INT8 dynamic quantization of an ONNX model's weights (cached next to it)."""
+    quantized = path[:-len(".onnx")] + ".int8.onnx"
+    if not os.path.exists(quantized):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        logger.info(f"Quantizing {path} to INT8...")
+        quantize_dynamic(path, quantized + ".tmp", weight_type=QuantType.QInt8)
+        os.replace(quantized + ".tmp", quantized)
+    return quantized
+
+def quantize_torch(module: torch.nn.Module) -> torch.nn.Module:
+    """INT8 dynamic quantization of a module's Linear layers, in place (CPU only)."""
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def load_yolo(weights: str, backend: str = MODEL_BACKEND, quantize: bool = MODEL_QUANTIZE):
+    """An ultralytics YOLO model on the given backend."""
+    from ultralytics import YOLO
+    if backend != "onnx":
+        return YOLO(weights)
+    path = cache_path(os.path.splitext(os.path.basename(weights))[0])
+    if not os.path.exists(path):
+        logger.info(f"Exporting {weights} to ONNX...")
+        exported = YOLO(weights).export(format="onnx", imgsz=640, dynamic=True)
+        os.replace(exported, path)
+    if quantize:
+        path = quantize_onnx(path)
+    return YOLO(path, task="detect")
+
+def compile_midas(model: torch.nn.Module, model_type: str, example: torch.Tensor,
+                  backend: str = MODEL_BACKEND, quantize: bool = MODEL_QUANTIZE):
+    """
+    The MiDaS model on the given backend. example is one transformed input;
+    batch size, height and width stay dynamic in the export.
+    """
+    if backend != "onnx":
+        if quantize and not torch.cuda.is_available():
+            quantize_torch(model)
+        return model
+    path = cache_path(f"midas_{model_type}")
+    if not os.path.exists(path):
+        logger.info(f"Exporting MiDaS {model_type} to ONNX...")
+        with torch.no_grad():
+            torch.onnx.export(model.cpu(), example.cpu(), path + ".tmp", input_names=["image"], output_names=["depth"],
+                              dynamic_axes={"image": {0: "batch", 2: "height", 3: "width"},
+                                            "depth": {0: "batch", 1: "height", 2: "width"}},
+                              opset_version=17)
+        os.replace(path + ".tmp", path)
+    if quantize:
+        path = quantize_onnx(path)
+    return OnnxModule(path)
+
+def compile_transformer(model: torch.nn.Module) -> torch.nn.Module:
+    """Captioning/VQA models stay in PyTorch; MODEL_QUANTIZE makes their Linear layers INT8 on CPU."""
+    if MODEL_QUANTIZE and model.device.type == "cpu":
+        quantize_torch(model)
+    return model
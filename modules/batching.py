@@ -0,0 +1,150 @@
+"""
+Micro-Batching Engine - Groups concurrent inference requests into batches
+"""
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+from modules.metrics import deferred_stages, record_stage, replay_stages
+
+logger = logging.getLogger(__name__)
+
+class BatchStats:
+    """Batch size histogram plus queue wait and forward time totals."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batch_sizes = Counter()
+        self.batches = 0
+        self.items = 0
+        self.queue_wait_ms_total = 0.0
+        self.queue_wait_ms_max = 0.0
+        self.forward_ms_total = 0.0
+        self.forward_ms_max = 0.0
+
+    def record(self, batch_size: int, queue_waits_ms: List[float], forward_ms: float):
+        with self._lock:
+            self.batch_sizes[batch_size] += 1
+            self.batches += 1
+            self.items += batch_size
+            self.queue_wait_ms_total += sum(queue_waits_ms)
+            self.queue_wait_ms_max = max(self.queue_wait_ms_max, max(queue_waits_ms))
+            self.forward_ms_total += forward_ms
+            self.forward_ms_max = max(self.forward_ms_max, forward_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+                "mean_queue_wait_ms": self.queue_wait_ms_total / self.items if self.items else 0.0,
+                "max_queue_wait_ms": self.queue_wait_ms_max,
+                "mean_forward_ms": self.forward_ms_total / self.batches if self.batches else 0.0,
+                "max_forward_ms": self.forward_ms_max,
+            }
+
+class _Pending:
+    __slots__ = ("item", "future", "enqueued_at", "started_at")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+        self.started_at = None
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads for up to max_batch_size items
+    or max_wait_ms milliseconds, runs process_batch once on the whole batch and
+    hands every caller its own result.
+
+    process_batch takes a list of items and must return a list of results in
+    the same order. Any callable works, so a stub model can stand in for the
+    real one when testing on CPU.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 4, max_wait_ms: float = 10.0, name: str = "batcher"):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.stats = BatchStats()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, item: Any) -> Any:
+        """Queue an item and block until its batch has been processed."""
+        if self._closed:
+            raise RuntimeError(f"{self.name} is closed")
+        self._ensure_worker()
+        pending = _Pending(item)
+        self._queue.put(pending)
+        result, stages = pending.future.result()
+        # Stages timed on the worker are shared by the whole batch; record
+        # them for this caller's request too
+        record_stage("batch_wait", pending.started_at - pending.enqueued_at)
+        replay_stages(stages)
+        return result
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name=f"{self.name}-worker", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        """Return the next batch and whether the stop sentinel was seen."""
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                pending = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is None:
+                return batch, True
+            batch.append(pending)
+        return batch, False
+
+    def _worker(self):
+        stop = False
+        while not stop:
+            batch, stop = self._collect()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            waits_ms = []
+            for p in batch:
+                p.started_at = started
+                waits_ms.append((started - p.enqueued_at) * 1000)
+            try:
+                with deferred_stages() as stages:
+                    results = self.process_batch([p.item for p in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name} returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                logger.error(f"Error in {self.name} batch of {len(batch)}: {e}")
+                for p in batch:
+                    p.future.set_exception(e)
+                continue
+            self.stats.record(len(batch), waits_ms, (time.perf_counter() - started) * 1000)
+            for p, result in zip(batch, results):
+                p.future.set_result((result, stages))
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
@@ -0,0 +1,245 @@
+"""
+Face Gallery - Normalized embedding matrix with vectorized top-k matching
+"""
+import logging
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """Return float32 rows scaled to unit length (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def aggregate_templates(embeddings: np.ndarray, max_exemplars: int = 4, min_similarity: float = 0.3,
+                        duplicate_similarity: float = 0.95) -> Tuple[np.ndarray, List[str], int]:
+    """
+    Reduce many embeddings of one person to a mean template plus exemplars.
+
+    Embeddings less similar than min_similarity to the mean are dropped as
+    outliers. Exemplars are picked farthest-first, each being the photo least
+    similar to everything chosen so far, until max_exemplars or until the rest
+    are near-duplicates. Returns the rows, their kinds ("template" or
+    "exemplar") and the number of outliers.
+    """
+    vectors = l2_normalize(np.reshape(embeddings, (len(embeddings), -1)))
+    mean = l2_normalize(vectors.mean(axis=0))
+    keep = vectors @ mean >= min_similarity
+    outliers = int(len(vectors) - keep.sum())
+    if keep.any() and outliers:
+        vectors = vectors[keep]
+        mean = l2_normalize(vectors.mean(axis=0))
+    else:
+        outliers = 0
+
+    chosen = []
+    covered = vectors @ mean
+    while len(chosen) < min(max_exemplars, len(vectors)):
+        i = int(np.argmin(covered))
+        if covered[i] >= duplicate_similarity:
+            break
+        chosen.append(i)
+        covered = np.maximum(covered, vectors @ vectors[i])
+    rows = np.vstack([mean[None, :], vectors[chosen]])
+    return rows, ["template"] + ["exemplar"] * len(chosen), outliers
+
+class IVFIndex:
+    """
+    Inverted-file approximate index in pure NumPy.
+
+    Gallery rows are clustered with spherical k-means; a query is scored
+    exactly against the rows of its nprobe closest clusters only.
+    """
+
+    def __init__(self, nprobe: int = 8, iterations: int = 10, seed: int = 0):
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.lists = []
+        self.trained_size = 0
+
+    def train(self, matrix: np.ndarray):
+        n = len(matrix)
+        nlist = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(self.seed)
+        centroids = matrix[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignment = np.argmax(matrix @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = matrix[assignment == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = l2_normalize(centroids)
+        assignment = np.argmax(matrix @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [np.flatnonzero(assignment == c).tolist() for c in range(nlist)]
+        self.trained_size = n
+        logger.info(f"Trained IVF face index with {nlist} lists over {n} embeddings.")
+
+    def add(self, row: int, vector: np.ndarray):
+        self.lists[int(np.argmax(self.centroids @ vector))].append(row)
+
+    def candidates(self, queries: np.ndarray) -> List[np.ndarray]:
+        """Row indices to score exactly, one array per query."""
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        return [np.fromiter((r for c in row for r in self.lists[c]), dtype=np.int64) for row in probes]
+
+class FaceGallery:
+    """
+    Enrolled faces as one contiguous, L2-normalized float32 matrix.
+
+    Rows are appended in place (the buffer grows geometrically), so enrolling
+    a face never rebuilds the matrix, and every face in a frame is matched with
+    a single matrix multiply. Above ann_threshold rows an IVF index restricts
+    scoring to the closest clusters.
+    """
+
+    def __init__(self, dim: int = 512, ann_threshold: Optional[int] = None, nprobe: int = 8):
+        self.dim = dim
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        self.names = []
+        self._buffer = np.empty((0, dim), dtype=np.float32)
+        self._size = 0
+        self._index = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._buffer[:self._size]
+
+    def load(self, names: Sequence[str], embeddings: Any, normalized: bool = False):
+        """
+        Replace the gallery contents with the given names and embeddings.
+        Already normalized float32 embeddings (e.g. a memory map) are used
+        without copying until the next add().
+        """
+        with self._lock:
+            self.names = list(names)
+            self._size = len(self.names)
+            if self._size and normalized:
+                self._buffer = np.asarray(embeddings, dtype=np.float32).reshape(self._size, -1)
+                self.dim = self._buffer.shape[1]
+            elif self._size:
+                self._buffer = l2_normalize(np.reshape(embeddings, (self._size, -1)))
+                self.dim = self._buffer.shape[1]
+            else:
+                self._buffer = np.empty((0, self.dim), dtype=np.float32)
+            self._index = None
+            self._maybe_build_index()
+
+    def add(self, name: str, embedding: np.ndarray) -> int:
+        """Append one embedding and return its row."""
+        with self._lock:
+            vector = l2_normalize(np.reshape(embedding, (-1,)))
+            if self._size == 0 and len(vector) != self.dim:
+                self.dim = len(vector)
+                self._buffer = np.empty((0, self.dim), dtype=np.float32)
+            if self._size == len(self._buffer):
+                grown = np.empty((max(16, 2 * len(self._buffer)), self.dim), dtype=np.float32)
+                grown[:self._size] = self._buffer[:self._size]
+                self._buffer = grown
+            row = self._size
+            self._buffer[row] = vector
+            self._size += 1
+            self.names.append(name)
+            if self._index is not None:
+                self._index.add(row, vector)
+            self._maybe_build_index()
+            return row
+
+    def remove(self, name: str) -> int:
+        """Drop every row enrolled under name and return how many were removed."""
+        with self._lock:
+            keep = [i for i, n in enumerate(self.names) if n != name]
+            removed = self._size - len(keep)
+            if removed:
+                self._buffer = np.ascontiguousarray(self.matrix[keep])
+                self._size = len(keep)
+                self.names = [self.names[i] for i in keep]
+                self._index = None
+                self._maybe_build_index()
+            return removed
+
+    def rename(self, name: str, new_name: str) -> int:
+        with self._lock:
+            rows = [i for i, n in enumerate(self.names) if n == name]
+            for i in rows:
+                self.names[i] = new_name
+            return len(rows)
+
+    def _maybe_build_index(self):
+        if self.ann_threshold is None or self._size < self.ann_threshold:
+            self._index = None
+            return
+        # Retrain when the gallery has doubled since the clusters were fit
+        if self._index is None or self._size >= 2 * self._index.trained_size:
+            index = IVFIndex(nprobe=self.nprobe)
+            index.train(self.matrix)
+            self._index = index
+
+    def search(self, queries: np.ndarray, k: int) -> List[List[tuple]]:
+        """Top-k (row, score) pairs per query, best first."""
+        queries = l2_normalize(np.reshape(queries, (-1, self.dim)))
+        with self._lock:
+            matrix = self.matrix
+            if self._index is None:
+                scores = queries @ matrix.T
+                return [self._top_k(np.arange(len(matrix)), row, k) for row in scores]
+            return [self._top_k(rows, matrix[rows] @ query, k)
+                    for query, rows in zip(queries, self._index.candidates(queries))]
+
+    @staticmethod
+    def _top_k(rows: np.ndarray, scores: np.ndarray, k: int) -> List[tuple]:
+        if len(rows) == 0:
+            return []
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def match(self, queries: np.ndarray, k: int = 3, threshold: float = 0.6) -> List[Dict[str, Any]]:
+        """
+        Match each query embedding against the gallery.
+
+        Returns one dict per query with the accepted name ("Unknown" below the
+        threshold), its confidence, up to k candidate identities and the margin
+        between the best and runner-up identity.
+        """
+        if len(queries) == 0:
+            return []
+        if self._size == 0:
+            return [{"name": "Unknown", "confidence": 0.0, "candidates": [], "margin": 0.0} for _ in queries]
+
+        results = []
+        with self._lock:
+            # Over-fetch rows so that identities enrolled several times still
+            # yield k distinct candidates.
+            for query_hits in self.search(queries, k * 4):
+                candidates = []
+                seen = set()
+                for row, score in query_hits:
+                    name = self.names[row]
+                    if name in seen:
+                        continue
+                    seen.add(name)
+                    candidates.append({"name": name, "score": score})
+                    if len(candidates) == k:
+                        break
+                best = candidates[0]["score"] if candidates else 0.0
+                runner_up = candidates[1]["score"] if len(candidates) > 1 else 0.0
+                results.append({
+                    "name": candidates[0]["name"] if candidates and best > threshold else "Unknown",
+                    "confidence": best,
+                    "candidates": candidates,
+                    "margin": best - runner_up,
+                })
+        return results
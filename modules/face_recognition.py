@@ -1,22 +1,55 @@
 """
 Face Recognition Module - InsightFace Buffalo Model
 """
+import io
 import os
-import pickle
+import json
 import numpy as np
 import logging
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 from insightface.app import FaceAnalysis
-from config import INSIGHTFACE_MODEL
+from insightface.utils import face_align
+from config import (
+    INSIGHTFACE_MODEL, FACE_MATCH_THRESHOLD, FACE_TOP_K, FACE_ANN_THRESHOLD, FACE_ANN_NPROBE, FACE_DB_DIR,
+    FACE_DET_SIZE, FACE_CROP_MARGIN, FACE_CROP_MIN_DET_SIZE, FACE_FAST_DET_SIZE,
+    FACE_ENROLL_EXEMPLARS, FACE_ENROLL_MIN_SIMILARITY, FACE_ENROLL_BATCH_SIZE,
+)
+from modules.face_gallery import FaceGallery, l2_normalize, aggregate_templates
+from modules.face_store import FaceStore
+from modules.metrics import stage
 
 logger = logging.getLogger(__name__)
 
+# Version of the export_gallery() file format
+EXPORT_FORMAT_VERSION = 1
+
+# Stored in each row's meta. Rows without it (version 1) were embedded from RGB
+# images, which the detector and recognition model read with the colour
+# channels swapped; saving or enrolling the person again replaces them.
+EMBEDDING_VERSION = 2
+
+# A detected face: its [x1, y1, x2, y2, score] box and five landmarks
+Detection = Tuple[np.ndarray, np.ndarray]
+
+def adaptive_det_size(side: int, min_size: int = FACE_CROP_MIN_DET_SIZE, max_size: int = FACE_DET_SIZE) -> int:
+    """Detector input size for a crop: its longer side rounded up to the detector's stride of 32."""
+    return int(np.clip(32 * int(np.ceil(side / 32)), min_size, max_size))
+
 class FaceRecognizer:
-    def __init__(self, db_path="modules/known_faces.pkl"):
+    """
+    Face detection, recognition and the saved-face gallery. Images are BGR,
+    as OpenCV decodes them: InsightFace's detector and recognition model swap
+    the channels to RGB themselves.
+    """
+
+    def __init__(self, db_dir=FACE_DB_DIR, legacy_db_path="modules/known_faces.pkl"):
         self.app = None
-        self.known_embeddings = []
-        self.known_names = []
-        self.db_path = db_path
+        self.gallery = FaceGallery(ann_threshold=FACE_ANN_THRESHOLD, nprobe=FACE_ANN_NPROBE)
+        self.store = FaceStore(db_dir)
+        self.legacy_db_path = legacy_db_path
+        # Serializes applying store changes to the gallery with local writes
+        self._sync_lock = threading.Lock()
         self.is_initialized = False
 
     def load_model(self):
@@ -24,8 +57,11 @@ class FaceRecognizer:
             return
         try:
             logger.info("Initializing InsightFace with Buffalo model...")
-            self.app = FaceAnalysis(name=INSIGHTFACE_MODEL, providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
-            self.app.prepare(ctx_id=0, det_size=(640, 640))
+            # Only the detector and the embedding model; the landmark and
+            # gender/age models of the pack are never used
+            self.app = FaceAnalysis(name=INSIGHTFACE_MODEL, allowed_modules=['detection', 'recognition'],
+                                    providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+            self.app.prepare(ctx_id=0, det_size=(FACE_DET_SIZE, FACE_DET_SIZE))
             self._load_database()
             self.is_initialized = True
             logger.info("InsightFace model initialized successfully")
@@ -34,69 +70,303 @@ class FaceRecognizer:
             self.is_initialized = False
 
     def _load_database(self):
-        if os.path.exists(self.db_path):
-            with open(self.db_path, 'rb') as f:
-                data = pickle.load(f)
-                self.known_names = data.get('names', [])
-                self.known_embeddings = data.get('embeddings', [])
-            logger.info(f"Loaded {len(self.known_names)} known faces from database.")
-        else:
-            logger.info("No existing face database found.")
-
-    def _save_database(self):
-        with open(self.db_path, 'wb') as f:
-            pickle.dump({'names': self.known_names, 'embeddings': self.known_embeddings}, f)
-        logger.info("Face database saved.")
-
-    def recognize(self, frame: np.ndarray) -> List[Dict[str, Any]]:
+        self.store.open()
+        if len(self.store) == 0 and os.path.exists(self.legacy_db_path):
+            self.store.migrate_pickle(self.legacy_db_path)
+        # The store keeps normalized rows, so the memory map is used as is
+        self._reload_gallery()
+        logger.info(f"Loaded {len(self.gallery)} known faces from database.")
+        stale = self.stale_faces()
+        if stale:
+            logger.warning(f"Saved faces of {', '.join(stale)} were embedded from colour-swapped images by an "
+                           f"older version and match less reliably; save or enroll them again to replace them.")
+
+    def _reload_gallery(self):
+        names, embeddings, _ = self.store.load()
+        self.gallery.load(names, embeddings, normalized=True)
+
+    def sync(self) -> bool:
+        """
+        Apply faces saved, deleted or renamed by other worker processes to the
+        in-memory gallery. Costs one stat() when nothing changed.
+        """
+        with self._sync_lock:
+            return self._sync_locked()
+
+    def _sync_locked(self) -> bool:
+        reloaded, records = self.store.refresh()
+        if reloaded:
+            self._reload_gallery()
+            return True
+        for record in records:
+            if record["op"] == "add":
+                self.gallery.add(record["name"], self.store.embedding(record["row"]))
+            elif record["op"] == "delete":
+                self.gallery.remove(record["name"])
+            elif record["op"] == "rename":
+                self.gallery.rename(record["name"], record["new_name"])
+        return bool(records)
+
+    def stale_faces(self) -> List[str]:
+        """People with rows older than EMBEDDING_VERSION, which the next save or enrollment replaces."""
+        return sorted({name for name, meta in self.store.rows()
+                       if (meta or {}).get("embedding_version", 1) < EMBEDDING_VERSION})
+
+    def gallery_version(self) -> str:
+        """Changes whenever any process changes the saved faces."""
+        return self.store.version()
+
+    def recognize(self, frame: np.ndarray, boxes: Optional[Sequence[Sequence[float]]] = None,
+                  mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Recognize the faces in a BGR frame. With boxes (sent by the client, or the
+        faces found in a previous frame) the detector only looks at a crop
+        around each box instead of the whole frame; faces elsewhere are not
+        reported. mode "fast" detects on a smaller whole-frame input
+        (FACE_FAST_DET_SIZE), which misses more of the small faces.
+        """
         if not self.is_initialized:
             return []
-        
-        faces = self.app.get(frame)
-        recognized_faces = []
-        
-        if not self.known_embeddings:
-            for face in faces:
-                 recognized_faces.append({"name": "Unknown", "confidence": 0.0, "box": face.bbox.astype(int).tolist()})
-            return recognized_faces
-
-        for face in faces:
-            embedding = face.embedding
-            # Using cosine similarity
-            sims = np.dot(self.known_embeddings, embedding) / (np.linalg.norm(self.known_embeddings, axis=1) * np.linalg.norm(embedding))
-            best_match_idx = np.argmax(sims)
-            confidence = sims[best_match_idx]
-
-            if confidence > 0.6: # Recognition threshold
-                name = self.known_names[best_match_idx]
+
+        with stage("face_detect"):
+            if boxes is not None:
+                faces = self._detect_in_boxes(frame, boxes)
             else:
-                name = "Unknown"
-            
+                faces = self._detect(frame, FACE_FAST_DET_SIZE if mode == 'fast' else None)
+        if not faces:
+            return []
+        embeddings = self._embed([self._align(frame, landmarks) for _, landmarks in faces])
+        self.sync()
+
+        # All faces in the frame are matched with one matrix multiply
+        with stage("gallery_match"):
+            matches = self.gallery.match(embeddings, k=FACE_TOP_K, threshold=FACE_MATCH_THRESHOLD)
+        recognized_faces = []
+        for (bbox, _), match in zip(faces, matches):
             recognized_faces.append({
-                "name": name,
-                "confidence": float(confidence),
-                "box": face.bbox.astype(int).tolist()
+                "name": match["name"],
+                "confidence": match["confidence"],
+                "box": bbox[:4].astype(int).tolist(),
+                "candidates": match["candidates"],
+                "margin": match["margin"]
             })
         return recognized_faces
 
     def save_face(self, name: str, frame: np.ndarray) -> bool:
         if not self.is_initialized:
             return False
-        
-        faces = self.app.get(frame)
-        if not faces:
+
+        # Use the largest face found in the frame
+        crop = self._aligned_face(frame)
+        if crop is None:
             logger.warning("No face detected in frame to save.")
             return False
-        
-        # Use the largest face found in the frame
-        largest_face = max(faces, key=lambda face: (face.bbox[2] - face.bbox[0]) * (face.bbox[3] - face.bbox[1]))
-        embedding = largest_face.embedding
-        
+        embedding = self._embed([crop])[0]
+
         # Normalize name
         clean_name = name.strip().title()
-        
-        self.known_embeddings.append(embedding)
-        self.known_names.append(clean_name)
-        self._save_database()
+
+        # Other workers' changes are applied first so the gallery sees the
+        # same order of operations as the log
+        with self._sync_lock, self.store.locked():
+            self._sync_locked()
+            if clean_name in self.stale_faces():
+                self.store.delete(clean_name)
+                self.gallery.remove(clean_name)
+            self.store.append(clean_name, embedding, {"embedding_version": EMBEDDING_VERSION})
+            self.gallery.add(clean_name, embedding)
         logger.info(f"Successfully saved face for {clean_name}.")
         return True
+
+    def enroll_faces(self, identities: Dict[str, List[np.ndarray]], replace: bool = False) -> Dict[str, Dict[str, int]]:
+        """
+        Enroll many people from many (BGR) photos each, committed as one write.
+
+        The largest face of every photo is aligned, and the aligned faces are
+        embedded in batches. Each person is stored as a mean template plus a
+        few exemplars (see aggregate_templates). replace forgets a person's
+        earlier faces first, as does having rows from an older
+        EMBEDDING_VERSION. Returns, per person, the number of photos, of
+        photos with a usable face, of outliers skipped and of rows stored.
+        """
+        if not self.is_initialized:
+            return {}
+        report, crops, owners = {}, [], []
+        for name, images in identities.items():
+            clean_name = name.strip().title()
+            entry = report.setdefault(clean_name, {"images": 0, "faces": 0, "outliers": 0, "stored": 0})
+            entry["images"] += len(images)
+            for image in images:
+                crop = self._aligned_face(image)
+                if crop is not None:
+                    crops.append(crop)
+                    owners.append(clean_name)
+                    entry["faces"] += 1
+        embeddings = self._embed(crops)
+
+        names, rows, metas = [], [], []
+        for clean_name, entry in report.items():
+            person = embeddings[[i for i, owner in enumerate(owners) if owner == clean_name]]
+            if len(person) == 0:
+                continue
+            templates, kinds, entry["outliers"] = aggregate_templates(person, FACE_ENROLL_EXEMPLARS,
+                                                                      FACE_ENROLL_MIN_SIMILARITY)
+            entry["stored"] = len(templates)
+            names.extend([clean_name] * len(templates))
+            rows.append(templates)
+            metas.extend({"source": "bulk", "kind": kind, "faces": len(person) - entry["outliers"],
+                          "embedding_version": EMBEDDING_VERSION} for kind in kinds)
+
+        with self._sync_lock, self.store.locked():
+            self._sync_locked()
+            stale = set(self.stale_faces())
+            for clean_name, entry in report.items():
+                if entry["stored"] and (replace or clean_name in stale):
+                    self.store.delete(clean_name)
+            if rows:
+                self.store.append_many(names, np.vstack(rows), metas)
+            self._reload_gallery()
+        logger.info(f"Enrolled {sum(1 for entry in report.values() if entry['stored'])} people "
+                    f"from {len(crops)} faces ({len(names)} rows).")
+        return report
+
+    def _detect(self, image: np.ndarray, det_size: Optional[int] = None, max_num: int = 0) -> List[Detection]:
+        """Faces found by the detector, at det_size (the prepared FACE_DET_SIZE by default)."""
+        input_size = (det_size, det_size) if det_size else None
+        bboxes, kpss = self.app.det_model.detect(image, input_size=input_size, max_num=max_num, metric='default')
+        if kpss is None:
+            return []
+        return list(zip(bboxes, kpss))
+
+    def _detect_in_boxes(self, frame: np.ndarray, boxes: Sequence[Sequence[float]]) -> List[Detection]:
+        """
+        The face inside a margin around each box, detected in that crop only
+        at adaptive_det_size(). Boxes without a face in them are dropped.
+        """
+        height, width = frame.shape[:2]
+        faces = []
+        for x1, y1, x2, y2 in boxes:
+            margin_x, margin_y = (x2 - x1) * FACE_CROP_MARGIN, (y2 - y1) * FACE_CROP_MARGIN
+            left, top = max(int(x1 - margin_x), 0), max(int(y1 - margin_y), 0)
+            right, bottom = min(int(np.ceil(x2 + margin_x)), width), min(int(np.ceil(y2 + margin_y)), height)
+            if right - left < 8 or bottom - top < 8:
+                continue
+            crop = frame[top:bottom, left:right]
+            found = self._detect(crop, adaptive_det_size(max(crop.shape[:2])), max_num=1)
+            for bbox, landmarks in found:
+                offset = np.array([left, top], dtype=bbox.dtype)
+                bbox = bbox.copy()
+                bbox[:4] += np.tile(offset, 2)
+                faces.append((bbox, landmarks + offset))
+        return faces
+
+    def _align(self, image: np.ndarray, landmarks: np.ndarray) -> np.ndarray:
+        """A face aligned and cropped to the recognition model's input."""
+        recognition = self.app.models['recognition']
+        return face_align.norm_crop(image, landmark=landmarks, image_size=recognition.input_size[0])
+
+    def _aligned_face(self, image: np.ndarray) -> Optional[np.ndarray]:
+        """The largest face in a photo, aligned and cropped for the recognition model."""
+        with stage("face_detect"):
+            faces = self._detect(image)
+        if not faces:
+            return None
+        bbox, landmarks = max(faces, key=lambda face: (face[0][2] - face[0][0]) * (face[0][3] - face[0][1]))
+        return self._align(image, landmarks)
+
+    def _embed(self, crops: List[np.ndarray]) -> np.ndarray:
+        """Normalized embeddings of aligned faces, FACE_ENROLL_BATCH_SIZE per model call."""
+        if not crops:
+            return np.empty((0, self.store.dim), dtype=np.float32)
+        recognition = self.app.models['recognition']
+        batches = []
+        with stage("face_embed"):
+            for start in range(0, len(crops), FACE_ENROLL_BATCH_SIZE):
+                batches.append(recognition.get_feat(crops[start:start + FACE_ENROLL_BATCH_SIZE]))
+        return l2_normalize(np.concatenate(batches).reshape(len(crops), -1))
+
+    def export_gallery(self) -> bytes:
+        """
+        All saved faces as an .npz file (names, embeddings, metadata and the
+        model that computed them), for import_gallery() on another server.
+        """
+        self.sync()
+        names, embeddings, metas = self.store.load()
+        buffer = io.BytesIO()
+        np.savez(buffer, format_version=EXPORT_FORMAT_VERSION, model=INSIGHTFACE_MODEL,
+                 names=np.array(names, dtype=np.str_), embeddings=np.asarray(embeddings, dtype=np.float32),
+                 metas=json.dumps(metas))
+        return buffer.getvalue()
+
+    def import_gallery(self, data: bytes, replace: bool = False) -> int:
+        """
+        Add the faces of an export_gallery() file without recomputing any
+        embeddings. replace forgets every saved face first. Raises ValueError
+        for files that are not exports or come from a different model.
+        """
+        if not self.is_initialized:
+            return 0
+        if not data.startswith(b"PK"):
+            raise ValueError("Not a face gallery export")
+        try:
+            with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+                format_version = int(archive["format_version"])
+                model = str(archive["model"])
+                names = [str(name) for name in archive["names"]]
+                embeddings = np.array(archive["embeddings"], dtype=np.float32)
+                metas = json.loads(str(archive["metas"]))
+        except (OSError, ValueError, KeyError) as e:
+            raise ValueError(f"Not a face gallery export: {e}")
+        if format_version != EXPORT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported face gallery export version {format_version}")
+        if model != INSIGHTFACE_MODEL:
+            raise ValueError(f"The export was made with {model}, whose embeddings {INSIGHTFACE_MODEL} cannot match")
+        if len(names) != len(embeddings) or len(metas) != len(names):
+            raise ValueError("The export's names, embeddings and metadata do not line up")
+        if not names:
+            return 0
+
+        metas = [dict(meta or {}, imported=True) for meta in metas]
+        with self._sync_lock, self.store.locked():
+            self._sync_locked()
+            if replace:
+                for name in set(self.gallery.names):
+                    self.store.delete(name)
+            self.store.append_many(names, l2_normalize(embeddings.reshape(len(names), -1)), metas)
+            self._reload_gallery()
+        logger.info(f"Imported {len(names)} saved faces.")
+        return len(names)
+
+    def delete_face(self, name: str) -> int:
+        """Remove every saved face of a person and return how many were removed."""
+        if not self.is_initialized:
+            return 0
+        clean_name = name.strip().title()
+        with self._sync_lock, self.store.locked():
+            self._sync_locked()
+            removed = self.store.delete(clean_name)
+            self.gallery.remove(clean_name)
+        logger.info(f"Deleted {removed} saved faces for {clean_name}.")
+        return removed
+
+    def rename_face(self, name: str, new_name: str) -> int:
+        """Rename a saved person and return how many faces were renamed."""
+        if not self.is_initialized:
+            return 0
+        clean_name = name.strip().title()
+        clean_new_name = new_name.strip().title()
+        with self._sync_lock, self.store.locked():
+            self._sync_locked()
+            renamed = self.store.rename(clean_name, clean_new_name)
+            self.gallery.rename(clean_name, clean_new_name)
+        logger.info(f"Renamed {clean_name} to {clean_new_name}.")
+        return renamed
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Bytes of the InsightFace ONNX models and of the in-memory gallery."""
+        footprint = {}
+        if self.app is not None:
+            for task_name, model in self.app.models.items():
+                footprint[f"insightface_{task_name}"] = os.path.getsize(model.model_file)
+        footprint["gallery"] = self.gallery.matrix.nbytes
+        return footprint
@@ -0,0 +1,421 @@
+"""
+Face Store - Append-only, memory-mapped face embedding database
+
+On-disk layout (inside one directory):
+    log.jsonl             header line, then one JSON record per operation
+                          ("add", "delete", "rename"). A record is committed
+                          once its line, including the newline, is on disk.
+    embeddings-<gen>.f32  fixed-width float32 rows, one per "add" record,
+                          memory-mapped at load time.
+
+Enrolling a face appends one row and one log line. Deletes and renames only
+append to the log; compact() rewrites both files without dead rows and swaps
+the log in atomically.
+
+Several processes can share one store: writes hold an exclusive lock on the
+"lock" file and first replay whatever other processes appended, and
+refresh() picks up their changes (cheaply, by checking the log's size).
+"""
+import os
+import json
+import time
+import pickle
+import logging
+import threading
+import numpy as np
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no fork, so only one process uses the store
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+def _fsync_dir(path: str):
+    # Directory fsync makes renames durable on POSIX; not available on Windows
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _append(path: str, data: bytes):
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        os.write(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class FaceStore:
+    def __init__(self, directory: str, dim: int = 512, compact_ratio: float = 0.5):
+        self.directory = directory
+        self.dim = dim
+        self.compact_ratio = compact_ratio
+        self.log_path = os.path.join(directory, "log.jsonl")
+        self.lock_path = os.path.join(directory, "lock")
+        self.generation = 0
+        # One entry per row in the embeddings file: [name, meta], or None once deleted
+        self._rows = []
+        self._lock = threading.RLock()
+        self._lock_fd = None
+        self._lock_depth = 0
+        # Identity and replayed length of the log, to notice other processes' writes
+        self._log_id = None
+        self._offset = 0
+        # Changes replayed from other processes that refresh() has not returned yet
+        self._pending = []
+        self._reload = False
+
+    @property
+    def embeddings_path(self) -> str:
+        return self._embeddings_path(self.generation)
+
+    def _embeddings_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"embeddings-{generation}.f32")
+
+    def exists(self) -> bool:
+        return os.path.exists(self.log_path)
+
+    def __len__(self) -> int:
+        return sum(1 for row in self._rows if row is not None)
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Exclusive access across threads and processes (reentrant)."""
+        with self._lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_fd is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+                    os.close(self._lock_fd)
+                    self._lock_fd = None
+
+    # --- Loading ---
+
+    def open(self):
+        """Create the store if needed, then replay the log and drop any uncommitted tail."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self.locked():
+            if not self.exists():
+                self._write_log(self.log_path, self._header(), [])
+                _fsync_dir(self.directory)
+            self._replay()
+            self._remove_stale_generations()
+
+    def _header(self, generation: Optional[int] = None) -> Dict[str, Any]:
+        generation = self.generation if generation is None else generation
+        return {"op": "header", "version": FORMAT_VERSION, "dim": self.dim, "generation": generation}
+
+    def _replay(self):
+        with open(self.log_path, "rb") as f:
+            data = f.read()
+
+        self._rows = []
+        records, committed = self._parse(data)
+        for record in records:
+            self._apply(record)
+        rows = self._rows
+
+        if committed < len(data):
+            logger.warning(f"Discarding {len(data) - committed} bytes of uncommitted face log.")
+            with open(self.log_path, "r+b") as f:
+                f.truncate(committed)
+
+        # Rows written before a crash but never logged are dropped as well
+        row_bytes = self.dim * 4
+        expected = len(rows) * row_bytes
+        if os.path.exists(self.embeddings_path):
+            actual = os.path.getsize(self.embeddings_path)
+            if actual > expected:
+                with open(self.embeddings_path, "r+b") as f:
+                    f.truncate(expected)
+            elif actual < expected:
+                raise IOError(f"Face embeddings file is shorter than its log ({actual} < {expected} bytes)")
+        elif rows:
+            raise IOError(f"Missing face embeddings file {self.embeddings_path}")
+        stat = os.stat(self.log_path)
+        self._log_id = (stat.st_dev, stat.st_ino)
+        self._offset = committed
+
+    @staticmethod
+    def _parse(data: bytes) -> Tuple[List[Dict[str, Any]], int]:
+        """Committed records in data and the number of bytes they span."""
+        records = []
+        committed = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            committed += len(line)
+        return records, committed
+
+    def _apply(self, record: Dict[str, Any]):
+        op = record.get("op")
+        if op == "header":
+            self.dim = record["dim"]
+            self.generation = record["generation"]
+        elif op == "add":
+            self._rows.append([record["name"], record.get("meta", {})])
+        elif op == "delete":
+            self._rows = [None if row is not None and row[0] == record["name"] else row for row in self._rows]
+        elif op == "rename":
+            for row in self._rows:
+                if row is not None and row[0] == record["name"]:
+                    row[0] = record["new_name"]
+
+    # --- Sharing between processes ---
+
+    def _changed(self) -> bool:
+        try:
+            stat = os.stat(self.log_path)
+        except OSError:
+            return False
+        return (stat.st_dev, stat.st_ino) != self._log_id or stat.st_size != self._offset
+
+    def _catch_up(self):
+        """Replay what other processes wrote since the last replay. Call with locked()."""
+        if self._changed():
+            stat = os.stat(self.log_path)
+            if (stat.st_dev, stat.st_ino) != self._log_id or stat.st_size < self._offset:
+                # Another process compacted the store
+                self._replay()
+                self._pending = []
+                self._reload = True
+                return
+            with open(self.log_path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            records, committed = self._parse(data)
+            for record in records:
+                self._apply(record)
+            self._pending.extend(records)
+            self._offset += committed
+            if committed < len(data):
+                # Holding the lock, a partial line can only be left by a
+                # writer that died; the next record must not land after it
+                logger.warning(f"Discarding {len(data) - committed} bytes of uncommitted face log.")
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(self._offset)
+        self._drop_orphan_rows()
+
+    def _drop_orphan_rows(self):
+        """
+        Truncate rows a dead writer appended without logging them, so the
+        next rows are written at the offsets their log records point to.
+        """
+        expected = len(self._rows) * self.dim * 4
+        try:
+            actual = os.path.getsize(self.embeddings_path)
+        except OSError:
+            return
+        if actual > expected:
+            logger.warning(f"Discarding {actual - expected} bytes of uncommitted face embeddings.")
+            with open(self.embeddings_path, "r+b") as f:
+                f.truncate(expected)
+
+    def refresh(self) -> Tuple[bool, List[Dict[str, Any]]]:
+        """
+        Pick up changes other processes made. Returns (reloaded, records):
+        when reloaded is True the store was compacted elsewhere and callers
+        should load() everything again; otherwise records lists the new
+        add/delete/rename records in order.
+        """
+        with self._lock:
+            if self._changed():
+                with self.locked():
+                    self._catch_up()
+            reloaded, records = self._reload, self._pending
+            self._reload, self._pending = False, []
+            return reloaded, records
+
+    def version(self) -> str:
+        """Changes whenever any process writes to the store."""
+        try:
+            stat = os.stat(self.log_path)
+        except OSError:
+            return ""
+        return f"{stat.st_ino}-{stat.st_size}"
+
+    def embedding(self, row: int) -> np.ndarray:
+        """The embedding stored in one row of the current embeddings file."""
+        with self._lock:
+            offset = row * self.dim * 4
+            return np.fromfile(self.embeddings_path, dtype=np.float32, count=self.dim, offset=offset)
+
+    def _remove_stale_generations(self):
+        current = os.path.basename(self.embeddings_path)
+        for entry in os.listdir(self.directory):
+            if entry.startswith("embeddings-") and entry != current:
+                try:
+                    os.remove(os.path.join(self.directory, entry))
+                except OSError:
+                    pass
+
+    def rows(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """(name, meta) of every live row, without reading the embeddings."""
+        with self._lock:
+            return [(row[0], row[1]) for row in self._rows if row is not None]
+
+    def load(self) -> Tuple[List[str], np.ndarray, List[Dict[str, Any]]]:
+        """
+        Names, embeddings and metadata of all live rows. The embeddings are a
+        read-only memory map when no rows have been deleted.
+        """
+        with self._lock:
+            if not self._rows:
+                return [], np.empty((0, self.dim), dtype=np.float32), []
+            matrix = np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(len(self._rows), self.dim))
+            live = [i for i, row in enumerate(self._rows) if row is not None]
+            if len(live) < len(self._rows):
+                matrix = np.ascontiguousarray(matrix[live])
+            names = [self._rows[i][0] for i in live]
+            metas = [self._rows[i][1] for i in live]
+            return names, matrix, metas
+
+    # --- Writing ---
+
+    def append(self, name: str, embedding: np.ndarray, meta: Optional[Dict[str, Any]] = None):
+        """Durably add one embedding: one row append plus one log append."""
+        self.append_many([name], np.reshape(embedding, (1, -1)), [meta])
+
+    def append_many(self, names: List[str], embeddings: np.ndarray, metas: Optional[List[Optional[Dict[str, Any]]]] = None):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of width {self.dim}, got shape {embeddings.shape}")
+        metas = metas or [None] * len(names)
+        with self.locked():
+            self._catch_up()
+            first_row = len(self._rows)
+            records = []
+            for offset, (name, meta) in enumerate(zip(names, metas)):
+                meta = dict(meta or {}, enrolled_at=time.time())
+                records.append({"op": "add", "row": first_row + offset, "name": name, "meta": meta})
+            # Rows first, then the log: the log line is the commit record
+            try:
+                _append(self.embeddings_path, embeddings.tobytes())
+                self._append_records(records)
+            except OSError:
+                # Keep the embeddings file aligned with the committed rows
+                with open(self.embeddings_path, "r+b") as f:
+                    f.truncate(first_row * self.dim * 4)
+                raise
+            self._rows.extend([r["name"], r["meta"]] for r in records)
+
+    def delete(self, name: str) -> int:
+        """Delete every row enrolled under name and return how many were removed."""
+        with self.locked():
+            self._catch_up()
+            removed = sum(1 for row in self._rows if row is not None and row[0] == name)
+            if not removed:
+                return 0
+            self._append_records([{"op": "delete", "name": name}])
+            self._rows = [None if row is not None and row[0] == name else row for row in self._rows]
+            dead = sum(1 for row in self._rows if row is None)
+            needs_compaction = dead > self.compact_ratio * len(self._rows)
+        if needs_compaction:
+            self.compact()
+        return removed
+
+    def rename(self, name: str, new_name: str) -> int:
+        with self.locked():
+            self._catch_up()
+            renamed = sum(1 for row in self._rows if row is not None and row[0] == name)
+            if not renamed:
+                return 0
+            self._append_records([{"op": "rename", "name": name, "new_name": new_name}])
+            for row in self._rows:
+                if row is not None and row[0] == name:
+                    row[0] = new_name
+            return renamed
+
+    def _append_records(self, records: List[Dict[str, Any]]):
+        data = "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+        _append(self.log_path, data)
+        self._offset += len(data)
+
+    def compact(self):
+        """Rewrite the store without deleted rows and atomically switch to it."""
+        with self.locked():
+            self._catch_up()
+            live = [i for i, row in enumerate(self._rows) if row is not None]
+            old_path = self.embeddings_path
+            if self._rows:
+                matrix = np.memmap(old_path, dtype=np.float32, mode="r", shape=(len(self._rows), self.dim))
+                data = np.ascontiguousarray(matrix[live]).tobytes()
+                del matrix
+            else:
+                data = b""
+
+            generation = self.generation + 1
+            with open(self._embeddings_path(generation), "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            records = [{"op": "add", "row": new_row, "name": self._rows[old_row][0], "meta": self._rows[old_row][1]}
+                       for new_row, old_row in enumerate(live)]
+            tmp_path = self.log_path + ".tmp"
+            self._write_log(tmp_path, self._header(generation), records)
+            # The log swap is the commit point of the compaction
+            os.replace(tmp_path, self.log_path)
+            _fsync_dir(self.directory)
+
+            self.generation = generation
+            self._rows = [self._rows[i] for i in live]
+            stat = os.stat(self.log_path)
+            self._log_id = (stat.st_dev, stat.st_ino)
+            self._offset = stat.st_size
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+            logger.info(f"Compacted face store to {len(self._rows)} rows (generation {self.generation}).")
+
+    def _write_log(self, path: str, header: Dict[str, Any], records: List[Dict[str, Any]]):
+        with open(path, "wb") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in [header] + records).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    # --- Migration ---
+
+    def migrate_pickle(self, pickle_path: str) -> int:
+        """
+        One-shot import of the old {'names', 'embeddings'} pickle database.
+        The pickle is renamed to <name>.migrated afterwards so it is never
+        imported twice.
+        """
+        with open(pickle_path, "rb") as f:
+            data = pickle.load(f)
+
+        names = data.get("names") if isinstance(data, dict) else None
+        embeddings = data.get("embeddings") if isinstance(data, dict) else None
+        if names is None or embeddings is None:
+            # e.g. the name -> 128-d encoding dict of the old face_recognition
+            # based module, whose embeddings InsightFace cannot match
+            logger.warning(f"{pickle_path} is not an InsightFace face database; skipping migration.")
+            return 0
+
+        if names:
+            matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(names), -1)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            self.append_many(list(names), matrix, [{"source": "pickle"}] * len(names))
+        os.replace(pickle_path, pickle_path + ".migrated")
+        logger.info(f"Migrated {len(names)} faces from {pickle_path}.")
+        return len(names)
@@ -0,0 +1,88 @@
+"""
+Frame Module - Decode an uploaded image once and share its views
+"""
+import base64
+import hashlib
+import cv2
+import numpy as np
+from PIL import Image
+from typing import Dict, Optional
+from modules.metrics import stage
+
+class Frame:
+    """
+    A decoded image shared by every service handling one request.
+
+    The image is decoded once into a BGR array (OpenCV's native layout). The
+    RGB array, PIL image and resized copies are created on first access and
+    cached, so each conversion happens at most once per request.
+    """
+
+    def __init__(self, bgr: np.ndarray, encoded: Optional[bytes] = None):
+        self.bgr = bgr
+        self.encoded = encoded
+        self._rgb = None
+        self._pil = None
+        self._digest = None
+        self._resized: Dict[int, "Frame"] = {}
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Frame":
+        """Decode an encoded image (JPEG, PNG, ...)."""
+        # np.frombuffer wraps the bytes without copying them
+        with stage("imdecode"):
+            bgr = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if bgr is None:
+            raise ValueError("could not decode image")
+        return cls(bgr, encoded=data)
+
+    @classmethod
+    def from_base64(cls, data: str) -> "Frame":
+        with stage("base64_decode"):
+            data = base64.b64decode(data)
+        return cls.from_bytes(data)
+
+    @property
+    def shape(self):
+        return self.bgr.shape
+
+    @property
+    def height(self) -> int:
+        return self.bgr.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.bgr.shape[1]
+
+    @property
+    def digest(self) -> str:
+        """Content hash of the uploaded bytes (or of the pixels when there are none)."""
+        if self._digest is None:
+            data = self.encoded if self.encoded is not None else self.bgr.tobytes()
+            self._digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        return self._digest
+
+    @property
+    def rgb(self) -> np.ndarray:
+        if self._rgb is None:
+            self._rgb = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB)
+        return self._rgb
+
+    @property
+    def pil(self) -> Image.Image:
+        if self._pil is None:
+            self._pil = Image.fromarray(self.rgb)
+        return self._pil
+
+    def resized(self, max_side: int) -> "Frame":
+        """
+        A Frame whose longest side is at most max_side pixels. Returns self
+        when the image is already small enough.
+        """
+        scale = max_side / max(self.height, self.width)
+        if scale >= 1.0:
+            return self
+        if max_side not in self._resized:
+            size = (max(1, round(self.width * scale)), max(1, round(self.height * scale)))
+            self._resized[max_side] = Frame(cv2.resize(self.bgr, size, interpolation=cv2.INTER_AREA))
+        return self._resized[max_side]
@@ -0,0 +1,251 @@
+"""
+Metrics Module - Stage timers, histograms and the Prometheus text format
+"""
+import os
+import sys
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Seconds; from a 1 ms decode up to a slow first-call model load
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels):
+        """For totals that are counted elsewhere (e.g. by a worker pool)."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "request_duration_seconds", "Time to answer a request, by task.", ("task",)))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "stage_duration_seconds", "Time spent in each processing stage, by task and stage.", ("task", "stage")))
+QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "queue_wait_seconds", "Time a call waited for a free worker, by pool.", ("pool",)))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "requests_in_flight", "Requests currently being processed, by task.", ("task",)))
+REQUEST_ERRORS = REGISTRY.register(Counter(
+    "request_errors_total", "Requests answered with an error status, by task and status code.", ("task", "code")))
+POOL_RUNNING = REGISTRY.register(Gauge(
+    "inference_pool_running", "Calls currently running on each worker pool.", ("pool",)))
+POOL_WAITING = REGISTRY.register(Gauge(
+    "inference_pool_waiting", "Calls waiting for a worker in each pool.", ("pool",)))
+POOL_REJECTED = REGISTRY.register(Counter(
+    "inference_pool_rejected_total", "Calls rejected because a pool's queue was full.", ("pool",)))
+MODEL_MEMORY_BYTES = REGISTRY.register(Gauge(
+    "model_memory_bytes", "Weights held by each loaded model, by service and model.", ("service", "model")))
+PROCESS_MEMORY_BYTES = REGISTRY.register(Gauge(
+    "process_memory_bytes", "Resident memory of the server process, and CUDA memory allocated by torch.", ("kind",)))
+MODEL_EVICTIONS = REGISTRY.register(Counter(
+    "model_evictions_total", "Services unloaded to stay within the model memory budget, by service.", ("service",)))
+QOS_FAST_TIER = REGISTRY.register(Gauge(
+    "qos_fast_tier", "1 while requests of a task without an explicit mode run on the fast tier.", ("task",)))
+QOS_SWITCHES = REGISTRY.register(Counter(
+    "qos_tier_switches_total", "Automatic tier changes, by task and the tier switched to.", ("task", "tier")))
+
+# --- Per-request stage timing ---
+
+_task: contextvars.ContextVar = contextvars.ContextVar("metrics_task", default="none")
+# Stage name -> seconds for the current request, when one is being tracked
+_timings: contextvars.ContextVar = contextvars.ContextVar("metrics_timings", default=None)
+# Set on threads that work for several requests at once (micro-batches): stage
+# times are collected here and replayed into each request's own context
+_deferred: contextvars.ContextVar = contextvars.ContextVar("metrics_deferred", default=None)
+
+def record_stage(stage: str, seconds: float):
+    deferred = _deferred.get()
+    if deferred is not None:
+        deferred.append((stage, seconds))
+        return
+    STAGE_SECONDS.observe(seconds, task=_task.get(), stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as one processing stage of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+@contextmanager
+def deferred_stages() -> Iterator[List[Tuple[str, float]]]:
+    """Collect the stages timed inside the block instead of recording them."""
+    stages = []
+    token = _deferred.set(stages)
+    try:
+        yield stages
+    finally:
+        _deferred.reset(token)
+
+def replay_stages(stages: List[Tuple[str, float]]):
+    for name, seconds in stages:
+        record_stage(name, seconds)
+
+@contextmanager
+def track_request(task: str) -> Iterator[Dict[str, float]]:
+    """
+    Track one request: counts it in flight, records its duration and yields
+    the stage -> seconds breakdown that stage() calls fill in. Worker threads
+    see it as long as the context is copied to them, which the inference
+    scheduler and FastAPI's thread pool both do.
+    """
+    timings = {}
+    task_token = _task.set(task)
+    timings_token = _timings.set(timings)
+    REQUESTS_IN_FLIGHT.inc(task=task)
+    started = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        elapsed = time.perf_counter() - started
+        REQUESTS_IN_FLIGHT.dec(task=task)
+        REQUEST_SECONDS.observe(elapsed, task=task)
+        timings["total"] = elapsed
+        _timings.reset(timings_token)
+        _task.reset(task_token)
+
+def timings_ms(timings: Dict[str, float]) -> Dict[str, float]:
+    return {name: round(seconds * 1000, 2) for name, seconds in timings.items()}
+
+# --- Memory ---
+
+def module_bytes(module) -> int:
+    """Bytes held by the parameters and buffers of a torch module (or by an exported model file)."""
+    if module is None:
+        return 0
+    if isinstance(module, (str, os.PathLike)):
+        return os.path.getsize(module) if os.path.exists(module) else 0
+    if hasattr(module, "nbytes"):
+        return module.nbytes
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+def update_process_memory():
+    try:
+        with open("/proc/self/statm") as f:
+            PROCESS_MEMORY_BYTES.set(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE"), kind="rss")
+    except (OSError, ValueError):
+        pass
+    # Only look at CUDA when a service already imported torch
+    torch = sys.modules.get("torch")
+    if torch is not None and hasattr(torch, "cuda") and torch.cuda.is_available():
+        PROCESS_MEMORY_BYTES.set(torch.cuda.memory_allocated(), kind="cuda_allocated")
+
+def update_model_memory(service: str, footprint: Optional[Dict[str, int]]):
+    """Replace a service's model sizes; an empty footprint clears them (service not loaded)."""
+    footprint = footprint or {}
+    with MODEL_MEMORY_BYTES._lock:
+        for key in [key for key in MODEL_MEMORY_BYTES._values if key[0] == service and key[1] not in footprint]:
+            del MODEL_MEMORY_BYTES._values[key]
+    for model, size in footprint.items():
+        MODEL_MEMORY_BYTES.set(size, service=service, model=model)
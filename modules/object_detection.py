@@ -5,18 +5,39 @@ import cv2
 import numpy as np
 import torch
 import logging
-from typing import List, Dict, Any
-from ultralytics import YOLO
-from config import YOLO_MODEL_PATH, MIDAS_MODEL_TYPE
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from config import (
+    YOLO_MODEL_PATH, MIDAS_MODEL_TYPE, YOLO_FAST_MODEL_PATH, MIDAS_FAST_MODEL_TYPE, QOS_ENABLED,
+    OBJECT_BATCH_MAX_SIZE, OBJECT_BATCH_MAX_WAIT_MS,
+    OBJECT_DEPTH_CONCURRENT, OBJECT_DEPTH_PERCENTILE, OBSTACLE_PERCENTILE,
+    OBJECT_VERY_CLOSE_RATIO, OBJECT_NEAR_RATIO,
+)
+from modules.batching import MicroBatcher
+from modules.metrics import stage, module_bytes
+from modules.backends import load_yolo, compile_midas
+from modules.object_query import rank_objects, distance_label
 
 logger = logging.getLogger(__name__)
 
+DPT_MODEL_TYPES = ("DPT_Large", "DPT_Hybrid")
+
 class ObjectDetector:
     def __init__(self):
         self.yolo_model = None
-        self.midas_model = None
-        self.midas_transform = None
+        # Weights path -> YOLO model; YOLO_MODEL_PATH (and the fast tier's
+        # model when QoS is on) is loaded at startup, others on first request
+        self.yolo_models = {}
+        # MiDaS model type -> (model, transform); the default type (and the
+        # fast tier's when QoS is on) is loaded at startup, others on first request
+        self.midas_models = {}
         self.device = None
+        self.batcher = None
+        self._midas_lock = threading.Lock()
+        self._yolo_lock = threading.Lock()
+        self._depth_executor = None
         self.is_initialized = False
 
     def load_model(self):
@@ -24,75 +45,257 @@ class ObjectDetector:
         if self.is_initialized:
             return
         try:
-            logger.info(f"Loading YOLO model from {YOLO_MODEL_PATH}...")
-            self.yolo_model = YOLO(YOLO_MODEL_PATH)
-            logger.info("YOLO model loaded successfully")
+            self.yolo_model = self._get_yolo(YOLO_MODEL_PATH)
 
-            logger.info(f"Loading MIDAS {MIDAS_MODEL_TYPE} model...")
             self.device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
-            self.midas_model = torch.hub.load("intel-isl/MiDaS", MIDAS_MODEL_TYPE, trust_repo=True).to(self.device)
-            self.midas_model.eval()
+            self._get_midas(MIDAS_MODEL_TYPE)
+            if QOS_ENABLED:
+                # QoS switches to the fast tier under overload, the worst
+                # moment for a request to wait for a model download
+                self._get_yolo(YOLO_FAST_MODEL_PATH)
+                self._get_midas(MIDAS_FAST_MODEL_TYPE)
+
+            concurrent = OBJECT_DEPTH_CONCURRENT if OBJECT_DEPTH_CONCURRENT is not None else self.device.type == "cuda"
+            if concurrent:
+                self._depth_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="midas")
 
-            midas_transforms = torch.hub.load("intel-isl/MiDaS", "transforms", trust_repo=True)
-            self.midas_transform = midas_transforms.dpt_transform if MIDAS_MODEL_TYPE in ["DPT_Large", "DPT_Hybrid"] else midas_transforms.small_transform
-            
-            logger.info(f"MIDAS model loaded successfully on {self.device}")
+            if OBJECT_BATCH_MAX_SIZE > 1:
+                self.batcher = MicroBatcher(self._detect_items, OBJECT_BATCH_MAX_SIZE,
+                                            OBJECT_BATCH_MAX_WAIT_MS, name="object-batcher")
             self.is_initialized = True
             logger.info("ObjectDetector initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing ObjectDetector: {e}")
             self.is_initialized = False
 
-    def calculate_object_depth(self, depth_map, box):
-        """Calculate depth of a detected object."""
+    def unload_model(self):
+        """Stop the batching and depth threads and drop every model (the registry evicts idle services)."""
+        self.is_initialized = False
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+        if self._depth_executor is not None:
+            self._depth_executor.shutdown(wait=False)
+            self._depth_executor = None
+        self.yolo_model = None
+        self.yolo_models = {}
+        self.midas_models = {}
+
+    def _get_yolo(self, weights: str):
+        """Return the YOLO model for a weights file, loading it on first use."""
+        if weights in self.yolo_models:
+            return self.yolo_models[weights]
+        with self._yolo_lock:
+            if weights not in self.yolo_models:
+                logger.info(f"Loading YOLO model from {weights}...")
+                self.yolo_models[weights] = load_yolo(weights)
+                logger.info("YOLO model loaded successfully")
+        return self.yolo_models[weights]
+
+    def _get_midas(self, model_type: str) -> Tuple[Any, Any]:
+        """Return (model, transform) for a MiDaS variant, loading it on first use."""
+        if model_type in self.midas_models:
+            return self.midas_models[model_type]
+        with self._midas_lock:
+            if model_type not in self.midas_models:
+                logger.info(f"Loading MIDAS {model_type} model...")
+                model = torch.hub.load("intel-isl/MiDaS", model_type, trust_repo=True).to(self.device)
+                model.eval()
+                midas_transforms = torch.hub.load("intel-isl/MiDaS", "transforms", trust_repo=True)
+                transform = midas_transforms.dpt_transform if model_type in DPT_MODEL_TYPES else midas_transforms.small_transform
+                example = transform(np.zeros((480, 640, 3), dtype=np.uint8)).to(self.device)
+                model = compile_midas(model, model_type, example)
+                self.midas_models[model_type] = (model, transform)
+                logger.info(f"MIDAS {model_type} model loaded successfully on {self.device}")
+        return self.midas_models[model_type]
+
+    def calculate_object_depth(self, depth_map, box, image_shape):
+        """
+        Depth of a detected object, sampled from the low-resolution depth map
+        with the box scaled to its size. A percentile is robust to background
+        pixels that fall inside the box.
+        """
         try:
-            x1, y1, x2, y2 = map(int, box)
+            map_h, map_w = depth_map.shape
+            sx, sy = map_w / image_shape[1], map_h / image_shape[0]
+            x1 = min(max(int(box[0] * sx), 0), map_w - 1)
+            y1 = min(max(int(box[1] * sy), 0), map_h - 1)
+            x2 = min(max(int(np.ceil(box[2] * sx)), x1 + 1), map_w)
+            y2 = min(max(int(np.ceil(box[3] * sy)), y1 + 1), map_h)
             depth_region = depth_map[y1:y2, x1:x2]
-            return np.mean(depth_region) if depth_region.size > 0 else 0
+            return float(np.percentile(depth_region, OBJECT_DEPTH_PERCENTILE)) if depth_region.size > 0 else 0
         except Exception as e:
             logger.error(f"Error calculating object depth: {e}")
             return 0
 
-    def detect(self, frame: np.ndarray) -> List[Dict[str, Any]]:
-        """Detect objects with depth estimation."""
+    def detect(self, frame: np.ndarray, rgb: Optional[np.ndarray] = None,
+               depth_model: Optional[str] = None, yolo_weights: Optional[str] = None,
+               targets: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Detect objects with depth estimation, ranked by rank_objects().
+
+        frame is BGR, as YOLO expects. MiDaS needs RGB; pass rgb when the
+        caller already has it to avoid converting again. depth_model selects
+        the MiDaS variant (defaults to MIDAS_MODEL_TYPE) and yolo_weights the
+        YOLO one (defaults to YOLO_MODEL_PATH). targets restricts detection to
+        those class names; depth is then only estimated when one was found.
+        """
         if not self.is_initialized:
             return []
-        
+        classes = None
+        if targets is not None:
+            classes = self._class_ids(yolo_weights or YOLO_MODEL_PATH, targets)
+            if not classes:
+                return []
+        if rgb is None:
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if self.batcher is not None:
+            # Concurrent callers are grouped into one YOLO + MiDaS batch
+            return self.batcher.submit((frame, rgb, depth_model, yolo_weights, classes))
+        return self.detect_batch([frame], [rgb], [depth_model], [yolo_weights], [classes])[0]
+
+    def _class_ids(self, weights: str, targets: List[str]) -> Tuple[int, ...]:
+        """Ids of the target class names in a YOLO model, ignoring names it does not know."""
+        names = self._get_yolo(weights).names
+        return tuple(sorted(class_id for class_id, name in names.items() if name in targets))
+
+    def _detect_items(self, items):
+        frames, rgbs, depth_models, yolo_weights, classes = zip(*items)
+        return self.detect_batch(list(frames), list(rgbs), list(depth_models), list(yolo_weights), list(classes))
+
+    def detect_batch(self, frames: List[np.ndarray], rgbs: Optional[List[np.ndarray]] = None,
+                     depth_models: Optional[List[Optional[str]]] = None,
+                     yolo_weights: Optional[List[Optional[str]]] = None,
+                     classes: Optional[List[Optional[Tuple[int, ...]]]] = None) -> List[List[Dict[str, Any]]]:
+        """Detect objects with depth estimation for several BGR frames at once."""
+        if not self.is_initialized:
+            return [[] for _ in frames]
+        if rgbs is None:
+            rgbs = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+        depth_models = [model or MIDAS_MODEL_TYPE for model in (depth_models or [None] * len(frames))]
+        yolo_weights = [weights or YOLO_MODEL_PATH for weights in (yolo_weights or [None] * len(frames))]
+        classes = classes or [None] * len(frames)
+
         try:
-            # YOLOv9 object detection
-            results = self.yolo_model(frame, imgsz=640, verbose=False)
-            
-            # MIDAS depth estimation
-            img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            input_batch = self.midas_transform(img_rgb).to(self.device)
-            
-            with torch.no_grad():
-                prediction = self.midas_model(input_batch)
-                prediction = torch.nn.functional.interpolate(
-                    prediction.unsqueeze(1),
-                    size=img_rgb.shape[:2],
-                    mode="bicubic",
-                    align_corners=False,
-                ).squeeze()
-            depth_map = prediction.cpu().numpy()
-
-            detected_objects = []
-            boxes = results[0].boxes.xyxy.cpu().tolist()
-            classes = results[0].boxes.cls.cpu().tolist()
-            confidences = results[0].boxes.conf.cpu().tolist()
-            names = results[0].names
-
-            for box, cls, conf in zip(boxes, classes, confidences):
-                if conf > 0.3:
-                    depth = self.calculate_object_depth(depth_map, box)
-                    detected_objects.append({
-                        "name": names.get(cls, "Unknown"),
-                        "confidence": conf,
-                        "box": box,
-                        "depth_m": float(depth) 
-                    })
-            
-            return detected_objects
+            depth_future = None
+            # Class-restricted requests often find nothing, so their depth
+            # waits for YOLO instead of running alongside it
+            if self._depth_executor is not None and all(c is None for c in classes):
+                # Depth runs alongside YOLO; the result is discarded for frames
+                # without detections
+                depth_future = self._depth_executor.submit(contextvars.copy_context().run,
+                                                           self.estimate_depth_batch, rgbs, depth_models)
+
+            # YOLOv9 object detection, one call per YOLO variant and class
+            # filter in the batch
+            detections = [None] * len(frames)
+            groups = {}
+            for i, key in enumerate(zip(yolo_weights, classes)):
+                groups.setdefault(key, []).append(i)
+            with stage("yolo"):
+                for (weights, class_ids), indices in groups.items():
+                    results = self._get_yolo(weights)([frames[i] for i in indices], imgsz=640, verbose=False,
+                                                      classes=list(class_ids) if class_ids is not None else None)
+                    for i, result in zip(indices, results):
+                        detections[i] = self._detections(result)
+
+            if depth_future is not None:
+                depth_maps = depth_future.result()
+            else:
+                # MIDAS depth estimation, only for frames where YOLO found something
+                depth_maps = [None] * len(frames)
+                needed = [i for i, objects in enumerate(detections) if objects]
+                if needed:
+                    estimated = self.estimate_depth_batch([rgbs[i] for i in needed], [depth_models[i] for i in needed])
+                    for i, depth_map in zip(needed, estimated):
+                        depth_maps[i] = depth_map
+
+            for objects, depth_map, rgb in zip(detections, depth_maps, rgbs):
+                if not objects or depth_map is None:
+                    continue
+                median = float(np.median(depth_map))
+                for obj in objects:
+                    obj["depth"] = float(self.calculate_object_depth(depth_map, obj["box"], rgb.shape[:2]))
+                    closeness = obj["depth"] / median if median > 0 else 1.0
+                    obj["closeness"] = round(closeness, 2)
+                    obj["distance"] = distance_label(closeness, OBJECT_VERY_CLOSE_RATIO, OBJECT_NEAR_RATIO)
+            return [rank_objects(objects) for objects in detections]
         except Exception as e:
             logger.error(f"Error in object detection: {e}")
-            return []
+            return [[] for _ in frames]
+
+    def estimate_depth_batch(self, rgbs: List[np.ndarray], model_types: Optional[List[str]] = None) -> List[np.ndarray]:
+        """
+        Run MiDaS on several RGB frames and return the depth maps at the
+        model's output resolution (no upsampling to the frame size). Frames
+        are batched per model type and input shape.
+        """
+        model_types = model_types or [MIDAS_MODEL_TYPE] * len(rgbs)
+        with stage("midas_transform"):
+            inputs = [self._get_midas(model_type)[1](rgb) for rgb, model_type in zip(rgbs, model_types)]
+
+        # The transform keeps the aspect ratio, so frames of different shapes
+        # end up in separate forward passes.
+        groups = {}
+        for idx, (input_batch, model_type) in enumerate(zip(inputs, model_types)):
+            groups.setdefault((model_type, tuple(input_batch.shape)), []).append(idx)
+
+        depth_maps = [None] * len(rgbs)
+        with torch.no_grad(), stage("midas"):
+            for (model_type, _), indices in groups.items():
+                model = self._get_midas(model_type)[0]
+                input_batch = torch.cat([inputs[i] for i in indices]).to(self.device)
+                predictions = model(input_batch).cpu().numpy()
+                for i, prediction in zip(indices, predictions):
+                    depth_maps[i] = prediction
+        return depth_maps
+
+    def depth_grid(self, rgb: np.ndarray, model_type: Optional[str] = None, rows: int = 3, cols: int = 3) -> np.ndarray:
+        """
+        MiDaS depth reduced to a rows x cols grid, each cell holding the
+        OBSTACLE_PERCENTILE of its values (relative inverse depth: larger is
+        closer). No object detection runs.
+        """
+        if not self.is_initialized:
+            return np.zeros((rows, cols), dtype=np.float32)
+        depth_map = self.estimate_depth_batch([rgb], [model_type or MIDAS_MODEL_TYPE])[0]
+        with stage("depth_grid"):
+            grid = np.zeros((rows, cols), dtype=np.float32)
+            row_edges = np.linspace(0, depth_map.shape[0], rows + 1).astype(int)
+            col_edges = np.linspace(0, depth_map.shape[1], cols + 1).astype(int)
+            for r in range(rows):
+                for c in range(cols):
+                    cell = depth_map[row_edges[r]:row_edges[r + 1], col_edges[c]:col_edges[c + 1]]
+                    grid[r, c] = np.percentile(cell, OBSTACLE_PERCENTILE) if cell.size else 0.0
+        return grid
+
+    def _detections(self, result) -> List[Dict[str, Any]]:
+        detected_objects = []
+        boxes = result.boxes.xyxy.cpu().tolist()
+        classes = result.boxes.cls.cpu().tolist()
+        confidences = result.boxes.conf.cpu().tolist()
+        names = result.names
+
+        for box, cls, conf in zip(boxes, classes, confidences):
+            if conf > 0.3:
+                detected_objects.append({
+                    "name": names.get(cls, "Unknown"),
+                    "confidence": conf,
+                    "box": box,
+                    "depth": 0.0,
+                    "closeness": 1.0,
+                    "distance": "farther away"
+                })
+        return detected_objects
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Bytes of weights held by each loaded model."""
+        footprint = {}
+        for weights, model in list(self.yolo_models.items()):
+            footprint["yolo" if weights == YOLO_MODEL_PATH else f"yolo_{weights}"] = module_bytes(model.model)
+        for model_type, (model, _) in list(self.midas_models.items()):
+            footprint[f"midas_{model_type}"] = module_bytes(model)
+        return footprint
+
+    def batch_stats(self) -> Dict[str, Any]:
+        return self.batcher.stats.snapshot() if self.batcher is not None else {}
@@ -0,0 +1,94 @@
+"""
+Object Query Module - Maps spoken queries to YOLO (COCO) classes and ranks results
+"""
+import re
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+# The 80 classes the COCO-trained YOLO models detect
+COCO_CLASSES = (
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat", "traffic light",
+    "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep", "cow",
+    "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee",
+    "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove", "skateboard", "surfboard",
+    "tennis racket", "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple",
+    "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch",
+    "potted plant", "bed", "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard",
+    "cell phone", "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors",
+    "teddy bear", "hair drier", "toothbrush",
+)
+
+# Everyday words for COCO classes
+SYNONYMS = {
+    "people": "person", "man": "person", "men": "person", "woman": "person", "women": "person",
+    "someone": "person", "somebody": "person", "child": "person", "children": "person", "kid": "person",
+    "bike": "bicycle", "motorbike": "motorcycle", "scooter": "motorcycle", "plane": "airplane",
+    "lorry": "truck", "van": "truck", "ship": "boat", "traffic signal": "traffic light",
+    "hydrant": "fire hydrant", "seat": "chair", "stool": "chair", "sofa": "couch",
+    "table": "dining table", "desk": "dining table", "plant": "potted plant", "flower pot": "potted plant",
+    "television": "tv", "monitor": "tv", "screen": "tv", "computer": "laptop",
+    "phone": "cell phone", "mobile": "cell phone", "smartphone": "cell phone", "mobile phone": "cell phone",
+    "fridge": "refrigerator", "mug": "cup", "bag": "handbag", "purse": "handbag",
+    "luggage": "suitcase", "ball": "sports ball", "puppy": "dog", "kitten": "cat", "toilet seat": "toilet",
+    "basin": "sink", "remote control": "remote", "hair dryer": "hair drier", "teddy": "teddy bear",
+}
+
+_TERMS = {name: name for name in COCO_CLASSES}
+_TERMS.update(SYNONYMS)
+# Longest terms first, so "cell phone" wins over "phone" and "hot dog" over "dog"
+_PATTERN = re.compile(r"\b(" + "|".join(re.escape(term) for term in sorted(_TERMS, key=len, reverse=True))
+                      + r")(?:es|s)?\b")
+
+def query_targets(query: Optional[str]) -> Optional[List[str]]:
+    """
+    The COCO class names a query asks for ("where is my phone" -> ["cell
+    phone"]), or None when it names none, e.g. "what is around me".
+    """
+    if not query:
+        return None
+    targets = []
+    for match in _PATTERN.finditer(query.lower()):
+        name = _TERMS[match.group(1)]
+        if name not in targets:
+            targets.append(name)
+    return targets or None
+
+def direction(x: float, width: float) -> str:
+    """ "left", "ahead" or "right" for a horizontal position in the frame."""
+    fraction = x / width if width else 0.5
+    return "left" if fraction < 1 / 3 else "right" if fraction > 2 / 3 else "ahead"
+
+def nearest_cell(grid: np.ndarray, close_ratio: float = 2.0) -> Dict[str, Any]:
+    """
+    The closest cell of a depth grid (relative inverse depth): its direction,
+    height ("high", "middle" or "low"), how much closer it is than the median
+    cell, and whether that makes it close.
+    """
+    grid = np.asarray(grid, dtype=np.float32)
+    rows, cols = grid.shape
+    row, col = np.unravel_index(int(np.argmax(grid)), grid.shape)
+    median = float(np.median(grid))
+    ratio = float(grid[row, col] / median) if median > 0 else 1.0
+    height_fraction = (row + 0.5) / rows
+    return {
+        "direction": direction(col + 0.5, cols),
+        "height": "high" if height_fraction < 1 / 3 else "low" if height_fraction > 2 / 3 else "middle",
+        "row": int(row),
+        "col": int(col),
+        "closeness": round(ratio, 2),
+        "close": ratio >= close_ratio,
+    }
+
+def distance_label(closeness: float, very_close: float = 2.0, near: float = 1.2) -> str:
+    """
+    "very close", "nearby" or "farther away" for an object's closeness: its
+    inverse depth over the frame's median. MiDaS depth has no metric scale.
+    """
+    return "very close" if closeness >= very_close else "nearby" if closeness >= near else "farther away"
+
+def rank_objects(objects: List[Dict[str, Any]], confident: float = 0.5) -> List[Dict[str, Any]]:
+    """
+    Confident detections first, then the rest, nearest first within each
+    group. MiDaS depth is relative inverse depth: larger is closer.
+    """
+    return sorted(objects, key=lambda obj: (obj["confidence"] < confident, -obj["depth"], -obj["confidence"]))
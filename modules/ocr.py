@@ -1,16 +1,44 @@
 """
 OCR Service Module - Text extraction using RapidOCR
 """
+import os
 import logging
+import threading
+import cv2
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence, Tuple
+import rapidocr_onnxruntime
 from rapidocr_onnxruntime import RapidOCR
+from config import OCR_REC_BATCH_NUM, OCR_FAST_MAX_SIDE, OCR_FAST_USE_CLS, OCR_FAST_GATE_SIDE, QOS_ENABLED
+from modules.metrics import stage
 
 logger = logging.getLogger(__name__)
 
+PROVIDERS = ['CUDAExecutionProvider', 'CPUExecutionProvider']
+
+def crop_roi(image: np.ndarray, roi: Sequence[float]) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """Crop [x1, y1, x2, y2] (pixels, clamped to the image) and return the crop and its offset."""
+    h, w = image.shape[:2]
+    x1, y1 = min(max(int(roi[0]), 0), w), min(max(int(roi[1]), 0), h)
+    x2, y2 = min(max(int(np.ceil(roi[2])), x1), w), min(max(int(np.ceil(roi[3])), y1), h)
+    return image[y1:y2, x1:x2], (x1, y1)
+
+def downscale(image: np.ndarray, max_side: int) -> Tuple[np.ndarray, float]:
+    """Shrink image so its longest side is at most max_side; returns the image and the scale used."""
+    scale = max_side / max(image.shape[:2])
+    if scale >= 1.0:
+        return image, 1.0
+    size = (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
 class OCRReader:
     def __init__(self):
         self.ocr_engine = None
+        # Engine for mode "fast", created at startup when QoS is on and on
+        # first use otherwise: detection is limited to OCR_FAST_MAX_SIDE
+        # instead of upscaling small inputs
+        self.fast_engine = None
+        self._fast_lock = threading.Lock()
         self.is_initialized = False
 
     def load_model(self):
@@ -18,30 +46,98 @@ class OCRReader:
             return
         try:
             logger.info("Initializing OCR Service with RapidOCR...")
-            self.ocr_engine = RapidOCR(providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+            self.ocr_engine = RapidOCR(providers=PROVIDERS, rec_batch_num=OCR_REC_BATCH_NUM)
+            if QOS_ENABLED:
+                # QoS switches to the fast engine under overload; build it now
+                self._get_fast_engine()
             self.is_initialized = True
             logger.info("OCR Service initialized successfully with RapidOCR")
         except Exception as e:
             logger.error(f"Error initializing OCR Service: {e}")
             self.is_initialized = False
 
-    def read(self, image: np.ndarray) -> List[Dict]:
+    def _get_fast_engine(self) -> RapidOCR:
+        if self.fast_engine is None:
+            with self._fast_lock:
+                if self.fast_engine is None:
+                    logger.info("Initializing fast RapidOCR engine...")
+                    self.fast_engine = RapidOCR(providers=PROVIDERS, rec_batch_num=OCR_REC_BATCH_NUM,
+                                                det_limit_type="max", det_limit_side_len=OCR_FAST_MAX_SIDE)
+        return self.fast_engine
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Bytes of the ONNX models (detection, angle classifier, recognition) each engine loads."""
+        models_dir = os.path.join(os.path.dirname(rapidocr_onnxruntime.__file__), "models")
+        try:
+            engine_bytes = sum(os.path.getsize(os.path.join(models_dir, name))
+                               for name in os.listdir(models_dir) if name.endswith(".onnx"))
+        except OSError:
+            engine_bytes = 0
+        footprint = {}
+        if self.ocr_engine is not None:
+            footprint["rapidocr"] = engine_bytes
+        if self.fast_engine is not None:
+            footprint["rapidocr_fast"] = engine_bytes
+        return footprint
+
+    def read(self, image: np.ndarray, mode: Optional[str] = None,
+             roi: Optional[Sequence[float]] = None) -> List[Dict]:
+        """
+        Read the text in an RGB image. mode "fast" trades some accuracy on
+        small text for speed (see OCR_FAST_* in config.py). roi limits reading
+        to an [x1, y1, x2, y2] pixel region; boxes are always returned in the
+        coordinates of the full image.
+        """
         if not self.is_initialized:
             return []
         
         try:
-            result, _ = self.ocr_engine(image)
-            if not result:
-                return []
+            offset = (0, 0)
+            if roi is not None:
+                image, offset = crop_roi(image, roi)
+                if image.size == 0:
+                    return []
+
+            if mode == 'fast':
+                return self._read_fast(image, offset)
 
-            text_results = []
-            for item in result:
-                text_results.append({
-                    'text': item[1],
-                    'confidence': float(item[2]),
-                    'box': item[0]
-                })
-            return text_results
+            with stage("rapidocr"):
+                result, _ = self.ocr_engine(image)
+            return self._results(result, 1.0, offset)
         except Exception as e:
             logger.error(f"Error extracting text from image: {e}")
             return []
+
+    def _read_fast(self, image: np.ndarray, offset: Tuple[int, int]) -> List[Dict]:
+        engine = self._get_fast_engine()
+        small, scale = downscale(image, OCR_FAST_MAX_SIDE)
+
+        if OCR_FAST_GATE_SIDE and OCR_FAST_GATE_SIDE < max(small.shape[:2]):
+            # Most navigation frames have no text: a detection-only pass on a
+            # thumbnail answers that for a fraction of the full pipeline
+            with stage("ocr_gate"):
+                thumbnail, _ = downscale(image, OCR_FAST_GATE_SIDE)
+                boxes, _ = engine(thumbnail, use_cls=False, use_rec=False)
+            if not boxes:
+                return []
+
+        with stage("rapidocr"):
+            result, _ = engine(small, use_cls=OCR_FAST_USE_CLS)
+        return self._results(result, scale, offset)
+
+    @staticmethod
+    def _results(result, scale: float, offset: Tuple[int, int]) -> List[Dict]:
+        if not result:
+            return []
+
+        text_results = []
+        for item in result:
+            box = item[0]
+            if scale != 1.0 or offset != (0, 0):
+                box = [[x / scale + offset[0], y / scale + offset[1]] for x, y in box]
+            text_results.append({
+                'text': item[1],
+                'confidence': float(item[2]),
+                'box': box
+            })
+        return text_results
@@ -0,0 +1,108 @@
+"""
+QoS Module - Moves requests to lighter model tiers to hold a latency target
+
+Requests that do not ask for a mode run on the "accurate" tier until their
+task falls behind: its recent p95 latency goes over target, or its worker
+queue fills up. From then on they run on the "fast" tier (lighter models,
+smaller inputs) until latency has clearly recovered, or traffic has died
+down, with nothing queued.
+"""
+import time
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+import numpy as np
+from modules.metrics import QOS_FAST_TIER, QOS_SWITCHES
+
+logger = logging.getLogger(__name__)
+
+TIERS = ("accurate", "fast")
+
+class _TaskState:
+    def __init__(self):
+        self.tier = "accurate"
+        self.switched_at = 0.0
+        self.switches = 0
+        # Tier -> (finished at, seconds) of recent cache misses on that tier
+        self.samples: Dict[str, Deque[Tuple[float, float]]] = {tier: deque() for tier in TIERS}
+
+class QoSController:
+    """
+    Picks the tier for requests of each task listed in targets_ms (task ->
+    p95 target in ms). pressure(task) reports how full the task's worker
+    queue is, from 0 (nothing waiting) to 1 (requests are being rejected).
+    """
+
+    def __init__(self, targets_ms: Dict[str, float], pressure: Callable[[str], float], window_seconds: float = 30,
+                 min_samples: int = 20, queue_high: float = 0.5, recover_ratio: float = 0.6,
+                 min_dwell_seconds: float = 10, enabled: bool = True):
+        self.targets_ms = dict(targets_ms)
+        self.pressure = pressure
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.queue_high = queue_high
+        self.recover_ratio = recover_ratio
+        self.min_dwell_seconds = min_dwell_seconds
+        self.enabled = enabled
+        self._states = {task: _TaskState() for task in self.targets_ms}
+        self._lock = threading.Lock()
+
+    def resolve(self, task: str, requested: Optional[str] = None) -> str:
+        """The tier a request runs on: the one it asked for, or the task's current tier."""
+        if requested is not None:
+            return requested
+        if not self.enabled or task not in self._states:
+            return "accurate"
+        with self._lock:
+            self._update(task, time.monotonic())
+            return self._states[task].tier
+
+    def observe(self, task: str, tier: str, seconds: float):
+        """Record how long a request that ran a model took."""
+        state = self._states.get(task)
+        if state is None or tier not in state.samples:
+            return
+        with self._lock:
+            state.samples[tier].append((time.monotonic(), seconds))
+
+    def _p95_ms(self, task: str, tier: str, now: float) -> Optional[float]:
+        samples = self._states[task].samples[tier]
+        while samples and samples[0][0] < now - self.window_seconds:
+            samples.popleft()
+        if len(samples) < self.min_samples:
+            return None
+        return float(np.percentile([seconds for _, seconds in samples], 95)) * 1000
+
+    def _update(self, task: str, now: float):
+        state = self._states[task]
+        if now - state.switched_at < self.min_dwell_seconds and state.switches:
+            return
+        target = self.targets_ms[task]
+        p95 = self._p95_ms(task, state.tier, now)
+        pressure = self.pressure(task)
+        if state.tier == "accurate":
+            if pressure >= self.queue_high or (p95 is not None and p95 > target):
+                self._switch(task, state, "fast", now, p95, pressure)
+        elif pressure == 0 and (p95 is None or p95 < target * self.recover_ratio):
+            # Too few recent requests to measure means the load has gone
+            self._switch(task, state, "accurate", now, p95, pressure)
+
+    def _switch(self, task: str, state: _TaskState, tier: str, now: float, p95: Optional[float], pressure: float):
+        state.tier = tier
+        state.switched_at = now
+        state.switches += 1
+        # Samples from before the last switch describe a different load
+        state.samples[tier].clear()
+        QOS_FAST_TIER.set(int(tier == "fast"), task=task)
+        QOS_SWITCHES.inc(task=task, tier=tier)
+        p95_text = f"{p95:.0f} ms" if p95 is not None else "n/a"
+        logger.info(f"QoS: {task} moved to the {tier} tier (p95 {p95_text}, queue {pressure:.0%} full)")
+
+    def stats(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return {task: {"tier": state.tier, "target_p95_ms": self.targets_ms[task],
+                           "p95_ms": self._p95_ms(task, state.tier, now),
+                           "samples": len(state.samples[state.tier]), "switches": state.switches}
+                    for task, state in self._states.items()}
@@ -0,0 +1,287 @@
+"""
+Service Registry - Selective, parallel or lazy loading of the AI services
+
+With a memory budget, the registry also keeps track of how much memory each
+loaded service holds and unloads the least recently used idle services once
+the total goes over the budget. An unloaded ("evicted") service is loaded
+again by its next request. Pinned services are never evicted. Services that
+eager loading left out because the budget was already full are "deferred"
+and load on their first request.
+"""
+import gc
+import os
+import sys
+import ctypes
+import importlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from modules.metrics import MODEL_EVICTIONS
+
+logger = logging.getLogger(__name__)
+
+# Service name -> "module:ClassName". Modules are only imported when their
+# service is built, so disabled services never pull in their libraries.
+SERVICE_CLASSES = {
+    "vision": "modules.vision:VisionModule",
+    "object": "modules.object_detection:ObjectDetector",
+    "face": "modules.face_recognition:FaceRecognizer",
+    "ocr": "modules.ocr:OCRReader",
+}
+
+class ServiceUnavailableError(Exception):
+    """Raised when a service is disabled or failed to load."""
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"The {name} service is {reason}.")
+        self.name = name
+        self.reason = reason
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+def _release_memory():
+    """Hand the memory of unloaded models back to the system."""
+    gc.collect()
+    # Only look at CUDA when a service already imported torch
+    torch = sys.modules.get("torch")
+    if torch is not None and hasattr(torch, "cuda") and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    try:
+        # glibc keeps freed heap memory for reuse unless asked to return it
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+class ServiceEntry:
+    def __init__(self, name: str, class_path: str, enabled: bool, pinned: bool = False):
+        self.name = name
+        self.class_path = class_path
+        self.state = "pending" if enabled else "disabled"
+        self.instance = None
+        self.load_seconds = None
+        self.error = None
+        self.lock = threading.Lock()
+        self.pinned = pinned
+        # Bytes held while loaded: the service's memory_footprint() when it
+        # has one, else how much the process grew while it loaded
+        self.memory_bytes = None
+        self.last_used = 0.0
+        # Calls currently using the instance; a service in use is never evicted
+        self.active = 0
+        self.evictions = 0
+
+    def status(self) -> Dict[str, Any]:
+        memory_mb = round(self.memory_bytes / 2**20, 1) if self.memory_bytes is not None else None
+        return {"state": self.state, "load_seconds": self.load_seconds, "error": self.error,
+                "memory_mb": memory_mb, "pinned": self.pinned, "evictions": self.evictions}
+
+class ServiceRegistry:
+    """
+    Builds and loads each enabled service, either eagerly in background
+    threads (load_all) or on first use (get). With memory_budget_mb set, idle
+    services other than the pinned ones are evicted, least recently used
+    first, while the loaded services hold more than the budget.
+    """
+
+    def __init__(self, enabled: List[str], lazy: bool = False, service_classes: Dict[str, str] = SERVICE_CLASSES,
+                 memory_budget_mb: Optional[float] = None, pinned: Iterable[str] = ()):
+        self.lazy = lazy
+        unknown = (set(enabled) | set(pinned)) - set(service_classes)
+        if unknown:
+            raise ValueError(f"Unknown services in ENABLED_SERVICES or MODEL_PINNED_SERVICES: {sorted(unknown)}")
+        self.entries = {name: ServiceEntry(name, path, name in enabled, name in pinned)
+                        for name, path in service_classes.items()}
+        self.memory_budget = memory_budget_mb * 2**20 if memory_budget_mb is not None else None
+        self._budget_lock = threading.Lock()
+        self._warned_at = float("-inf")
+
+    def get(self, name: str) -> Any:
+        """Return the loaded service, loading it first if needed (blocking)."""
+        entry = self.entries[name]
+        entry.last_used = time.monotonic()
+        service = entry.instance
+        if entry.state == "ready" and service is not None:
+            return service
+        if entry.state == "disabled":
+            raise ServiceUnavailableError(name, "disabled on this server")
+        self._load(entry)
+        if entry.state != "ready":
+            raise ServiceUnavailableError(name, "unavailable because its models failed to load")
+        return entry.instance
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[Any]:
+        """get() for the length of a call: the service cannot be evicted until it returns."""
+        entry = self.entries[name]
+        with self._budget_lock:
+            entry.active += 1
+        try:
+            yield self.get(name)
+        finally:
+            with self._budget_lock:
+                entry.active -= 1
+                entry.last_used = time.monotonic()
+            if self.memory_budget is not None and entry.state == "ready":
+                # Services like the object detector load lighter models on
+                # first use, so their footprint can grow after loading
+                self._measure(entry)
+                self._enforce_budget()
+
+    def peek(self, name: str) -> Optional[Any]:
+        """The service if it is already loaded, without triggering a load."""
+        entry = self.entries[name]
+        return entry.instance if entry.state == "ready" else None
+
+    def _load(self, entry: ServiceEntry):
+        # Concurrent callers wait on the lock and find the service loaded
+        with entry.lock:
+            if entry.state in ("ready", "failed", "disabled"):
+                return
+            if self.memory_budget is not None:
+                # Make room for it first when its size is known from an earlier load
+                self._enforce_budget(reserve=entry.memory_bytes or 0, keep=entry)
+            entry.state = "loading"
+            started = time.perf_counter()
+            rss_before = _rss_bytes()
+            try:
+                module_name, class_name = entry.class_path.split(":")
+                service = getattr(importlib.import_module(module_name), class_name)()
+                service.load_model()
+                if not service.is_initialized:
+                    raise RuntimeError("load_model() did not initialize the service")
+                entry.instance = service
+                entry.last_used = time.monotonic()
+                self._measure(entry, rss_before)
+                entry.state = "ready"
+            except Exception as e:
+                logger.error(f"Error loading {entry.name} service: {e}")
+                entry.error = str(e)
+                entry.state = "failed"
+            entry.load_seconds = round(time.perf_counter() - started, 2)
+            logger.info(f"{entry.name} service {entry.state} after {entry.load_seconds}s")
+        if self.memory_budget is not None and entry.state == "ready":
+            self._enforce_budget(keep=entry)
+
+    def _measure(self, entry: ServiceEntry, rss_before: Optional[int] = None):
+        service = entry.instance
+        if service is not None and hasattr(service, "memory_footprint"):
+            entry.memory_bytes = sum(service.memory_footprint().values())
+        elif rss_before is not None:
+            # Only an estimate when other services load at the same time
+            rss_after = _rss_bytes()
+            if rss_after is not None:
+                entry.memory_bytes = max(0, rss_after - rss_before)
+
+    def memory_used(self) -> int:
+        """Bytes held by the loaded services."""
+        return sum(entry.memory_bytes or 0 for entry in self.entries.values() if entry.state == "ready")
+
+    def _enforce_budget(self, reserve: int = 0, keep: Optional[ServiceEntry] = None):
+        """Evict idle, unpinned services, least recently used first, until reserve more bytes fit the budget."""
+        evicted = []
+        with self._budget_lock:
+            used = self.memory_used()
+            candidates = sorted((entry for entry in self.entries.values()
+                                 if entry.state == "ready" and not entry.pinned and entry.active == 0
+                                 and entry is not keep), key=lambda entry: entry.last_used)
+            for entry in candidates:
+                if used + reserve <= self.memory_budget:
+                    break
+                used -= entry.memory_bytes or 0
+                evicted.append((entry, entry.instance))
+                entry.instance = None
+                entry.state = "evicted"
+                entry.evictions += 1
+            # Pinned and busy services can keep the total over budget; say so once a minute
+            now = time.monotonic()
+            if used > self.memory_budget and now - self._warned_at >= 60:
+                self._warned_at = now
+                logger.warning(f"Loaded services use {used / 2**20:.0f} MB, over the "
+                               f"{self.memory_budget / 2**20:.0f} MB budget, but none can be evicted")
+        for entry, service in evicted:
+            self._unload(entry, service)
+
+    def _unload(self, entry: ServiceEntry, service: Any):
+        # Calls that got the instance before it was evicted finish with it;
+        # use() keeps it from being evicted while they run
+        if hasattr(service, "unload_model"):
+            try:
+                service.unload_model()
+            except Exception as e:
+                logger.error(f"Error unloading {entry.name} service: {e}")
+        del service
+        _release_memory()
+        MODEL_EVICTIONS.inc(service=entry.name)
+        logger.info(f"Evicted the idle {entry.name} service to stay within the memory budget")
+
+    def unload(self, name: str) -> bool:
+        """Evict a loaded, idle service now (pinned or not). Returns whether it was evicted."""
+        entry = self.entries[name]
+        with self._budget_lock:
+            if entry.state != "ready" or entry.active:
+                return False
+            service = entry.instance
+            entry.instance = None
+            entry.state = "evicted"
+            entry.evictions += 1
+        self._unload(entry, service)
+        return True
+
+    def load_all(self, names: Optional[Iterable[str]] = None) -> List[threading.Thread]:
+        """
+        Start loading every enabled service (or only those in names) in its
+        own background thread. With a memory budget they load one after
+        another instead, pinned services first, and the rest are left to load
+        on first use once the budget is full.
+        """
+        pending = [entry for entry in self.entries.values()
+                   if entry.state == "pending" and (names is None or entry.name in names)]
+        if self.memory_budget is not None:
+            pending.sort(key=lambda entry: not entry.pinned)
+            thread = threading.Thread(target=self._load_within_budget, args=(pending,), name="load-services",
+                                      daemon=True)
+            thread.start()
+            return [thread]
+        threads = []
+        for entry in pending:
+            thread = threading.Thread(target=self._load, args=(entry,), name=f"load-{entry.name}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def _load_within_budget(self, entries: List[ServiceEntry]):
+        for entry in entries:
+            if not entry.pinned and self.memory_used() >= self.memory_budget:
+                # Never loaded, so not an eviction; a request may be loading it already
+                with entry.lock:
+                    if entry.state == "pending":
+                        entry.state = "deferred"
+                continue
+            self._load(entry)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {name: entry.status() for name, entry in self.entries.items()}
+
+    def memory_stats(self) -> Dict[str, Any]:
+        budget_mb = round(self.memory_budget / 2**20, 1) if self.memory_budget is not None else None
+        return {"budget_mb": budget_mb, "used_mb": round(self.memory_used() / 2**20, 1),
+                "evictions": sum(entry.evictions for entry in self.entries.values())}
+
+    def ready(self, name: Optional[str] = None) -> bool:
+        """
+        Whether one service (or every enabled service) can take requests.
+        With lazy loading a service that has not been used yet counts as
+        ready, and so do evicted and deferred ones, which load on their next
+        request.
+        """
+        accepted = ("ready", "evicted", "deferred") + (("pending",) if self.lazy else ())
+        if name is not None:
+            return self.entries[name].state in accepted
+        return all(entry.state in accepted + ("disabled",) for entry in self.entries.values())
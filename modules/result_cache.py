@@ -0,0 +1,126 @@
+"""
+Result Cache - Content-addressed LRU + TTL cache for task results
+"""
+import json
+import time
+import logging
+import threading
+import cv2
+import numpy as np
+from collections import OrderedDict, Counter
+from typing import Any, Dict, Optional, Tuple
+from modules.frame import Frame
+
+logger = logging.getLogger(__name__)
+
+def exact_hash(frame: Frame) -> str:
+    """Hash of the uploaded bytes (or the pixels when there are none)."""
+    return frame.digest
+
+def dhash(frame: Frame, hash_size: int = 8) -> str:
+    """
+    Difference hash: the sign of horizontal gradients on a tiny grayscale
+    thumbnail. Re-encoded or slightly shifted shots of the same scene usually
+    get the same hash.
+    """
+    small = cv2.resize(frame.bgr, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+    return np.packbits(bits).tobytes().hex()
+
+def hash_distance(a: str, b: str) -> int:
+    """Number of differing bits between two hex hashes of equal length."""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+HASHERS = {"exact": exact_hash, "dhash": dhash}
+
+class ResultCache:
+    """
+    Maps (task, query_text, image hash) to a finished response.
+
+    Entries expire after ttl_seconds and the least recently used ones are
+    evicted once max_entries or max_bytes (estimated from the JSON size) is
+    exceeded. invalidate(task) drops a task's entries and also rejects results
+    that were being computed while it happened.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 30.0, max_bytes: int = 32 * 2**20,
+                 hash_mode: str = "exact"):
+        if hash_mode not in HASHERS:
+            raise ValueError(f"Unknown cache hash mode {hash_mode!r}, expected one of {list(HASHERS)}")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hash_mode = hash_mode
+        self._hasher = HASHERS[hash_mode]
+        self._entries: "OrderedDict[Tuple, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._generations = Counter()
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+
+    def key(self, task: str, query_text: Optional[str], frame: Frame, variant: Optional[str] = None) -> Tuple:
+        """variant separates results of the same frame computed with different models."""
+        query = (query_text or "").strip().lower()
+        return (task, query, variant, self._hasher(frame))
+
+    def generation(self, task: str) -> int:
+        """Token to pass to put() so results computed across an invalidation are dropped."""
+        with self._lock:
+            return self._generations[task]
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        task = key[0]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses[task] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits[task] += 1
+            return entry[0]
+
+    def put(self, key: Tuple, value: Any, generation: Optional[int] = None):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generations[key[0]]:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, task: str) -> int:
+        with self._lock:
+            self._generations[task] += 1
+            stale = [key for key in self._entries if key[0] == task]
+            for key in stale:
+                self._drop(key)
+        if stale:
+            logger.info(f"Invalidated {len(stale)} cached {task} results.")
+        return len(stale)
+
+    def _drop(self, key: Tuple):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hash_mode": self.hash_mode,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+            }
@@ -0,0 +1,117 @@
+"""
+Inference Scheduler - Bounded per-model worker pools
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from modules.metrics import QUEUE_WAIT_SECONDS, record_stage
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when a model queue cannot accept more work."""
+
+    def __init__(self, pool_name: str, retry_after: int):
+        super().__init__(f"The {pool_name} service is busy, please retry shortly.")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+class ModelPool:
+    """A worker pool for one model service with a bounded wait queue."""
+
+    def __init__(self, name: str, workers: int, queue_depth: int, retry_after: int = 1):
+        self.name = name
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"infer-{name}")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_depth
+
+    def _run(self, fn: Callable, submitted: float):
+        waited = time.perf_counter() - submitted
+        QUEUE_WAIT_SECONDS.observe(waited, pool=self.name)
+        record_stage("queue_wait", waited)
+        with self._lock:
+            self._running += 1
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _done(self, _future):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    async def submit(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on this pool, rejecting fast when the queue is full."""
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise QueueFullError(self.name, self.retry_after)
+            self._pending += 1
+
+        # The slot is released when the worker finishes, not when the caller
+        # stops waiting, so abandoned requests still count against the queue.
+        # The worker runs in a copy of the caller's context so stage timings
+        # reach the request they belong to.
+        context = contextvars.copy_context()
+        future = self.executor.submit(context.run, self._run, functools.partial(fn, *args, **kwargs),
+                                      time.perf_counter())
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def pressure(self) -> float:
+        """How full the wait queue is: 0 with nothing waiting, 1 when calls are being rejected."""
+        with self._lock:
+            if self.queue_depth == 0:
+                return 1.0 if self._pending >= self.capacity else 0.0
+            return min(max(self._pending - self._running, 0) / self.queue_depth, 1.0)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "running": self._running,
+                "waiting": self._pending - self._running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class InferenceScheduler:
+    """Routes blocking inference calls to the pool that owns each model."""
+
+    def __init__(self, pool_config: Dict[str, Dict[str, int]], retry_after: int = 1):
+        self.pools = {
+            name: ModelPool(name, cfg.get("workers", 1), cfg.get("queue_depth", 0), retry_after)
+            for name, cfg in pool_config.items()
+        }
+
+    async def run(self, pool_name: str, fn: Callable, *args, **kwargs) -> Any:
+        return await self.pools[pool_name].submit(fn, *args, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown()
+        logger.info("Inference scheduler shut down.")
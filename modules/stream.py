@@ -0,0 +1,130 @@
+"""
+Stream Module - Per-session state for continuous navigation frames
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from modules.frame import Frame
+from modules.result_cache import dhash, hash_distance
+from modules.tracking import ObjectTracker
+
+logger = logging.getLogger(__name__)
+
+STREAM_TASKS = ('find_object', 'recognize_face')
+
+class LatestFrameSlot:
+    """
+    Holds only the newest unprocessed frame. A frame that arrives while the
+    previous one is still waiting replaces it, so inference always works on
+    the most recent view and latency stays bounded when it falls behind.
+    """
+
+    def __init__(self):
+        self._data = None
+        self._event = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, data: bytes):
+        if self._data is not None:
+            self.dropped += 1
+        self._data = data
+        self._event.set()
+
+    async def take(self) -> bytes:
+        await self._event.wait()
+        self._event.clear()
+        data, self._data = self._data, None
+        return data
+
+class StreamSession:
+    """
+    Runs find_object (and optionally recognize_face) on a stream of frames and
+    reports only changes.
+
+    Full detection is skipped while the frame stays visually the same as the
+    last detected one (perceptual hash within reuse_distance bits), for at
+    most detect_interval frames in a row; the tracked objects are reused
+    instead. Faces are recognized every face_interval processed frames; on
+    all but every face_redetect_interval-th of those passes only the faces
+    found last time are looked for, around their previous boxes.
+    """
+
+    def __init__(self, detect_objects: Callable[[Frame], Awaitable[List[Dict[str, Any]]]],
+                 recognize_faces: Callable[[Frame, Optional[List[List[float]]]], Awaitable[List[Dict[str, Any]]]],
+                 tasks: List[str], detect_interval: int = 5, reuse_distance: int = 4, face_interval: int = 3,
+                 face_redetect_interval: int = 4):
+        self.detect_objects = detect_objects
+        self.recognize_faces = recognize_faces
+        self.tasks = tasks
+        self.detect_interval = detect_interval
+        self.reuse_distance = reuse_distance
+        self.face_interval = face_interval
+        self.face_redetect_interval = face_redetect_interval
+        self.tracker = ObjectTracker()
+        self.known_faces = set()
+        self.face_boxes = []
+        self.face_passes = 0
+        self.face_tracked = 0
+        self.frames = 0
+        self.detections = 0
+        self.reused = 0
+        self._last_hash = None
+        self._since_detect = 0
+
+    async def process(self, frame: Frame) -> Optional[Dict[str, Any]]:
+        """Process one frame and return the changes to push, or None."""
+        started = time.perf_counter()
+        self.frames += 1
+        steps = []
+        if 'find_object' in self.tasks:
+            steps.append(self._objects(frame))
+        if 'recognize_face' in self.tasks and (self.frames - 1) % self.face_interval == 0:
+            steps.append(self._faces(frame))
+
+        message = {}
+        for update in await asyncio.gather(*steps):
+            message.update(update)
+        if not message:
+            return None
+        message["frame"] = self.frames
+        message["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return message
+
+    async def _objects(self, frame: Frame) -> Dict[str, Any]:
+        frame_hash = dhash(frame)
+        if (self._last_hash is not None and self._since_detect < self.detect_interval
+                and hash_distance(frame_hash, self._last_hash) <= self.reuse_distance):
+            # Scene has not changed: keep the tracked objects
+            self._since_detect += 1
+            self.reused += 1
+            return {}
+
+        objects = await self.detect_objects(frame)
+        self.detections += 1
+        self._last_hash = frame_hash
+        self._since_detect = 0
+        events = self.tracker.update(objects)
+        return {"objects": events} if events else {}
+
+    async def _faces(self, frame: Frame) -> Dict[str, Any]:
+        tracked = bool(self.face_boxes) and self.face_passes % self.face_redetect_interval != 0
+        self.face_passes += 1
+        if tracked:
+            self.face_tracked += 1
+            faces = await self.recognize_faces(frame, self.face_boxes)
+        else:
+            faces = await self.recognize_faces(frame, None)
+        self.face_boxes = [face['box'] for face in faces]
+        names = {face['name'] for face in faces if face['name'] != 'Unknown'}
+        events = {}
+        if names - self.known_faces:
+            events["appeared"] = sorted(names - self.known_faces)
+        if self.known_faces - names:
+            events["left"] = sorted(self.known_faces - names)
+        self.known_faces = names
+        return {"faces": events} if events else {}
+
+    def stats(self) -> Dict[str, int]:
+        return {"frames": self.frames, "detections": self.detections, "reused": self.reused,
+                "face_passes": self.face_passes, "face_tracked": self.face_tracked}
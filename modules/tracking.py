@@ -0,0 +1,90 @@
+"""
+Object Tracking Module - Follow detections across stream frames
+"""
+from typing import List, Dict, Any
+
+def iou(a: List[float], b: List[float]) -> float:
+    """Intersection over union of two [x1, y1, x2, y2] boxes."""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+class ObjectTracker:
+    """
+    Greedy IoU tracker that gives detections stable ids and reports only what
+    changed since the previous update: new, moved, closer and gone objects.
+
+    MiDaS predicts relative inverse depth whose scale and shift change from
+    frame to frame, so objects are compared by their closeness (depth over
+    the frame's median) rather than by raw depth: a larger closeness means
+    the object came closer than the rest of the scene.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, move_threshold: float = 0.1,
+                 closer_ratio: float = 1.15, max_missed: int = 2):
+        self.iou_threshold = iou_threshold
+        self.move_threshold = move_threshold
+        self.closer_ratio = closer_ratio
+        self.max_missed = max_missed
+        self.tracks: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 1
+
+    def update(self, objects: List[Dict[str, Any]]) -> Dict[str, list]:
+        events = {"new": [], "moved": [], "closer": [], "gone": []}
+        unmatched = set(self.tracks)
+
+        for obj in sorted(objects, key=lambda o: o["confidence"], reverse=True):
+            best_id, best_iou = None, self.iou_threshold
+            for track_id in unmatched:
+                track = self.tracks[track_id]
+                if track["name"] != obj["name"]:
+                    continue
+                overlap = iou(track["box"], obj["box"])
+                if overlap >= best_iou:
+                    best_id, best_iou = track_id, overlap
+
+            if best_id is None:
+                track_id = self._next_id
+                self._next_id += 1
+                self.tracks[track_id] = dict(obj, track_id=track_id, missed=0)
+                events["new"].append(dict(obj, track_id=track_id))
+                continue
+
+            unmatched.discard(best_id)
+            track = self.tracks[best_id]
+            change = None
+            if track["closeness"] > 0 and obj["closeness"] > track["closeness"] * self.closer_ratio:
+                change = "closer"
+            elif self._shift(track["box"], obj["box"]) > self.move_threshold:
+                change = "moved"
+            # The reference box and depth only follow the object when a change
+            # is reported, so slow drift still adds up to an event eventually.
+            if change:
+                events[change].append(dict(obj, track_id=best_id))
+                track["box"] = obj["box"]
+                track["closeness"] = obj["closeness"]
+            track["confidence"] = obj["confidence"]
+            track["missed"] = 0
+
+        for track_id in unmatched:
+            track = self.tracks[track_id]
+            track["missed"] += 1
+            if track["missed"] > self.max_missed:
+                del self.tracks[track_id]
+                events["gone"].append({"track_id": track_id, "name": track["name"]})
+
+        return {kind: items for kind, items in events.items() if items}
+
+    @staticmethod
+    def _shift(old: List[float], new: List[float]) -> float:
+        """Centre displacement relative to the old box size."""
+        width = max(old[2] - old[0], 1.0)
+        height = max(old[3] - old[1], 1.0)
+        dx = ((new[0] + new[2]) - (old[0] + old[2])) / 2 / width
+        dy = ((new[1] + new[3]) - (old[1] + old[3])) / 2 / height
+        return max(abs(dx), abs(dy))
+
+    def current(self) -> List[Dict[str, Any]]:
+        return [{k: v for k, v in track.items() if k != "missed"} for track in self.tracks.values()]
@@ -2,16 +2,37 @@
 Vision Module for Scene Description and VQA
 """
 import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
 from PIL import Image
-from transformers import pipeline
+from transformers import pipeline, TextStreamer
 import torch
+from config import VISION_EMBED_CACHE_SIZE
+from modules.metrics import stage, module_bytes
+from modules.backends import compile_transformer
 
 logger = logging.getLogger(__name__)
 
+class CallbackStreamer(TextStreamer):
+    """Hands each newly decoded piece of generated text to a callback."""
+
+    def __init__(self, tokenizer, on_text: Callable[[str], None]):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.on_text = on_text
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self.on_text(text)
+
 class VisionModule:
     def __init__(self):
         self.captioner = None
         self.vqa_pipeline = None
+        # Image key -> BLIP image encoder output, so follow-up questions about
+        # the same frame skip the vision transformer
+        self._image_embeds = OrderedDict()
+        self._embeds_lock = threading.Lock()
         self.is_initialized = False
 
     def load_model(self):
@@ -28,22 +49,101 @@ class VisionModule:
             self.vqa_pipeline = pipeline("visual-question-answering", 
                                          model="Salesforce/blip-vqa-base",
                                          device=device)
+            compile_transformer(self.captioner.model)
+            compile_transformer(self.vqa_pipeline.model)
             self.is_initialized = True
             logger.info("Vision models loaded successfully.")
         except Exception as e:
             logger.error(f"Error loading vision models: {e}")
             self.is_initialized = False
 
-    def describe_scene(self, image: Image.Image) -> str:
+    def describe_scene(self, image: Image.Image, on_text: Optional[Callable[[str], None]] = None) -> str:
+        """Caption the image. on_text, if given, receives the caption piece by piece as it is generated."""
         if not self.is_initialized or not self.captioner:
             return "Vision model not ready."
         
-        results = self.captioner(image)
-        return results[0]['generated_text']
+        if on_text is None:
+            with stage("caption"):
+                results = self.captioner(image)
+            return results[0]['generated_text']
+
+        model = self.captioner.model
+        with stage("caption"), torch.no_grad():
+            pixel_values = self.captioner.image_processor(images=image, return_tensors="pt").pixel_values
+            output = model.generate(pixel_values=pixel_values.to(model.device, model.dtype),
+                                    streamer=CallbackStreamer(self.captioner.tokenizer, on_text))
+        return self.captioner.tokenizer.batch_decode(output, skip_special_tokens=True)[0].strip()
 
-    def answer_question(self, image: Image.Image, question: str) -> str:
+    def answer_question(self, image: Image.Image, question: str, image_key: Optional[str] = None,
+                        on_text: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Answer one question about the image. image_key identifies the image
+        (e.g. a content hash) so its encoding is reused by later questions;
+        on_text receives the answer as it is generated.
+        """
         if not self.is_initialized or not self.vqa_pipeline:
             return "VQA model not ready."
-            
-        results = self.vqa_pipeline(image, question=question)
-        return results[0]['answer']
+        return self.answer_questions(image, [question], image_key, on_text)[0]
+
+    def answer_questions(self, image: Image.Image, questions: List[str], image_key: Optional[str] = None,
+                         on_text: Optional[Callable[[str], None]] = None) -> List[str]:
+        """
+        Answer several questions about one image with a single generate call.
+        Streaming (on_text) is only supported for a single question.
+
+        This is BlipForQuestionAnswering.generate split in two, so the image
+        encoding can be cached and shared by the whole batch.
+        """
+        if not self.is_initialized or not self.vqa_pipeline:
+            return ["VQA model not ready."] * len(questions)
+
+        model = self.vqa_pipeline.model
+        tokenizer = self.vqa_pipeline.tokenizer
+        image_embeds = self._encode_image(image, image_key)
+        with stage("vqa"), torch.no_grad():
+            text = tokenizer(questions, padding=True, return_tensors="pt").to(model.device)
+            image_embeds = image_embeds.expand(len(questions), -1, -1)
+            image_mask = torch.ones(image_embeds.shape[:-1], dtype=torch.long, device=model.device)
+            question_embeds = model.text_encoder(input_ids=text.input_ids, attention_mask=text.attention_mask,
+                                                 encoder_hidden_states=image_embeds,
+                                                 encoder_attention_mask=image_mask, return_dict=False)[0]
+            bos_ids = torch.full((len(questions), 1), model.decoder_start_token_id, device=model.device)
+            streamer = CallbackStreamer(tokenizer, on_text) if on_text is not None and len(questions) == 1 else None
+            output = model.text_decoder.generate(
+                input_ids=bos_ids,
+                eos_token_id=model.config.text_config.sep_token_id,
+                pad_token_id=model.config.text_config.pad_token_id,
+                encoder_hidden_states=question_embeds,
+                encoder_attention_mask=text.attention_mask,
+                streamer=streamer,
+            )
+        return [answer.strip() for answer in tokenizer.batch_decode(output, skip_special_tokens=True)]
+
+    def _encode_image(self, image: Image.Image, image_key: Optional[str]) -> torch.Tensor:
+        """BLIP vision encoder output for the image, from the cache when image_key was seen recently."""
+        if image_key is not None:
+            with self._embeds_lock:
+                if image_key in self._image_embeds:
+                    self._image_embeds.move_to_end(image_key)
+                    return self._image_embeds[image_key]
+
+        model = self.vqa_pipeline.model
+        with stage("vqa_encode"), torch.no_grad():
+            pixel_values = self.vqa_pipeline.image_processor(images=image, return_tensors="pt").pixel_values
+            image_embeds = model.vision_model(pixel_values=pixel_values.to(model.device, model.dtype))[0]
+
+        if image_key is not None and VISION_EMBED_CACHE_SIZE > 0:
+            with self._embeds_lock:
+                self._image_embeds[image_key] = image_embeds
+                while len(self._image_embeds) > VISION_EMBED_CACHE_SIZE:
+                    self._image_embeds.popitem(last=False)
+        return image_embeds
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Bytes of weights held by the captioning and VQA models."""
+        footprint = {}
+        if self.captioner is not None:
+            footprint["caption"] = module_bytes(self.captioner.model)
+        if self.vqa_pipeline is not None:
+            footprint["vqa"] = module_bytes(self.vqa_pipeline.model)
+        return footprint
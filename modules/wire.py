@@ -0,0 +1,84 @@
+"""
+Wire Module - Compact response encodings and compression for mobile clients
+
+Formats:
+    json     the full response, as FastAPI would serialize it
+    compact  JSON with boxes as integer pixels and other numbers rounded to
+             three decimals
+    msgpack  compact, MessagePack-encoded, with every "box" packed as
+             little-endian int16 bytes (x1, y1, x2, y2 for objects and faces,
+             four x, y corners for OCR); needs the optional msgpack package
+"""
+import gzip
+import json
+from typing import Any, Optional, Tuple
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # Optional; the msgpack format is then unavailable
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is offered instead
+    brotli = None
+
+FORMATS = ("json", "compact", "msgpack")
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+def negotiate_format(requested: Optional[str], accept: str = "") -> str:
+    """The format asked for in ?format=, else by an Accept header naming MessagePack, else json."""
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        return requested
+    if any(media_type in accept for media_type in MSGPACK_TYPES):
+        return "msgpack"
+    return "json"
+
+def _box(value: Any) -> Any:
+    return np.rint(np.asarray(value, dtype=np.float64)).clip(-32768, 32767).astype(np.int16)
+
+def quantize(value: Any, key: Optional[str] = None, pack_boxes: bool = False) -> Any:
+    """Integer boxes (or int16 bytes with pack_boxes) and numbers rounded to three decimals."""
+    if key == "box" and isinstance(value, (list, tuple)) and value:
+        box = _box(value)
+        return box.astype("<i2").tobytes() if pack_boxes else box.tolist()
+    if isinstance(value, dict):
+        return {k: quantize(v, k, pack_boxes) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [quantize(v, key, pack_boxes) for v in value]
+    if isinstance(value, float):
+        return round(value, 3)
+    return value
+
+def encode(data: Any, fmt: str) -> Tuple[bytes, str]:
+    """(body, media type) of data in a format. Raises RuntimeError for msgpack without the package."""
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("The msgpack format needs the msgpack package on the server")
+        return msgpack.packb(quantize(data, pack_boxes=True), use_bin_type=True), "application/msgpack"
+    if fmt == "compact":
+        data = quantize(data)
+    # Same rendering as FastAPI's JSONResponse
+    body = json.dumps(data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"))
+    return body.encode("utf-8"), "application/json"
+
+def _accepted(accept_encoding: str):
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        yield coding.strip().lower()
+
+def compress(body: bytes, accept_encoding: str, min_bytes: int = 512) -> Tuple[bytes, Optional[str]]:
+    """(body, Content-Encoding) with brotli or gzip when the client accepts it and it is worth it."""
+    if len(body) < min_bytes:
+        return body, None
+    accepted = set(_accepted(accept_encoding))
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=5), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
@@ -1,8 +1,17 @@
 #!/usr/bin/env python3
 """
 Startup script for Blind Assistive System with optimized memory management.
+
+    python start_server.py [--workers N] [--host 0.0.0.0] [--port 8000]
+
+With --workers N (Linux/macOS, CPU inference) the PyTorch models are loaded
+once and N worker processes are forked afterwards, sharing the listening
+socket and the model weights (copy-on-write) instead of loading them N times.
+Services built on ONNX Runtime sessions are loaded by each worker, because
+their thread pools do not survive the fork.
 """
 
+import argparse
 import os
 import sys
 
@@ -41,8 +50,111 @@ def check_gpu_memory():
         print("PyTorch not installed. Please install PyTorch first.")
         sys.exit(1)
 
+def fork_unsafe_services():
+    """
+    Services that create ONNX Runtime sessions with their own thread pools
+    (InsightFace, RapidOCR, and YOLO/MiDaS on the "onnx" backend). Those
+    threads do not survive fork(), so a session built before the fork can
+    hang on its first run in a worker; these services load in each worker.
+    """
+    from config import MODEL_BACKEND
+    return {"face", "ocr"} | ({"object"} if MODEL_BACKEND == "onnx" else set())
+
+def serve_prefork(app, services, host, port, workers, after_fork=None):
+    """
+    Load the models in this process, then fork the workers. Each worker runs
+    its own event loop and worker pools on the shared listening socket; the
+    weights loaded before the fork are shared until a worker writes to them.
+    Services in after_fork (by default fork_unsafe_services()) are loaded by
+    each worker instead. Workers that die are restarted.
+    """
+    import gc
+    import signal
+    import socket
+    import uvicorn
+
+    after_fork = fork_unsafe_services() if after_fork is None else set(after_fork)
+    # torch's OpenMP threads do not survive fork() either: load with one
+    # thread so the pool is never started here, and let each worker start
+    # its own with its share of the cores
+    torch = sys.modules.get("torch")
+    worker_threads = max(1, (os.cpu_count() or 1) // workers)
+    if torch is not None:
+        torch.set_num_threads(1)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+
+    shared = [name for name in services.entries if name not in after_fork]
+    print(f"Loading models once for {workers} workers: {', '.join(shared)}")
+    for thread in services.load_all(shared):
+        thread.join()
+    for name, status in services.status().items():
+        if status["state"] == "failed":
+            print(f"⚠️  {name} service failed to load: {status['error']}")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Objects that exist now are never scanned by the garbage collector again,
+    # so it does not touch (and copy) the pages shared with the workers
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            if torch is not None:
+                torch.set_num_threads(worker_threads)
+            # Fork-unsafe services load in the background; /ready reports them
+            services.load_all(after_fork)
+            server = uvicorn.Server(uvicorn.Config(app, access_log=True))
+            server.run(sockets=[sock])
+            os._exit(0)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for index in range(workers):
+        spawn(index)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    print(f"✅ {workers} workers serving on http://{host}:{port}")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            print(f"⚠️  Worker {pid} exited with status {status}, restarting it")
+            spawn(index)
+
 def main():
     """Main startup function."""
+    parser = argparse.ArgumentParser(description="Start the Blind Assistive System server.")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes sharing the loaded models")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
     print("🦯 Starting Blind Assistive System...")
     
     # Setup environment
@@ -55,17 +167,32 @@ def main():
     try:
         print("Loading application...")
         import uvicorn
-        from main import app
+        import torch
+        from main import app, services
         
         print("✅ Application loaded successfully!")
-        print("🚀 Starting server on http://localhost:8000")
-        print("📡 API documentation available at http://localhost:8000/docs")
-        
+        print(f"🚀 Starting server on http://localhost:{args.port}")
+        print(f"📡 API documentation available at http://localhost:{args.port}/docs")
+
+        workers = args.workers
+        if workers > 1 and not hasattr(os, "fork"):
+            print("⚠️  Multiple workers need os.fork(), which this platform lacks. Starting one worker.")
+            workers = 1
+        elif workers > 1 and torch.cuda.is_available():
+            # A CUDA context cannot be used from a forked child, and separate
+            # workers would each need their own copy of the weights on the GPU
+            print("⚠️  Forked workers cannot share CUDA models. Starting one worker.")
+            workers = 1
+
+        if workers > 1:
+            serve_prefork(app, services, args.host, args.port, workers)
+            return
+
         # Start the server
         uvicorn.run(
             app, 
-            host="0.0.0.0", 
-            port=8000,
+            host=args.host, 
+            port=args.port,
             reload=False,  # Disable reload to prevent memory issues
             access_log=True
         )
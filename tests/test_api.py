@@ -0,0 +1,100 @@
+import base64
+import json
+import threading
+import time
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+import main
+from benchmarks.stubs import STUB_LATENCY_MS, STUB_SERVICE_CLASSES, StubOCRReader, StubVisionModule
+from modules.registry import ServiceRegistry
+from modules.scheduler import InferenceScheduler
+
+JPEG = cv2.imencode(".jpg", np.zeros((64, 64, 3), dtype=np.uint8))[1].tobytes()
+
+@pytest.fixture
+def client(monkeypatch):
+    for key in STUB_LATENCY_MS:
+        monkeypatch.setitem(STUB_LATENCY_MS, key, 0 if key != "yolo_batch_item" else STUB_LATENCY_MS[key])
+    monkeypatch.setattr(main, "services", ServiceRegistry(list(STUB_SERVICE_CLASSES), lazy=True,
+                                                          service_classes=STUB_SERVICE_CLASSES))
+    monkeypatch.setattr(main, "result_cache", None)
+    # The app's lifespan shuts the scheduler down, so every client gets its own
+    monkeypatch.setattr(main, "scheduler", InferenceScheduler(main.INFERENCE_POOLS))
+    monkeypatch.setattr(main, "MODEL_LOADING", "lazy")
+    with TestClient(main.app) as client:
+        yield client
+
+def test_multi_question_does_not_filter_objects(client):
+    response = client.post("/process_multi_upload", content=JPEG, params={
+        "tasks": "find_object,answer_question", "query_text": "Is the person holding a cup?"})
+    assert response.status_code == 200
+    tasks = response.json()["structured_data"]["tasks"]
+    assert {obj["name"] for obj in tasks["find_object"]["structured_data"]["objects"]} == {"chair", "person"}
+    assert tasks["answer_question"]["result_text"] == "yes"
+
+def test_multi_object_query_filters_objects(client):
+    response = client.post("/process_multi_upload", content=JPEG, params={
+        "tasks": "find_object", "object_query": "where is the chair"})
+    assert response.status_code == 200, response.text
+    objects = response.json()["structured_data"]["tasks"]["find_object"]["structured_data"]["objects"]
+    assert [obj["name"] for obj in objects] == ["chair"]
+
+def test_find_object_describes_distance_without_meters(client):
+    response = client.post("/process_upload", content=JPEG, params={"task": "find_object"})
+    assert response.status_code == 200, response.text
+    assert response.json()["result_text"] == "I see: chair very close, person farther away"
+    response = client.post("/process_upload", content=JPEG, params={"task": "find_object",
+                                                                    "query_text": "where is the chair"})
+    assert response.json()["result_text"] == "Found chair very close on your left"
+
+def test_full_queue_answers_503_with_retry_after(client, monkeypatch):
+    pools = dict(main.INFERENCE_POOLS, ocr={"workers": 1, "queue_depth": 1})
+    monkeypatch.setattr(main, "scheduler", InferenceScheduler(pools, retry_after=main.RETRY_AFTER_SECONDS))
+    release = threading.Event()
+    monkeypatch.setattr(StubOCRReader, "read", lambda self, image, mode=None, roi=None: release.wait() and [])
+    busy = [threading.Thread(target=client.post, args=("/process_upload",),
+                             kwargs={"content": JPEG, "params": {"task": "read_text"}}) for _ in range(2)]
+    for thread in busy:
+        thread.start()
+    try:
+        deadline = time.monotonic() + 5
+        while main.scheduler.pools["ocr"].stats()["waiting"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        response = client.post("/process_upload", content=JPEG, params={"task": "read_text"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(main.RETRY_AFTER_SECONDS)
+    finally:
+        release.set()
+        for thread in busy:
+            thread.join()
+
+def sse_events(body: str) -> list:
+    """(event, data) of each server-sent event."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+def test_process_stream_sends_pieces_then_done(client):
+    response = client.post("/process_stream", json={"task": "describe_scene",
+                                                    "image_data": base64.b64encode(JPEG).decode()})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(response.text)
+    pieces = [data["text"] for event, data in events[:-1]]
+    assert all(event == "message" for event, _ in events[:-1]) and len(pieces) > 1
+    assert events[-1] == ("done", {"result_text": "".join(pieces)})
+
+def test_process_stream_reports_errors_after_it_started(client, monkeypatch):
+    def describe_scene(self, image, on_text=None):
+        on_text("a room")
+        raise RuntimeError("generation failed")
+    monkeypatch.setattr(StubVisionModule, "describe_scene", describe_scene)
+    response = client.post("/process_stream", json={"task": "describe_scene",
+                                                    "image_data": base64.b64encode(JPEG).decode()})
+    assert response.status_code == 200
+    assert sse_events(response.text) == [("message", {"text": "a room"}),
+                                         ("error", {"detail": "generation failed", "status_code": 500})]
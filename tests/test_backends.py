@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnxruntime")
+
+class TinyDepth(torch.nn.Module):
+    """Shaped like MiDaS: (batch, 3, height, width) in, (batch, height, width) out."""
+
+    def __init__(self):
+        super().__init__()
+        self.features = torch.nn.Sequential(torch.nn.Conv2d(3, 8, 3, padding=1), torch.nn.ReLU(),
+                                            torch.nn.Conv2d(8, 1, 1))
+
+    def forward(self, x):
+        return self.features(x).squeeze(1)
+
+@pytest.mark.parametrize("quantize, tolerance", [(False, 1e-4), (True, 0.1)])
+def test_exported_midas_matches_eager(monkeypatch, tmp_path, quantize, tolerance):
+    from modules import backends
+    monkeypatch.setattr(backends, "MODEL_CACHE_DIR", str(tmp_path))
+    torch.manual_seed(0)
+    model = TinyDepth().eval()
+    example = torch.rand(1, 3, 32, 48)
+    exported = backends.compile_midas(model, "tiny", example, backend="onnx", quantize=quantize)
+    assert isinstance(exported, backends.OnnxModule)
+    assert exported.path.endswith(".int8.onnx") == quantize
+
+    # Batch, height and width differ from the export's example
+    inputs = torch.rand(2, 3, 64, 80)
+    with torch.no_grad():
+        expected = model(inputs).numpy()
+    actual = exported(inputs).numpy()
+    assert actual.shape == expected.shape
+    assert np.abs(actual - expected).mean() / np.abs(expected).mean() < tolerance
@@ -0,0 +1,79 @@
+import threading
+import time
+import pytest
+from modules.batching import MicroBatcher
+
+def submit_all(batcher, items):
+    results = [None] * len(items)
+    errors = [None] * len(items)
+
+    def submit(i):
+        try:
+            results[i] = batcher.submit(items[i])
+        except Exception as e:
+            errors[i] = e
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(items))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return results, errors
+
+def test_concurrent_items_share_a_batch_and_keep_their_results():
+    batches = []
+
+    def double(items):
+        batches.append(list(items))
+        time.sleep(0.01)
+        return [item * 2 for item in items]
+    batcher = MicroBatcher(double, max_batch_size=4, max_wait_ms=50)
+    results, errors = submit_all(batcher, list(range(8)))
+    batcher.close()
+    assert errors == [None] * 8
+    assert results == [item * 2 for item in range(8)]
+    assert all(len(batch) <= 4 for batch in batches)
+    assert len(batches) < 8
+    stats = batcher.stats.snapshot()
+    assert stats["items"] == 8
+    assert stats["batches"] == len(batches)
+
+def test_single_item_runs_after_max_wait():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=8, max_wait_ms=20)
+    started = time.perf_counter()
+    assert batcher.submit("x") == "x"
+    assert time.perf_counter() - started < 1
+    assert batcher.stats.snapshot()["batch_size_histogram"] == {1: 1}
+    batcher.close()
+
+def test_batch_error_reaches_every_caller():
+    def fail(items):
+        raise ValueError("model failed")
+    batcher = MicroBatcher(fail, max_batch_size=4, max_wait_ms=20)
+    _, errors = submit_all(batcher, [1, 2, 3])
+    batcher.close()
+    assert all(isinstance(e, ValueError) for e in errors)
+
+def test_wrong_result_count_is_an_error():
+    batcher = MicroBatcher(lambda items: items[:1], max_batch_size=4, max_wait_ms=50)
+    _, errors = submit_all(batcher, [1, 2])
+    batcher.close()
+    assert any(isinstance(e, RuntimeError) for e in errors)
+
+def test_closed_batcher_rejects_items():
+    batcher = MicroBatcher(lambda items: items)
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(1)
+
+def test_stub_object_detector_batches_concurrent_frames(monkeypatch):
+    import numpy as np
+    from benchmarks.stubs import STUB_LATENCY_MS, StubObjectDetector
+    for key, ms in (("load", 0), ("yolo", 5), ("depth", 5)):
+        monkeypatch.setitem(STUB_LATENCY_MS, key, ms)
+    detector = StubObjectDetector()
+    detector.load_model()
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    results, errors = submit_all(detector.batcher, [(frame, None)] * 4)
+    detector.unload_model()
+    assert errors == [None] * 4
+    assert all(len(objects) == 2 for objects in results)
@@ -0,0 +1,95 @@
+import numpy as np
+from modules.face_gallery import FaceGallery, aggregate_templates, l2_normalize
+
+rng = np.random.default_rng(0)
+
+def around(center: np.ndarray, count: int, noise: float) -> np.ndarray:
+    # noise is the typical distance of a photo from the center
+    return l2_normalize(center + noise / np.sqrt(len(center)) * rng.standard_normal((count, len(center))))
+
+def test_template_is_the_normalized_mean_followed_by_exemplars():
+    person = l2_normalize(rng.standard_normal(64))
+    rows, kinds, outliers = aggregate_templates(around(person, 10, 0.3), max_exemplars=3)
+    assert kinds[0] == "template" and kinds[1:] == ["exemplar"] * (len(kinds) - 1)
+    assert 1 <= len(kinds) - 1 <= 3
+    assert outliers == 0
+    assert np.allclose(np.linalg.norm(rows, axis=1), 1, atol=1e-5)
+    assert rows[0] @ person > 0.9
+
+def test_other_people_are_dropped_as_outliers():
+    person = l2_normalize(rng.standard_normal(64))
+    stranger = l2_normalize(-person + 0.1 * rng.standard_normal(64))
+    photos = np.vstack([around(person, 8, 0.2), stranger[None, :]])
+    rows, _, outliers = aggregate_templates(photos, min_similarity=0.3)
+    assert outliers == 1
+    assert np.all(rows @ stranger < 0.3)
+
+def test_near_duplicates_add_no_exemplars():
+    person = l2_normalize(rng.standard_normal(64))
+    rows, kinds, _ = aggregate_templates(np.repeat(person[None, :], 5, axis=0))
+    assert kinds == ["template"]
+    assert rows.shape == (1, 64)
+
+def test_gallery_matches_the_closest_identity():
+    alice, bob = l2_normalize(rng.standard_normal((2, 64)))
+    gallery = FaceGallery(dim=64)
+    gallery.load(["Alice", "Bob", "Alice"], np.vstack([alice, bob, around(alice, 1, 0.1)]))
+    match, unknown = gallery.match(np.vstack([around(alice, 1, 0.05), rng.standard_normal((1, 64))]), k=2)
+    assert match["name"] == "Alice"
+    assert [c["name"] for c in match["candidates"]] == ["Alice", "Bob"]
+    assert unknown["name"] == "Unknown"
+
+def clustered_gallery(people: int = 60, photos: int = 50, threshold: int = 1000):
+    centers = l2_normalize(rng.standard_normal((people, 64)))
+    vectors = np.vstack([around(center, photos, 0.5) for center in centers])
+    names = [f"person-{i}" for i in range(people) for _ in range(photos)]
+    gallery = FaceGallery(dim=64, ann_threshold=threshold, nprobe=4)
+    gallery.load(names, vectors)
+    return gallery, vectors
+
+def test_ivf_top1_matches_exact_search_near_enrolled_rows():
+    gallery, vectors = clustered_gallery()
+    assert gallery._index is not None and len(gallery._index.centroids) == int(np.sqrt(len(vectors)))
+    enrolled = vectors[rng.choice(len(vectors), 200, replace=False)]
+    queries = l2_normalize(enrolled + 0.05 / 8 * rng.standard_normal(enrolled.shape))
+    exact = np.argmax(queries @ vectors.T, axis=1)
+    approximate = [hits[0][0] for hits in gallery.search(queries, 1)]
+    assert np.array_equal(approximate, exact)
+    # Far fewer rows are scored than an exact search would
+    assert np.mean([len(rows) for rows in gallery._index.candidates(queries)]) < len(vectors) / 4
+
+def test_rows_added_after_training_go_to_their_closest_list():
+    gallery, vectors = clustered_gallery()
+    index = gallery._index
+    new = around(vectors[7], 1, 0.05)[0]
+    row = gallery.add("newcomer", new)
+    assert gallery._index is index
+    closest = int(np.argmax(index.centroids @ l2_normalize(new)))
+    assert row in index.lists[closest]
+    assert gallery.search(new[None, :], 1)[0][0][0] == row
+    assert gallery.match(new[None, :])[0]["name"] == "newcomer"
+
+def test_index_is_retrained_when_the_gallery_doubles_and_rebuilt_after_remove():
+    gallery, vectors = clustered_gallery(people=20, photos=50, threshold=500)
+    index = gallery._index
+    assert index.trained_size == 1000
+    for vector in vectors[:999]:
+        gallery.add("copy", vector)
+    assert gallery._index is index
+    gallery.add("copy", vectors[999])
+    assert gallery._index is not index and gallery._index.trained_size == 2000
+
+    assert gallery.remove("copy") == 1000
+    rebuilt = gallery._index
+    assert rebuilt.trained_size == 1000
+    assert sorted(row for rows in rebuilt.lists for row in rows) == list(range(1000))
+    assert gallery.match(vectors[:1])[0]["name"] == "person-0"
+    gallery.remove("person-0")
+    gallery.remove("person-1")
+    assert len(gallery) == 900 and gallery._index is not None
+    for i in range(2, 10):
+        gallery.remove(f"person-{i}")
+    assert len(gallery) == 500 and gallery._index is not None
+    # Below ann_threshold the search is exact again
+    gallery.remove("person-10")
+    assert gallery._index is None
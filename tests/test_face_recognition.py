@@ -0,0 +1,102 @@
+import sys
+import types
+import numpy as np
+import pytest
+
+class FakeDetector:
+    """Finds one face in the middle half of whatever image it is given."""
+
+    def __init__(self):
+        self.calls = []
+
+    def detect(self, image, input_size=None, max_num=0, metric="default"):
+        self.calls.append((image.shape[:2], input_size))
+        h, w = image.shape[:2]
+        bboxes = np.array([[w * 0.25, h * 0.25, w * 0.75, h * 0.75, 0.9]], dtype=np.float32)
+        kpss = np.array([[[w * 0.4, h * 0.4], [w * 0.6, h * 0.4], [w * 0.5, h * 0.5],
+                          [w * 0.4, h * 0.6], [w * 0.6, h * 0.6]]], dtype=np.float32)
+        return bboxes, kpss
+
+class FakeRecognition:
+    input_size = (112, 112)
+
+    def get_feat(self, crops):
+        # Mean colour of each crop, spread over the embedding
+        return np.stack([np.resize(crop.reshape(-1, 3).mean(axis=0) + 1, 512) for crop in crops])
+
+@pytest.fixture
+def face_recognition(monkeypatch):
+    """modules.face_recognition imported against a stand-in for the insightface package."""
+    app = types.ModuleType("insightface.app")
+    app.FaceAnalysis = None
+    face_align = types.ModuleType("insightface.utils.face_align")
+    face_align.norm_crop = lambda image, landmark, image_size: image[:image_size, :image_size]
+    utils = types.ModuleType("insightface.utils")
+    utils.face_align = face_align
+    for name, module in {"insightface": types.ModuleType("insightface"), "insightface.app": app,
+                         "insightface.utils": utils, "insightface.utils.face_align": face_align}.items():
+        monkeypatch.setitem(sys.modules, name, module)
+    # Imported afresh here and dropped again afterwards
+    monkeypatch.setitem(sys.modules, "modules.face_recognition", None)
+    del sys.modules["modules.face_recognition"]
+    import modules.face_recognition
+    return modules.face_recognition
+
+@pytest.fixture
+def recognizer(face_recognition, tmp_path):
+    recognizer = face_recognition.FaceRecognizer(db_dir=str(tmp_path / "faces"),
+                                                 legacy_db_path=str(tmp_path / "none.pkl"))
+    recognizer.app = types.SimpleNamespace(det_model=FakeDetector(), models={"recognition": FakeRecognition()})
+    recognizer._load_database()
+    recognizer.is_initialized = True
+    return recognizer
+
+def photo(color):
+    image = np.zeros((200, 200, 3), dtype=np.uint8)
+    image[:] = color
+    return image
+
+def test_saving_or_enrolling_again_replaces_rows_of_an_older_embedding_version(recognizer, face_recognition):
+    for name in ("Alice", "Alice", "Bob"):
+        recognizer.store.append(name, np.ones(512, dtype=np.float32) / np.sqrt(512), {"source": "pickle"})
+    recognizer._reload_gallery()
+    assert recognizer.stale_faces() == ["Alice", "Bob"]
+
+    assert recognizer.save_face("alice", photo((10, 20, 30)))
+    assert recognizer.stale_faces() == ["Bob"]
+    recognizer.enroll_faces({"bob": [photo((30, 20, 10))]})
+    assert recognizer.stale_faces() == []
+
+    rows = recognizer.store.rows()
+    assert sorted(name for name, _ in rows) == ["Alice", "Bob"]
+    assert all(meta["embedding_version"] == face_recognition.EMBEDDING_VERSION for _, meta in rows)
+    assert sorted(recognizer.gallery.names) == ["Alice", "Bob"]
+    # Current rows are kept when the person is saved again
+    assert recognizer.save_face("alice", photo((10, 20, 30)))
+    assert [name for name, _ in recognizer.store.rows()].count("Alice") == 2
+
+def test_faces_found_in_box_crops_are_mapped_back_to_the_frame(recognizer, face_recognition):
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    boxes = [
+        [100, 100, 140, 140],  # small: an 80 px crop, upscaled to the minimum input
+        [600, 440, 640, 480],  # in the corner: the crop is clipped at the frame's edge
+        [0, 0, 600, 400],      # large: the crop covers the frame
+        [700, 10, 720, 30],    # outside the frame: no crop at all
+    ]
+    faces = recognizer._detect_in_boxes(frame, boxes)
+    assert [call[0] for call in recognizer.app.det_model.calls] == [(80, 80), (60, 60), (480, 640)]
+    assert [call[1] for call in recognizer.app.det_model.calls] == [
+        (face_recognition.FACE_CROP_MIN_DET_SIZE,) * 2, (face_recognition.FACE_CROP_MIN_DET_SIZE,) * 2,
+        (face_recognition.FACE_DET_SIZE,) * 2]
+    assert np.allclose([bbox[:4] for bbox, _ in faces],
+                       [[100, 100, 140, 140], [595, 435, 625, 465], [160, 120, 480, 360]])
+    assert np.allclose(faces[1][1][0], [580 + 60 * 0.4, 420 + 60 * 0.4])
+    assert faces[0][0][4] == pytest.approx(0.9)
+
+    recognized = recognizer.recognize(frame, boxes=[[600, 440, 640, 480]])
+    assert [face["box"] for face in recognized] == [[595, 435, 625, 465]]
+
+def test_adaptive_det_size_rounds_up_to_the_stride_within_limits(face_recognition):
+    assert face_recognition.adaptive_det_size(80) == face_recognition.FACE_CROP_MIN_DET_SIZE
+    assert face_recognition.adaptive_det_size(300) == 320
+    assert face_recognition.adaptive_det_size(5000) == face_recognition.FACE_DET_SIZE
@@ -0,0 +1,78 @@
+import numpy as np
+from modules.face_store import FaceStore
+
+DIM = 8
+
+def vector(value: float) -> np.ndarray:
+    return np.full(DIM, value, dtype=np.float32)
+
+def open_store(path) -> FaceStore:
+    store = FaceStore(str(path), dim=DIM)
+    store.open()
+    return store
+
+def rows(store: FaceStore):
+    names, matrix, _ = store.load()
+    return {name: float(row[0]) for name, row in zip(names, np.asarray(matrix))}
+
+def test_rows_survive_reopen_with_deletes_and_renames(tmp_path):
+    store = open_store(tmp_path)
+    store.append("Alice", vector(1))
+    store.append_many(["Bob", "Carol"], np.stack([vector(2), vector(3)]))
+    assert store.delete("Bob") == 1
+    assert store.rename("Carol", "Caroline") == 1
+    assert rows(open_store(tmp_path)) == {"Alice": 1.0, "Caroline": 3.0}
+
+def test_compact_keeps_live_rows(tmp_path):
+    store = open_store(tmp_path)
+    store.append_many(["Alice", "Bob"], np.stack([vector(1), vector(2)]))
+    store.delete("Alice")
+    store.compact()
+    assert store.generation == 1
+    assert rows(open_store(tmp_path)) == {"Bob": 2.0}
+
+def test_open_drops_uncommitted_tail(tmp_path):
+    store = open_store(tmp_path)
+    store.append("Alice", vector(1))
+    # A writer died after its row and half a log line
+    with open(store.embeddings_path, "ab") as f:
+        f.write(vector(9).tobytes())
+    with open(store.log_path, "ab") as f:
+        f.write(b'{"op": "add", "row": 1, "na')
+    reopened = open_store(tmp_path)
+    assert rows(reopened) == {"Alice": 1.0}
+    reopened.append("Bob", vector(2))
+    assert rows(open_store(tmp_path)) == {"Alice": 1.0, "Bob": 2.0}
+
+def test_writer_skips_rows_a_dead_sibling_left_behind(tmp_path):
+    first = open_store(tmp_path)
+    second = open_store(tmp_path)
+    first.append("Alice", vector(1))
+    # Another process appended its row, then died before the log commit
+    with open(first.embeddings_path, "ab") as f:
+        f.write(vector(9).tobytes())
+    second.append("Bob", vector(2))
+    second.append("Carol", vector(3))
+    assert rows(open_store(tmp_path)) == {"Alice": 1.0, "Bob": 2.0, "Carol": 3.0}
+    assert second.embedding(2)[0] == 3.0
+
+def test_writer_skips_a_partial_log_line_a_dead_sibling_left_behind(tmp_path):
+    first = open_store(tmp_path)
+    second = open_store(tmp_path)
+    first.append("Alice", vector(1))
+    with open(first.log_path, "ab") as f:
+        f.write(b'{"op": "delete", "na')
+    second.append("Bob", vector(2))
+    assert rows(open_store(tmp_path)) == {"Alice": 1.0, "Bob": 2.0}
+
+def test_refresh_sees_other_writers(tmp_path):
+    first = open_store(tmp_path)
+    second = open_store(tmp_path)
+    first.append("Alice", vector(1))
+    reloaded, records = second.refresh()
+    assert not reloaded
+    assert [(r["op"], r["name"]) for r in records] == [("add", "Alice")]
+    first.compact()
+    reloaded, _ = second.refresh()
+    assert reloaded
+    assert rows(second) == {"Alice": 1.0}
@@ -0,0 +1,56 @@
+import numpy as np
+from modules.object_query import query_targets, direction, nearest_cell, distance_label, rank_objects
+from modules.tracking import ObjectTracker
+
+def test_query_targets_maps_words_to_coco_classes():
+    assert query_targets("where is my phone") == ["cell phone"]
+    assert query_targets("find the cell phone") == ["cell phone"]
+    assert query_targets("any chairs or a sofa?") == ["chair", "couch"]
+    assert query_targets("is there a hot dog") == ["hot dog"]
+    assert query_targets("what is around me") is None
+    assert query_targets(None) is None
+
+def test_direction_splits_the_frame_in_thirds():
+    assert direction(10, 300) == "left"
+    assert direction(150, 300) == "ahead"
+    assert direction(290, 300) == "right"
+    assert direction(5, 0) == "ahead"
+
+def test_nearest_cell_compares_the_closest_cell_to_the_median():
+    grid = np.ones((3, 3), dtype=np.float32)
+    grid[2, 0] = 3.0
+    nearest = nearest_cell(grid, close_ratio=2.0)
+    assert (nearest["direction"], nearest["height"]) == ("left", "low")
+    assert nearest["closeness"] == 3.0 and nearest["close"]
+    assert not nearest_cell(np.ones((3, 3)))["close"]
+
+def test_distance_label_is_relative():
+    assert distance_label(2.5) == "very close"
+    assert distance_label(1.5) == "nearby"
+    assert distance_label(1.0) == "farther away"
+    assert distance_label(1.5, very_close=1.4) == "very close"
+
+def test_rank_objects_puts_confident_nearest_first():
+    objects = [
+        {"name": "cup", "confidence": 0.9, "depth": 0.2},
+        {"name": "chair", "confidence": 0.6, "depth": 0.8},
+        {"name": "dog", "confidence": 0.4, "depth": 0.9},
+        {"name": "book", "confidence": 0.45, "depth": 0.1},
+    ]
+    assert [obj["name"] for obj in rank_objects(objects)] == ["chair", "cup", "dog", "book"]
+
+def test_tracker_reports_objects_coming_closer():
+    tracker = ObjectTracker()
+    chair = {"name": "chair", "confidence": 0.9, "box": [10, 10, 50, 50], "depth": 0.4, "closeness": 1.0}
+    assert [obj["track_id"] for obj in tracker.update([chair])["new"]] == [1]
+    assert tracker.update([dict(chair, closeness=1.05)]) == {}
+    closer = tracker.update([dict(chair, closeness=1.3)])
+    assert [obj["track_id"] for obj in closer["closer"]] == [1]
+
+def test_tracker_ignores_a_change_of_depth_scale():
+    # MiDaS may double every depth of the next frame; relative to the frame's
+    # median nothing moved
+    tracker = ObjectTracker()
+    chair = {"name": "chair", "confidence": 0.9, "box": [10, 10, 50, 50], "depth": 0.4, "closeness": 1.6}
+    tracker.update([chair])
+    assert tracker.update([dict(chair, depth=0.8)]) == {}
@@ -0,0 +1,65 @@
+import sys
+import types
+import numpy as np
+import pytest
+
+class FakeEngine:
+    """Finds one line of text in the middle of whatever image it is given."""
+
+    def __init__(self):
+        self.shapes = []
+
+    def __call__(self, image, use_cls=True, use_rec=True):
+        self.shapes.append(image.shape[:2])
+        h, w = image.shape[:2]
+        box = [[w * 0.25, h * 0.5], [w * 0.75, h * 0.5], [w * 0.75, h * 0.75], [w * 0.25, h * 0.75]]
+        if not use_rec:
+            return [box], None
+        return [[box, "EXIT", 0.9]], None
+
+@pytest.fixture
+def ocr(monkeypatch):
+    """modules.ocr imported against a stand-in for the rapidocr_onnxruntime package."""
+    rapidocr = types.ModuleType("rapidocr_onnxruntime")
+    rapidocr.RapidOCR = None
+    rapidocr.__file__ = "/nonexistent/rapidocr_onnxruntime/__init__.py"
+    monkeypatch.setitem(sys.modules, "rapidocr_onnxruntime", rapidocr)
+    # Imported afresh here and dropped again afterwards
+    monkeypatch.setitem(sys.modules, "modules.ocr", None)
+    del sys.modules["modules.ocr"]
+    import modules.ocr
+    return modules.ocr
+
+@pytest.fixture
+def reader(ocr):
+    reader = ocr.OCRReader()
+    reader.ocr_engine, reader.fast_engine = FakeEngine(), FakeEngine()
+    reader.is_initialized = True
+    return reader
+
+def test_crop_roi_clamps_to_the_image(ocr):
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+    crop, offset = ocr.crop_roi(image, [-20, 10.5, 250, 60.2])
+    assert crop.shape[:2] == (51, 200) and offset == (0, 10)
+    crop, offset = ocr.crop_roi(image, [150, 80, 120, 300])
+    assert crop.size == 0 and offset == (150, 80)
+
+def test_roi_boxes_come_back_in_full_image_coordinates(reader):
+    image = np.zeros((1000, 2000, 3), dtype=np.uint8)
+    [result] = reader.read(image, roi=[400, 200, 800, 600])
+    assert reader.ocr_engine.shapes == [(400, 400)]
+    assert np.allclose(result["box"], [[500, 400], [700, 400], [700, 500], [500, 500]])
+
+def test_fast_mode_maps_downscaled_boxes_back(reader, ocr):
+    image = np.zeros((1000, 2000, 3), dtype=np.uint8)
+    [result] = reader.read(image, mode="fast", roi=[0, 100, 2000, 1100])
+    # Gate thumbnail, then the downscaled crop
+    assert reader.fast_engine.shapes == [(ocr.OCR_FAST_GATE_SIDE * 900 // 2000, ocr.OCR_FAST_GATE_SIDE),
+                                         (432, ocr.OCR_FAST_MAX_SIDE)]
+    assert np.allclose(result["box"], [[500, 550], [1500, 550], [1500, 775], [500, 775]], atol=2)
+
+def test_empty_or_outside_roi_reads_nothing(reader):
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+    assert reader.read(image, roi=[50, 50, 40, 90]) == []
+    assert reader.read(image, roi=[300, 0, 400, 100]) == []
+    assert reader.ocr_engine.shapes == []
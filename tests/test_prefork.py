@@ -0,0 +1,57 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import numpy as np
+import cv2
+import httpx
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Serves the app on forked workers with stub services: "object" is loaded
+# before the fork and shared, "ocr" is loaded by each worker after it
+SERVER = """
+import sys
+import main
+from benchmarks.stubs import STUB_SERVICE_CLASSES
+from modules.registry import ServiceRegistry
+from start_server import serve_prefork
+main.services = ServiceRegistry(["object", "ocr"], service_classes=STUB_SERVICE_CLASSES)
+serve_prefork(main.app, main.services, "127.0.0.1", int(sys.argv[1]), 2, after_fork=["ocr"])
+"""
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork()")
+def test_forked_workers_answer_requests():
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-c", SERVER, str(port)], cwd=ROOT,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    jpg = cv2.imencode(".jpg", np.zeros((64, 64, 3), dtype=np.uint8))[1].tobytes()
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if httpx.get(f"{url}/ready", timeout=1).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            assert server.poll() is None and time.monotonic() < deadline, server.stdout.read().decode()
+            time.sleep(0.1)
+        for task in ("find_object", "read_text", "find_object", "read_text"):
+            response = httpx.post(f"{url}/process_upload", params={"task": task}, content=jpg, timeout=10)
+            assert response.status_code == 200, response.text
+            assert response.json()["result_text"]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
@@ -0,0 +1,66 @@
+import pytest
+from modules.qos import QoSController
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("modules.qos.time.monotonic", lambda: now[0])
+    return now
+
+def controller(pressure=None, **kwargs):
+    levels = pressure if pressure is not None else {"find_object": 0.0}
+    settings = dict(window_seconds=30, min_samples=5, queue_high=0.5, recover_ratio=0.6, min_dwell_seconds=10)
+    settings.update(kwargs)
+    return QoSController({"find_object": 500}, pressure=lambda task: levels[task], **settings)
+
+def observe(qos, tier, seconds, count=5):
+    for _ in range(count):
+        qos.observe("find_object", tier, seconds)
+
+def test_slow_requests_move_the_task_to_fast_and_recovery_moves_it_back(clock):
+    qos = controller()
+    assert qos.resolve("find_object") == "accurate"
+    observe(qos, "accurate", 0.8)
+    assert qos.resolve("find_object") == "fast"
+    # Fast and quick, but the tier holds for min_dwell_seconds
+    observe(qos, "fast", 0.1)
+    clock[0] += 5
+    assert qos.resolve("find_object") == "fast"
+    clock[0] += 6
+    assert qos.resolve("find_object") == "accurate"
+    assert qos.stats()["find_object"]["switches"] == 2
+
+def test_no_recovery_while_fast_latency_is_near_the_target(clock):
+    qos = controller()
+    observe(qos, "accurate", 0.8)
+    assert qos.resolve("find_object") == "fast"
+    clock[0] += 11
+    observe(qos, "fast", 0.4)
+    assert qos.resolve("find_object") == "fast"
+
+def test_too_few_samples_do_not_trigger_a_switch(clock):
+    qos = controller()
+    observe(qos, "accurate", 2.0, count=4)
+    assert qos.resolve("find_object") == "accurate"
+
+def test_old_samples_leave_the_window(clock):
+    qos = controller()
+    observe(qos, "accurate", 0.8)
+    clock[0] += 31
+    assert qos.resolve("find_object") == "accurate"
+
+def test_a_filling_queue_switches_and_blocks_recovery(clock):
+    pressure = {"find_object": 0.75}
+    qos = controller(pressure)
+    assert qos.resolve("find_object") == "fast"
+    clock[0] += 11
+    assert qos.resolve("find_object") == "fast"
+    pressure["find_object"] = 0.0
+    # Traffic died down: too few recent samples to measure counts as recovered
+    assert qos.resolve("find_object") == "accurate"
+
+def test_explicit_mode_and_untracked_tasks(clock):
+    qos = controller({"find_object": 1.0})
+    assert qos.resolve("find_object", "accurate") == "accurate"
+    assert qos.resolve("read_text") == "accurate"
+    assert controller({"find_object": 1.0}, enabled=False).resolve("find_object") == "accurate"
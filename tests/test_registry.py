@@ -0,0 +1,70 @@
+import pytest
+from modules.registry import ServiceRegistry, ServiceUnavailableError
+
+MB = 2**20
+
+class FakeService:
+    size_mb = 60
+
+    def __init__(self):
+        self.is_initialized = False
+
+    def load_model(self):
+        self.is_initialized = True
+
+    def memory_footprint(self):
+        return {"weights": self.size_mb * MB}
+
+class BrokenService(FakeService):
+    def load_model(self):
+        raise RuntimeError("no weights")
+
+CLASSES = {name: "test_registry:FakeService" for name in ("a", "b", "c")}
+
+def registry(**kwargs):
+    return ServiceRegistry(list(CLASSES), service_classes=CLASSES, **kwargs)
+
+def test_least_recently_used_idle_service_is_evicted():
+    services = registry(memory_budget_mb=100)
+    with services.use("a"):
+        pass
+    with services.use("b"):
+        pass
+    status = services.status()
+    assert status["a"]["state"] == "evicted" and status["a"]["evictions"] == 1
+    assert status["b"]["state"] == "ready" and status["b"]["memory_mb"] == 60
+    # An evicted service loads again on its next request
+    with services.use("a") as service:
+        assert service.is_initialized
+    assert services.memory_stats()["evictions"] == 2
+
+def test_pinned_and_busy_services_are_not_evicted():
+    services = registry(memory_budget_mb=100, pinned=["a"])
+    with services.use("a"):
+        pass
+    with services.use("b"):
+        with services.use("c"):
+            pass
+        assert services.status()["b"]["state"] == "ready"
+    assert services.status()["a"]["state"] == "ready"
+
+def test_eager_loading_defers_what_does_not_fit(monkeypatch):
+    monkeypatch.setattr(FakeService, "size_mb", 50)
+    services = registry(memory_budget_mb=100)
+    for thread in services.load_all():
+        thread.join()
+    status = services.status()
+    assert [status[name]["state"] for name in ("a", "b", "c")] == ["ready", "ready", "deferred"]
+    assert services.memory_stats()["evictions"] == 0
+    assert services.ready()
+    # A deferred service loads on its first request
+    assert services.get("c").is_initialized
+
+def test_failed_and_disabled_services_are_unavailable():
+    services = ServiceRegistry(["a"], service_classes={"a": "test_registry:BrokenService",
+                                                       "b": "test_registry:FakeService"})
+    with pytest.raises(ServiceUnavailableError, match="failed to load"):
+        services.get("a")
+    with pytest.raises(ServiceUnavailableError, match="disabled"):
+        services.get("b")
+    assert not services.ready()
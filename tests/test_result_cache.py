@@ -0,0 +1,69 @@
+import numpy as np
+from modules.frame import Frame
+from modules.result_cache import ResultCache, dhash, hash_distance
+
+def frame(value: int = 0) -> Frame:
+    return Frame(np.full((32, 32, 3), value, dtype=np.uint8))
+
+def test_hit_after_put_and_miss_for_other_query():
+    cache = ResultCache()
+    key = cache.key("read_text", "  Sign ", frame())
+    cache.put(key, {"result_text": "EXIT"})
+    assert cache.get(cache.key("read_text", "sign", frame())) == {"result_text": "EXIT"}
+    assert cache.get(cache.key("read_text", "menu", frame())) is None
+    assert cache.stats()["hits"] == {"read_text": 1}
+
+def test_variant_keeps_results_apart():
+    cache = ResultCache()
+    cache.put(cache.key("find_object", None, frame(), "fast"), {"result_text": "fast"})
+    assert cache.get(cache.key("find_object", None, frame(), "accurate")) is None
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("modules.result_cache.time.monotonic", lambda: now[0])
+    cache = ResultCache(ttl_seconds=30)
+    key = cache.key("read_text", None, frame())
+    cache.put(key, {"result_text": "EXIT"})
+    now[0] += 29
+    assert cache.get(key) is not None
+    now[0] += 2
+    assert cache.get(key) is None
+    assert cache.stats()["entries"] == 0
+
+def test_lru_eviction_by_count():
+    cache = ResultCache(max_entries=2)
+    keys = [cache.key("read_text", None, frame(value)) for value in (1, 2, 3)]
+    cache.put(keys[0], "a")
+    cache.put(keys[1], "b")
+    cache.get(keys[0])
+    cache.put(keys[2], "c")
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == "a"
+    assert cache.stats()["evictions"] == 1
+
+def test_invalidate_drops_entries_and_results_computed_across_it():
+    cache = ResultCache()
+    key = cache.key("recognize_face", None, frame())
+    cache.put(key, "Alice")
+    generation = cache.generation("recognize_face")
+    assert cache.invalidate("recognize_face") == 1
+    assert cache.get(key) is None
+    # A result computed before the invalidation finished after it
+    cache.put(key, "Alice", generation)
+    assert cache.get(key) is None
+    cache.put(key, "Bob", cache.generation("recognize_face"))
+    assert cache.get(key) == "Bob"
+
+def test_dhash_matches_near_identical_frames():
+    image = np.tile(np.arange(64, dtype=np.uint8) * 4, (64, 1))[:, :, None].repeat(3, axis=2)
+    noisy = np.clip(image.astype(np.int16) + 1, 0, 255).astype(np.uint8)
+    assert hash_distance(dhash(Frame(image)), dhash(Frame(noisy))) <= 4
+
+def test_face_boxes_separate_cache_variants_before_the_face_service_loads():
+    import main
+    full = main.ProcessRequest(task="recognize_face")
+    boxed = main.ProcessRequest(task="recognize_face", face_boxes=[[1, 2, 30, 40]])
+    other = main.ProcessRequest(task="recognize_face", face_boxes=[[5, 2, 30, 40]])
+    assert main.services.peek("face") is None
+    variants = {main.cache_variant(request) for request in (full, boxed, other)}
+    assert len(variants) == 3
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+import pytest
+from modules.scheduler import InferenceScheduler, QueueFullError
+
+def test_calls_beyond_workers_plus_queue_are_rejected():
+    scheduler = InferenceScheduler({"face": {"workers": 1, "queue_depth": 1}}, retry_after=7)
+    release = threading.Event()
+
+    async def main():
+        calls = [asyncio.ensure_future(scheduler.run("face", release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert scheduler.pools["face"].pressure() == 1.0
+        with pytest.raises(QueueFullError) as error:
+            await scheduler.run("face", release.wait)
+        assert error.value.retry_after == 7
+        release.set()
+        return await asyncio.gather(*calls)
+
+    try:
+        assert asyncio.run(main()) == [True, True]
+    finally:
+        release.set()
+        scheduler.shutdown()
+    stats = scheduler.stats()["face"]
+    assert (stats["completed"], stats["rejected"], stats["waiting"]) == (2, 1, 0)
+
+def test_pools_run_independently():
+    scheduler = InferenceScheduler({"face": {"workers": 1, "queue_depth": 0}, "ocr": {"workers": 1, "queue_depth": 0}})
+    release = threading.Event()
+
+    async def main():
+        busy = asyncio.ensure_future(scheduler.run("face", release.wait))
+        await asyncio.sleep(0.05)
+        # A full face pool does not hold up OCR
+        assert await scheduler.run("ocr", lambda: "text") == "text"
+        release.set()
+        return await busy
+
+    try:
+        assert asyncio.run(main())
+    finally:
+        release.set()
+        scheduler.shutdown()
@@ -0,0 +1,52 @@
+import gzip
+import json
+import numpy as np
+import pytest
+from modules import wire
+
+def test_negotiate_format():
+    assert wire.negotiate_format(None) == "json"
+    assert wire.negotiate_format("compact") == "compact"
+    assert wire.negotiate_format(None, "application/json, application/x-msgpack") == "msgpack"
+    with pytest.raises(ValueError):
+        wire.negotiate_format("xml")
+
+def test_quantize_rounds_numbers_and_boxes():
+    data = {"confidence": 0.91234, "box": [10.4, 20.6, 30.5, 40000.0], "name": "chair", "count": 3,
+            "objects": [{"box": [1.2, 2.7, 3.0, 4.0]}]}
+    assert wire.quantize(data) == {"confidence": 0.912, "box": [10, 21, 30, 32767], "name": "chair", "count": 3,
+                                   "objects": [{"box": [1, 3, 3, 4]}]}
+
+def test_quantize_packs_boxes_as_little_endian_int16():
+    packed = wire.quantize({"box": [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0], [7.0, 8.0]]}, pack_boxes=True)["box"]
+    assert np.frombuffer(packed, dtype="<i2").tolist() == [1, 2, 3, 4, 5, 6, 7, 8]
+    assert wire.quantize({"box": []}, pack_boxes=True) == {"box": []}
+
+def test_encode_json_and_compact():
+    data = {"result_text": "café", "structured_data": {"box": [1.4, 2.6, 3.0, 4.0], "score": 0.123456}}
+    body, media_type = wire.encode(data, "json")
+    assert media_type == "application/json"
+    assert json.loads(body) == data
+    assert "café".encode() in body
+    body, _ = wire.encode(data, "compact")
+    assert json.loads(body)["structured_data"] == {"box": [1, 3, 3, 4], "score": 0.123}
+
+def test_encode_msgpack():
+    if wire.msgpack is None:
+        with pytest.raises(RuntimeError):
+            wire.encode({}, "msgpack")
+        pytest.skip("msgpack is not installed")
+    body, media_type = wire.encode({"box": [1.0, 2.0, 3.0, 4.0], "score": 0.5}, "msgpack")
+    assert media_type == "application/msgpack"
+    decoded = wire.msgpack.unpackb(body, raw=False)
+    assert np.frombuffer(decoded["box"], dtype="<i2").tolist() == [1, 2, 3, 4]
+    assert decoded["score"] == 0.5
+
+def test_compress(monkeypatch):
+    monkeypatch.setattr(wire, "brotli", None)
+    body = b"x" * 1024
+    compressed, encoding = wire.compress(body, "gzip, deflate")
+    assert encoding == "gzip" and gzip.decompress(compressed) == body
+    assert wire.compress(body, "gzip;q=0, deflate") == (body, None)
+    assert wire.compress(b"short", "gzip") == (b"short", None)
+    assert wire.compress(body, "") == (body, None)